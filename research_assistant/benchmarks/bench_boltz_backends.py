@@ -0,0 +1,76 @@
+"""
+Measure the per-job latency of the "subprocess" and "worker" Boltz backends with a stub model on CPU.
+
+    python benchmarks/bench_boltz_backends.py --jobs 10 --load-seconds 2 --predict-seconds 0.1
+
+The subprocess backend runs benchmarks/fake_boltz.py, which pays interpreter startup and the emulated model
+load on every job. The worker backend loads the same stub model once.
+"""
+import os, time, argparse, tempfile, statistics
+
+from research_assistant.tools.helpers import write_sequences_to_yaml
+from research_assistant.tools.boltz_batch import run_boltz, collect_boltz_predictions
+from research_assistant.tools.boltz_worker import BoltzWorkerClient
+
+
+def _time_jobs(run, inputs, result_dir):
+    latencies = []
+    for fp in inputs:
+        start = time.perf_counter()
+        run(fp, result_dir)
+        latencies.append(time.perf_counter() - start)
+        name = os.path.splitext(os.path.basename(fp))[0]
+        assert collect_boltz_predictions(result_dir, fp, [name])[name]['success']
+    return latencies
+
+
+def _summary(name, latencies):
+    print(f"{name:<22} mean {statistics.mean(latencies):6.3f}s  p50 {statistics.median(latencies):6.3f}s  max {max(latencies):6.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    parser.add_argument("--predict-seconds", type=float, default=0.1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_boltz_")
+    inputs = []
+    for i in range(args.jobs):
+        fp = os.path.join(workdir, "input", f"structure{i}.yaml")
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        write_sequences_to_yaml(["MKWVTFISLLLLFSSAYS", "VQLVQSGVEVKKPGAS"], fp)
+        inputs.append(fp)
+
+    os.environ["FAKE_BOLTZ_LOAD_SECONDS"] = str(args.load_seconds)
+    os.environ["FAKE_BOLTZ_PREDICT_SECONDS"] = str(args.predict_seconds)
+    fake_boltz = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_boltz.py")
+    subprocess_latencies = _time_jobs(
+        lambda fp, out: run_boltz(fp, out, backend="subprocess", executable=fake_boltz),
+        inputs, os.path.join(workdir, "subprocess"))
+
+    client = BoltzWorkerClient(
+        address=os.path.join(workdir, "worker.sock"),
+        runner="stub",
+        max_jobs=args.jobs + 1,
+        runner_kwargs={'load_seconds': args.load_seconds, 'predict_seconds': args.predict_seconds},
+    )
+    start = time.perf_counter()
+    client.ensure_started()
+    startup = time.perf_counter() - start
+    try:
+        worker_latencies = _time_jobs(client.predict, inputs, os.path.join(workdir, "worker"))
+    finally:
+        client.drain()
+
+    print(f"{args.jobs} jobs, stub model load {args.load_seconds}s, prediction {args.predict_seconds}s")
+    _summary("subprocess", subprocess_latencies)
+    print(f"{'worker startup':<22} {startup:6.3f}s (once)")
+    _summary("worker (warm)", worker_latencies)
+    gap = statistics.mean(subprocess_latencies) - statistics.mean(worker_latencies)
+    print(f"worker saves {gap:.3f}s per job ({statistics.mean(subprocess_latencies) / statistics.mean(worker_latencies):.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
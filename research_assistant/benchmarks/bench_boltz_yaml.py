@@ -0,0 +1,70 @@
+"""
+Generation of Boltz input files: the previous writer (one entity per chain, yaml.dump with IndentDumper) against
+write_sequences_to_yaml (entities of identical chains, templated serializer), for structures of 1 to 8 chains,
+half of them homomers.
+
+    python benchmarks/bench_boltz_yaml.py --files 20000
+
+Rendering and writing (render + atomic write of each file) are timed separately.
+"""
+import os, time, shutil, argparse, tempfile
+
+import numpy as np
+import yaml
+
+from research_assistant.tools.helpers import IndentDumper, chain_id, boltz_entities, render_boltz_yaml
+from research_assistant.tools.workspace import atomic_write_text
+
+
+AMINO_ACIDS = np.array(list("ARNDCEQGHILKMFPSTWYV"))
+
+
+def _structures(n, rng):
+    structures = []
+    for _ in range(n):
+        chains = int(rng.integers(1, 9))
+        unique = 1 if rng.random() < 0.5 else chains
+        sequences = ["".join(rng.choice(AMINO_ACIDS, size=int(rng.integers(50, 400)))) for _ in range(unique)]
+        structures.append([sequences[i % unique] for i in range(chains)])
+    return structures
+
+
+def render_yaml_dump(sequences):
+    # the previous writer, with valid chain IDs
+    data = {'version': 1, 'sequences': [{'protein': {'id': chain_id(i), 'sequence': seq}} for i, seq in enumerate(sequences)]}
+    return yaml.dump(data, Dumper=IndentDumper, default_flow_style=False, sort_keys=False, indent=2)
+
+
+def render_template(sequences):
+    return render_boltz_yaml(boltz_entities(sequences))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000)
+    args = parser.parse_args()
+
+    structures = _structures(args.files, np.random.default_rng(0))
+    workdir = tempfile.mkdtemp(prefix="bench_boltz_yaml_")
+    print(f"{'writer':>10} {'render files/s':>15} {'write files/s':>14} {'entities':>9} {'MB':>6}")
+    try:
+        for writer, render in (("yaml.dump", render_yaml_dump), ("template", render_template)):
+            start = time.perf_counter()
+            documents = [render(sequences) for sequences in structures]
+            render_seconds = time.perf_counter() - start
+
+            directory = os.path.join(workdir, writer)
+            start = time.perf_counter()
+            for i, sequences in enumerate(structures):
+                atomic_write_text(os.path.join(directory, f"protein{i}.yaml"), render(sequences))
+            write_seconds = time.perf_counter() - start
+
+            entities = sum(document.count("  - protein:") for document in documents)
+            size = sum(len(document) for document in documents) / 1e6
+            print(f"{writer:>10} {len(structures) / render_seconds:>15.0f} {len(structures) / write_seconds:>14.0f} {entities:>9d} {size:>6.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Memory high-water mark and disk footprint of the ESMFold outputs, against the stub ESMFold endpoint:
+ESMFoldPlayground.predict (whole response in memory, plain PDB) versus predict_to_file (streamed) for each output format.
+
+    python benchmarks/bench_esmfold_storage.py --length 9999 --repeat 3
+
+The stub endpoint returns one CA atom per residue, so --length is also the number of atoms of the structure
+(at most 9999, the largest residue number of a PDB).
+The high-water mark is the peak of the memory allocated by Python during the call, measured with tracemalloc.
+The stub endpoint runs in another process, so that only the client is measured.
+"""
+import os, time, shutil, argparse, tempfile, tracemalloc, multiprocessing
+
+import numpy as np
+import requests
+
+from research_assistant.tools.esmfold_tool import ESMFoldPlayground
+from research_assistant.tools.stubs import start_stub_esmfold_server
+
+
+def _serve(port):
+    start_stub_esmfold_server(delay=0, port=port)
+    while True:
+        time.sleep(3600)
+
+
+def _measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--length", type=int, default=9999, help="residues of the sequence")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.setdefault("TRACE_FILE", "")
+    sequence = "".join(np.random.default_rng(0).choice(list("ARNDCEQGHILKMFPSTWYV"), size=args.length))
+    # the server is started in this process first to get a free port, then moved to a child process
+    probe, _ = start_stub_esmfold_server()
+    port = probe.server_address[1]
+    probe.shutdown()
+    probe.server_close()
+    server = multiprocessing.Process(target=_serve, args=(port,), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port}/esmfold"
+    for _ in range(100):
+        try:
+            requests.get(url, timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    workdir = tempfile.mkdtemp(prefix="bench_esmfold_storage_")
+    playground = ESMFoldPlayground(NGC_API_KEY="x", query_url=url)
+
+    formats = [".pdb", ".pdb.gz", ".coords.npy"]
+    try:
+        import zstandard
+        formats.insert(2, ".pdb.zst")
+    except ImportError:
+        print("zstandard is not installed, skipping .pdb.zst")
+
+    rows = []
+    try:
+        for name, suffix, fn in [("predict (in memory)", ".pdb", lambda path: playground.predict(sequence, output_dir=os.path.dirname(path), output_file_name=os.path.basename(path)))] + [
+            (f"predict_to_file {suffix}", suffix, lambda path: playground.predict_to_file(sequence, path)) for suffix in formats
+        ]:
+            peaks, times = [], []
+            for i in range(args.repeat):
+                path = os.path.join(workdir, f"{len(rows)}_{i}{suffix}")
+                result, seconds, peak = _measure(lambda: fn(path))
+                # the old path returns the response: it stays alive as long as the caller keeps it
+                del result
+                peaks.append(peak)
+                times.append(seconds)
+            rows.append((name, min(times), min(peaks), os.path.getsize(path)))
+    finally:
+        server.terminate()
+        shutil.rmtree(workdir)
+
+    print(f"{args.length} residues")
+    print(f"{'path':<28} {'seconds':>8} {'peak MB':>8} {'disk MB':>8} {'disk vs .pdb':>12}")
+    for name, seconds, peak, size in rows:
+        print(f"{name:<28} {seconds:8.3f} {peak / 1e6:8.2f} {size / 1e6:8.2f} {size / rows[0][3]:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
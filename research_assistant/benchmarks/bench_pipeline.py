@@ -0,0 +1,315 @@
+"""
+Offline benchmark of the pipeline: the tool functions and the real ResearchAssistant crew, on synthetic
+sequences, against local stand-ins of the NVIDIA endpoints and of the GPU:
+- a stub ESMFold endpoint with configurable latency, jitter and error rate (tools/stubs.py)
+- the fake `boltz` executable (subprocess backend) and the stub Boltz worker (worker backend), which write
+  the output tree of Boltz with synthetic structures, confidence files and MSAs
+- a scripted LLM playing the agents (tools/stubs.ScriptedLLM), with a configurable latency per turn
+
+    python benchmarks/bench_pipeline.py                    # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --save-baseline    # run and store the results as the new baseline
+
+Scenarios:
+- esmfold: predict_with_esmfold, `--concurrency` calls at a time
+- boltz_subprocess, boltz_worker: predict_with_boltz with each backend, one job at a time, as the Boltz tool runs them
+- crew: jobs of the real crew, run by the job server with `--workers` workers
+- crew_replay: the crew jobs again, with the LLM responses of a first run in the LLM response cache
+- batch: run_batch on a FASTA file
+
+For each scenario the throughput, the p50/p95/p99 latency and the failures are reported. A scenario regresses
+when its throughput drops, or its p95/p99 latency grows, by more than `--tolerance` relative to the baseline,
+or when it has more failures. The exit code is 1 when a scenario regresses, and 2 when the baseline was run with
+other parameters: its numbers are not comparable, nothing is compared.
+"""
+import os, io, sys, json, time, random, argparse, tempfile, platform, contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_BOLTZ = os.path.join(BENCHMARKS_DIR, "fake_boltz.py")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+RESIDUES = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+
+
+def synthetic_structures(n, length, complex_fraction, seed):
+    """
+    Random structures: single chains, and heterodimers for a fraction of them
+    return: list of (name, list of chain sequences)
+    """
+    rng = np.random.default_rng(seed)
+    structures = []
+    for i in range(n):
+        n_chains = 2 if rng.random() < complex_fraction else 1
+        lengths = rng.integers(length // 2, length * 3 // 2, size=n_chains)
+        structures.append((f"structure{i}", [rng.choice(RESIDUES, size=l).tobytes().decode() for l in lengths]))
+    return structures
+
+
+def _summary(latencies, failures, seconds, jobs):
+    latencies = np.array(latencies, dtype=float)
+    percentile = lambda q: float(np.percentile(latencies, q)) if len(latencies) else None
+    return {
+        'jobs': jobs,
+        'failures': failures,
+        'seconds': seconds,
+        'throughput': jobs / seconds if seconds else 0.0,
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'p99': percentile(99),
+    }
+
+
+@contextlib.contextmanager
+def _env(**variables):
+    saved = {name: os.environ.get(name) for name in variables}
+    os.environ.update({name: str(value) for name, value in variables.items()})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def bench_esmfold(structures, args, stub):
+    from research_assistant.tools.esmfold_tool import predict_with_esmfold
+
+    def _call(structure):
+        name, sequences = structure
+        start = time.perf_counter()
+        result = predict_with_esmfold(sequences[0], output_dir=os.path.join("output", "esmfold"), output_file_name=f"{name}.pdb",
+                                      delete_old_dir=False, query_url=stub['esmfold_url'])
+        return time.perf_counter() - start, result['success']
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        calls = list(pool.map(_call, structures))
+    return _summary([c[0] for c in calls], sum(not c[1] for c in calls), time.perf_counter() - start, len(structures))
+
+
+def _bench_boltz(structures, backend):
+    from research_assistant.tools.boltz_tool import predict_with_boltz
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for name, sequences in structures:
+        job_start = time.perf_counter()
+        result = predict_with_boltz(sequences, yaml_dir=os.path.join("input", backend), yaml_file_name=f"{name}.yaml",
+                                    result_dir=os.path.join("output", backend, name), backend=backend)
+        latencies.append(time.perf_counter() - job_start)
+        failures += not result['success']
+    return _summary(latencies, failures, time.perf_counter() - start, len(structures))
+
+
+def bench_boltz_subprocess(structures, args, stub):
+    with _env(MSA_CACHE_DIR=os.path.abspath("msa_subprocess")):
+        return _bench_boltz(structures, "subprocess")
+
+
+def bench_boltz_worker(structures, args, stub):
+    from research_assistant.tools.boltz_worker import get_boltz_worker
+    # the worker is started once per process: its startup is reported apart from the jobs
+    start = time.perf_counter()
+    get_boltz_worker().ensure_started()
+    startup = time.perf_counter() - start
+    with _env(MSA_CACHE_DIR=os.path.abspath("msa_worker")):
+        result = _bench_boltz(structures, "worker")
+    result['startup'] = startup
+    return result
+
+
+def _run_crew_jobs(messages, args):
+    from research_assistant.server import CrewPool, JobServer
+    from research_assistant.tools.stubs import ScriptedLLM
+    from research_assistant.tools.tracing import get_tracer
+
+    get_tracer().reset()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = JobServer(workers=args.workers, max_queued=len(messages), max_queued_per_tenant=len(messages),
+                           pool=CrewPool(llm=ScriptedLLM(latency=args.llm_latency)))
+        start = time.perf_counter()
+        try:
+            job_ids = [server.submit(f"tenant{i % 3}", message) for i, message in enumerate(messages)]
+            failures = 0
+            for job_id in job_ids:
+                try:
+                    server.result(job_id)
+                except RuntimeError:
+                    failures += 1
+            seconds = time.perf_counter() - start
+        finally:
+            server.shutdown()
+    latencies = [server.status(job_id)['finished_at'] - server.status(job_id)['submitted_at'] for job_id in job_ids]
+    result = _summary(latencies, failures, seconds, len(messages))
+    stages = get_tracer().stats()['stages']
+    result['stages_p95'] = {name: stage['p95'] for name, stage in stages.items()}
+    return result
+
+
+def _crew_messages(structures):
+    return ["".join(f">{name} chain {chr(65 + i)}\n{seq}\n" for i, seq in enumerate(sequences)) for name, sequences in structures]
+
+
+def bench_crew(structures, args, stub):
+    with _env(BOLTZ_BACKEND="worker", MSA_CACHE_DIR=os.path.abspath("msa_crew")):
+        return _run_crew_jobs(_crew_messages(structures), args)
+
+
+def bench_crew_replay(structures, args, stub):
+    # the jobs are run twice with the LLM response cache: the second run, which is reported, replays the LLM turns
+    with _env(BOLTZ_BACKEND="worker", MSA_CACHE_DIR=os.path.abspath("msa_crew_replay"), LLM_CACHE_DIR=os.path.abspath("llm_cache")):
+        _run_crew_jobs(_crew_messages(structures), args)
+        return _run_crew_jobs(_crew_messages(structures), args)
+
+
+def bench_batch(structures, args, stub):
+    from research_assistant.tools.batch import run_batch
+    path = os.path.abspath("batch.fasta")
+    with open(path, "w") as f:
+        for name, sequences in structures:
+            f.write(f">{name}\n{':'.join(sequences)}\n")
+    with _env(BOLTZ_BACKEND="worker"):
+        report = run_batch(path, output_dir="output/batch", esmfold_concurrency=args.concurrency, boltz_batch_size=8,
+                           use_msa_server=False, esmfold_url=stub['esmfold_url'], report_every=3600)
+    # records are folded concurrently by the two backends, there is no per-record latency
+    return _summary([], report['failed'], report['seconds'], report['records'])
+
+
+SCENARIOS = {
+    'esmfold': bench_esmfold,
+    'boltz_subprocess': bench_boltz_subprocess,
+    'boltz_worker': bench_boltz_worker,
+    'crew': bench_crew,
+    'crew_replay': bench_crew_replay,
+    'batch': bench_batch,
+}
+
+
+def compare(results, baseline, tolerance):
+    """
+    return: list[str], the regressions of the results relative to the baseline
+    """
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get('results', {}).get(scenario)
+        if base is None:
+            continue
+        if base['throughput'] and result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {result['throughput']:.2f}/s < baseline {base['throughput']:.2f}/s")
+        for q in ("p95", "p99"):
+            if base.get(q) and result.get(q) is not None and result[q] > base[q] * (1 + tolerance):
+                regressions.append(f"{scenario}: {q} {result[q]:.3f}s > baseline {base[q]:.3f}s")
+        if result['failures'] > base['failures']:
+            regressions.append(f"{scenario}: {result['failures']} failures > baseline {base['failures']}")
+    return regressions
+
+
+def _format(value, unit=""):
+    return f"{value:8.3f}{unit}" if value is not None else f"{'-':>8}{' ' * len(unit)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--jobs", type=int, default=24, help="structures per scenario")
+    parser.add_argument("--length", type=int, default=300, help="mean chain length")
+    parser.add_argument("--complex-fraction", type=float, default=0.25)
+    parser.add_argument("--concurrency", type=int, default=8, help="ESMFold calls in flight")
+    parser.add_argument("--workers", type=int, default=4, help="workers of the job server")
+    parser.add_argument("--esmfold-latency", type=float, default=0.2)
+    parser.add_argument("--esmfold-jitter", type=float, default=0.1)
+    parser.add_argument("--esmfold-error-rate", type=float, default=0.02)
+    parser.add_argument("--boltz-load-seconds", type=float, default=1.0)
+    parser.add_argument("--boltz-predict-seconds", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per LLM turn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change of throughput or tail latency that is a regression")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    from research_assistant.tools.stubs import start_stub_esmfold_server
+    from research_assistant.tools.boltz_worker import get_boltz_worker
+    from research_assistant.tools.esmfold_tool import get_esmfold_scheduler
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    params = {name: value for name, value in vars(args).items() if name not in ("scenarios", "baseline", "save_baseline", "tolerance", "output")}
+    structures = synthetic_structures(args.jobs, args.length, args.complex_fraction, args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.chdir(workdir)
+    esmfold, esmfold_url = start_stub_esmfold_server(delay=args.esmfold_latency, jitter=args.esmfold_jitter,
+                                                     error_rate=args.esmfold_error_rate, seed=args.seed)
+    variables = {
+        'OPENAI_API_KEY': os.getenv("OPENAI_API_KEY", "unused"),
+        'CREWAI_TESTING': "true",
+        'ESMFOLD_URL': esmfold_url,
+        'ESMFOLD_CACHE_DIR': "",
+        'LLM_CACHE_DIR': "",
+        'TRACE_FILE': os.path.join(workdir, "traces.jsonl"),
+        'BOLTZ_EXECUTABLE': FAKE_BOLTZ,
+        'FAKE_BOLTZ_LOAD_SECONDS': args.boltz_load_seconds,
+        'FAKE_BOLTZ_PREDICT_SECONDS': args.boltz_predict_seconds,
+        'BOLTZ_WORKER_RUNNER': "stub",
+        'BOLTZ_WORKER_ADDRESS': os.path.join(workdir, "boltz_worker.sock"),
+    }
+    # the same backoff delays from one run to the next
+    get_esmfold_scheduler().rng = random.Random(args.seed)
+    results = {}
+    with _env(**variables):
+        get_boltz_worker().runner_kwargs = {'load_seconds': args.boltz_load_seconds, 'predict_seconds': args.boltz_predict_seconds}
+        try:
+            for scenario in args.scenarios:
+                print(f"Running {scenario}...", file=sys.stderr)
+                results[scenario] = SCENARIOS[scenario](structures, args, {'esmfold_url': esmfold_url})
+        finally:
+            get_boltz_worker().drain()
+            esmfold.shutdown()
+
+    print(f"\n{args.jobs} structures of ~{args.length} residues, {args.complex_fraction:.0%} complexes, in {workdir}")
+    print(f"ESMFold stub: {esmfold.stats['requests']} requests, {esmfold.stats['errors']} throttled")
+    print(f"{'scenario':<18}{'jobs/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'failures':>10}")
+    for scenario, result in results.items():
+        print(f"{scenario:<18}{result['throughput']:9.2f}{_format(result['p50'], 's')}{_format(result['p95'], 's')}{_format(result['p99'], 's')}{result['failures']:10d}")
+    for scenario in ("crew", "crew_replay"):
+        if scenario in results:
+            slowest = sorted(results[scenario]['stages_p95'].items(), key=lambda item: -item[1])[:8]
+            print(f"{scenario} stages by p95: " + ", ".join(f"{name} {p95:.3f}s" for name, p95 in slowest))
+
+    run = {'params': params, 'machine': platform.platform(), 'python': platform.python_version(), 'results': results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create it")
+        return 0
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    base_params = baseline.get('params') or {}
+    if base_params != params:
+        changed = sorted(set(base_params) | set(params), key=str)
+        for name in changed:
+            if base_params.get(name) != params.get(name):
+                print(f"PARAMETER MISMATCH {name}: {params.get(name)!r}, baseline {base_params.get(name)!r}")
+        print(f"Not compared with {args.baseline}: it was run with other parameters. "
+              f"Rerun with the parameters of the baseline, or with --save-baseline to replace it.")
+        return 2
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
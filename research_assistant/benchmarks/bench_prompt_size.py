@@ -0,0 +1,88 @@
+"""
+Prompt size of the fold agents with and without the sequence store, on crew jobs run by the job server with
+the stub backends and the scripted LLM (4 characters per token).
+
+    python benchmarks/bench_prompt_size.py --jobs 8 --lengths 100 600 1500
+
+Without the store the clean sequences are written in the Preprocess output, which is the context of the fold
+tasks, and the agents copy them into the tool calls. With the store they copy a handle per chain.
+"""
+import os, io, sys, argparse, tempfile, contextlib
+
+import numpy as np
+from loguru import logger
+
+from research_assistant.server import CrewPool, JobServer, use_stub_backends
+from research_assistant.tools.stubs import ScriptedLLM, _prompt_text
+
+
+RESIDUES = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+
+
+class MeasuredLLM(ScriptedLLM):
+    """
+    ScriptedLLM counting the characters of the prompts and of the answers
+    """
+    def __init__(self):
+        super().__init__()
+        self.prompt_chars = 0
+        self.answer_chars = 0
+
+    def call(self, messages, *args, **kwargs):
+        answer = super().call(messages, *args, **kwargs)
+        with self._lock:
+            self.prompt_chars += len(_prompt_text(messages))
+            self.answer_chars += len(answer)
+        return answer
+
+
+def _messages(jobs, length, rng):
+    messages = []
+    for i in range(jobs):
+        # heterodimers, so that both ESMFold and Boltz agents run (ESMFold is skipped for complexes)
+        chains = 1 if i % 2 == 0 else 2
+        sequences = [rng.choice(RESIDUES, size=length).tobytes().decode() for _ in range(chains)]
+        messages.append("".join(f">protein{i} chain {chr(65 + c)}\n{seq}\n" for c, seq in enumerate(sequences)))
+    return messages
+
+
+def _run(messages, store_dir):
+    os.environ["SEQUENCE_STORE_DIR"] = store_dir
+    llm = MeasuredLLM()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = JobServer(workers=4, max_queued=len(messages), max_queued_per_tenant=len(messages), pool=CrewPool(llm=llm), warm=0)
+        try:
+            reports = [server.result(job_id, timeout=600) for job_id in [server.submit("bench", message) for message in messages]]
+        finally:
+            server.shutdown()
+    assert all("Prediction successful: Yes" in report for report in reports)
+    return llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 600, 1500], help="chain lengths")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    workdir = tempfile.mkdtemp(prefix="bench_prompt_size_")
+    os.chdir(workdir)
+    os.environ.update({'OPENAI_API_KEY': os.getenv("OPENAI_API_KEY", "unused"), 'CREWAI_TESTING': "true", 'ESMFOLD_CACHE_DIR': "",
+                       'LLM_CACHE_DIR': "", 'RESULTS_DB': "", 'TRACE_FILE': "",
+                       # the stub Boltz runner uses no GPU: admit the large complexes
+                       'BOLTZ_GPU_MEMORY_GB': "100000"})
+    rng = np.random.default_rng(args.seed)
+    print(f"{'length':>7} {'store':>6} {'LLM calls':>10} {'prompt tok/job':>15} {'answer tok/job':>15}")
+    with use_stub_backends():
+        for length in args.lengths:
+            messages = _messages(args.jobs, length, rng)
+            for store, store_dir in (("off", ""), ("on", os.path.join(workdir, "sequences"))):
+                llm = _run(messages, store_dir)
+                print(f"{length:>7d} {store:>6} {llm.calls:>10d} {llm.prompt_chars / 4 / args.jobs:>15.0f} {llm.answer_chars / 4 / args.jobs:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
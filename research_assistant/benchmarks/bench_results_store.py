@@ -0,0 +1,74 @@
+"""
+Query latency of the results store as it grows: rows are inserted in batches with record_many,
+then lookup / is_folded and top are timed at each size.
+
+    python benchmarks/bench_results_store.py --rows 1000000 --checkpoints 10000,100000,1000000
+
+Sequences are random, so lookups of present and absent structures are both measured.
+"""
+import os, time, shutil, argparse, tempfile
+
+import numpy as np
+
+from research_assistant.tools.results_store import ResultsStore
+
+
+AMINO_ACIDS = np.array(list("ARNDCEQGHILKMFPSTWYV"))
+
+
+def _sequence(rng):
+    return "".join(rng.choice(AMINO_ACIDS, size=int(rng.integers(50, 400))))
+
+
+def _timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--checkpoints", default="10000,100000,1000000", help="sizes at which the queries are timed")
+    parser.add_argument("--batch", type=int, default=10000, help="rows per record_many")
+    parser.add_argument("--repeat", type=int, default=200, help="queries timed at each checkpoint")
+    args = parser.parse_args()
+
+    checkpoints = sorted(int(n) for n in args.checkpoints.split(",") if int(n) <= args.rows)
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="bench_results_store_")
+    store = ResultsStore(os.path.join(workdir, "results.db"))
+    known = []
+    inserted, insert_seconds = 0, 0.0
+    print(f"{'rows':>9} {'insert/s':>10} {'lookup hit ms':>14} {'lookup miss ms':>15} {'top 10 ms':>10} {'top 10 Boltz ms':>16}")
+    try:
+        for checkpoint in checkpoints:
+            while inserted < checkpoint:
+                n = min(args.batch, checkpoint - inserted)
+                batch = []
+                for i in range(n):
+                    sequences = [_sequence(rng)]
+                    if i == 0:
+                        known.append(sequences)
+                    batch.append({
+                        'sequences': sequences, 'model': "Boltz" if i % 4 == 0 else "ESMFold",
+                        'path': f"output/{inserted + i}.pdb", 'success': i % 50 != 0, 'runtime': float(rng.random() * 60),
+                        'confidence': {'mean_plddt': float(rng.random() * 100)}, 'structure_name': f"protein{inserted + i}",
+                    })
+                start = time.perf_counter()
+                store.record_many(batch)
+                insert_seconds += time.perf_counter() - start
+                inserted += n
+            hit = _timed(lambda: store.lookup(known[int(rng.integers(len(known)))], model="Boltz"), args.repeat)
+            miss = _timed(lambda: store.is_folded([_sequence(rng)], model="ESMFold"), args.repeat)
+            top = _timed(lambda: store.top(10), max(1, args.repeat // 10))
+            top_boltz = _timed(lambda: store.top(10, model="Boltz"), max(1, args.repeat // 10))
+            print(f"{inserted:>9} {inserted / insert_seconds:>10.0f} {hit * 1e3:>14.3f} {miss * 1e3:>15.3f} {top * 1e3:>10.3f} {top_boltz * 1e3:>16.3f}")
+    finally:
+        store.close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Recovery time of a crew job resumed from its checkpoint, against rerunning the job, with the stub backends and
+the scripted LLM.
+
+    python benchmarks/bench_resume.py --esmfold-seconds 1 --boltz-seconds 5
+
+The job is run once, then its checkpoint is rolled back to where it would be if the process had died:
+- before the report: every stage completed, nothing is run again
+- during Boltz: ESMFold completed, Boltz is run again
+- during preprocess: nothing completed, the whole job is run again
+"""
+import os, io, sys, json, time, argparse, tempfile, contextlib
+
+from loguru import logger
+
+from research_assistant.crew import kickoff, resume
+from research_assistant.server import CrewPool, use_stub_backends
+from research_assistant.tools.checkpoints import get_checkpoint_store
+from research_assistant.tools.stubs import ScriptedLLM
+from research_assistant.main import example_input2
+
+
+SCENARIOS = [
+    ("died before the report", []),
+    ("died during Boltz", ['boltz_task']),
+    ("died during preprocess", None),
+]
+
+
+def _roll_back(store, job_id, stages):
+    checkpoint = store.load(job_id)
+    checkpoint['report'] = None
+    checkpoint['outputs'] = {} if stages is None else {name: raw for name, raw in checkpoint['outputs'].items() if name not in stages}
+    with open(store.path_for(job_id), "w") as f:
+        json.dump(checkpoint, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--esmfold-seconds", type=float, default=1.0)
+    parser.add_argument("--boltz-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    workdir = tempfile.mkdtemp(prefix="bench_resume_")
+    os.chdir(workdir)
+    os.environ.update({'OPENAI_API_KEY': os.getenv("OPENAI_API_KEY", "unused"), 'CREWAI_TESTING': "true", 'ESMFOLD_CACHE_DIR': "",
+                       'LLM_CACHE_DIR': "", 'RESULTS_DB': "", 'TRACE_FILE': "", 'CHECKPOINT_DIR': os.path.join(workdir, "checkpoints")})
+    # new crews for each run: a crew caches the results of its tool calls, and the runs have the same inputs
+    assistant = lambda **kwargs: CrewPool(llm=ScriptedLLM()).assistant(**kwargs)
+    store = get_checkpoint_store()
+    rows = []
+    with use_stub_backends(esmfold_delay=args.esmfold_seconds, boltz_predict_seconds=args.boltz_seconds), contextlib.redirect_stdout(io.StringIO()):
+        # the Boltz worker is started by the first job
+        kickoff(example_input2, ask_human=lambda proposal: "", assistant=assistant)
+        start = time.perf_counter()
+        kickoff(example_input2, ask_human=lambda proposal: "", assistant=assistant)
+        rows.append(("rerun of the job", time.perf_counter() - start))
+        job_id = max((store.load(f[:-len(".json")]) for f in os.listdir(store.root)), key=lambda c: c['updated_at'])['job_id']
+        for scenario, stages in SCENARIOS:
+            _roll_back(store, job_id, stages)
+            start = time.perf_counter()
+            resume(job_id, ask_human=lambda proposal: "", assistant=assistant)
+            rows.append((scenario, time.perf_counter() - start))
+
+    print(f"{'scenario':>24} {'seconds':>8} {'of a rerun':>11}")
+    for scenario, seconds in rows:
+        print(f"{scenario:>24} {seconds:>8.2f} {seconds / rows[0][1]:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
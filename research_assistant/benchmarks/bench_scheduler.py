@@ -0,0 +1,89 @@
+"""
+Makespan and out-of-memory failures of a queue of Boltz jobs on one GPU, simulated with the resource model
+of resources.py: jobs of random sizes are run in batches by concurrent workers that share the GPU memory.
+
+    python benchmarks/bench_scheduler.py --jobs 500 --workers 2 --gpu-memory 48
+
+- unchecked: batches in arrival order, launched as soon as a worker is free. A batch that doesn't fit next to the
+  running ones runs out of memory after 10% of its time, and its jobs fail.
+- fifo: jobs that can't fit on the GPU are rejected before launch (FoldScheduler.admit), and a batch waits
+  until its estimated peak fits next to the running ones (MemoryBudget). Batches in arrival order.
+- scheduled: as fifo, with the batches planned longest first (FoldScheduler.plan).
+The true time and memory of each job are the estimates with +-15% noise, so estimates are not exact.
+"""
+import heapq, argparse
+
+import numpy as np
+
+from research_assistant.tools.resources import FoldScheduler
+
+
+def _jobs(n, rng):
+    jobs = {}
+    for i in range(n):
+        chains = int(rng.choice([1, 1, 2, 2, 3, 4]))
+        jobs[f"job{i}"] = ["A" * int(rng.integers(60, 260)) for _ in range(chains)]
+    return jobs
+
+
+def simulate(batches, truth, workers, gpu_memory, wait_for_memory):
+    """
+    batches: list of (names, estimated peak memory), in launch order
+    truth: dict, name -> (seconds, memory_gb)
+    return: dict, makespan, completed and failed jobs, and GPU seconds lost to failed batches
+    """
+    now, running, completed, failed, lost = 0.0, [], 0, 0, 0.0 # running: heap of (end, memory)
+    for names, estimated_memory in batches:
+        seconds = sum(truth[name][0] for name in names)
+        memory = max(truth[name][1] for name in names)
+        # wait for a free worker, and with the memory budget, for the estimated peak to fit
+        while len(running) >= workers or (wait_for_memory and running and sum(m for _, m in running) + estimated_memory > gpu_memory):
+            now, _ = heapq.heappop(running)
+        if sum(m for _, m in running) + memory > gpu_memory:
+            failed += len(names)
+            lost += 0.1 * seconds
+            heapq.heappush(running, (now + 0.1 * seconds, 0.0))
+        else:
+            heapq.heappush(running, (now + seconds, memory))
+            completed += len(names)
+    makespan = max([now] + [end for end, _ in running])
+    return {'makespan': makespan, 'completed': completed, 'failed': failed, 'lost_seconds': lost}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2, help="concurrent Boltz runs")
+    parser.add_argument("--gpu-memory", type=float, default=48.0, help="GB")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    jobs = _jobs(args.jobs, rng)
+    scheduler = FoldScheduler(memory_gb=args.gpu_memory)
+    truth = {}
+    for name, sequences in jobs.items():
+        estimate = scheduler.estimator.estimate("Boltz", sequences)
+        truth[name] = (estimate.seconds * rng.uniform(0.85, 1.15), estimate.memory_gb * rng.uniform(0.85, 1.15))
+
+    def _in_order(names):
+        batches = [names[i:i + args.batch_size] for i in range(0, len(names), args.batch_size)]
+        return [(batch, max(scheduler.estimator.estimate("Boltz", jobs[name]).memory_gb for name in batch)) for batch in batches]
+
+    admitted = {name: sequences for name, sequences in jobs.items() if scheduler.admit("Boltz", sequences)[0] == "run"}
+    scenarios = [
+        ("unchecked", _in_order(list(jobs)), False),
+        ("fifo", _in_order(list(admitted)), True),
+        ("scheduled", [(list(batch), estimate.memory_gb) for batch, estimate in scheduler.plan(admitted, args.batch_size)], True),
+    ]
+
+    print(f"{len(jobs)} jobs, {args.workers} workers, {args.gpu_memory:.0f} GB, {len(jobs) - len(admitted)} rejected before launch")
+    print(f"{'scenario':>10} {'makespan s':>11} {'completed':>10} {'failed jobs':>12} {'lost GPU s':>11}")
+    for scenario, batches, wait in scenarios:
+        result = simulate(batches, truth, args.workers, args.gpu_memory, wait)
+        print(f"{scenario:>10} {result['makespan']:>11.0f} {result['completed']:>10d} {result['failed']:>12d} {result['lost_seconds']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
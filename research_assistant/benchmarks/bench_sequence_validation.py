@@ -0,0 +1,60 @@
+"""
+Compare the bulk sequence validator with is_amino_acid_sequence on random sequences.
+
+    python benchmarks/bench_sequence_validation.py --sequences 1000000 --length 300
+
+A fraction of the sequences get an invalid residue at a random position, so that both the valid and
+the invalid paths are measured.
+"""
+import time, random, argparse
+
+import numpy as np
+
+from research_assistant.tools.custom_tool import is_amino_acid_sequence
+from research_assistant.tools.validation import validate_sequences
+
+
+def _random_sequences(n, length, invalid_fraction, seed=0):
+    rng = np.random.default_rng(seed)
+    residues = np.frombuffer(b"ARNDCEQGHILKMFPSTWYV", dtype=np.uint8)
+    lengths = rng.integers(length // 2, length * 3 // 2, size=n)
+    buf = rng.choice(residues, size=int(lengths.sum()))
+    sequences = []
+    offset = 0
+    for l in lengths:
+        sequences.append(buf[offset:offset + l].tobytes().decode("ascii"))
+        offset += l
+    random.seed(seed)
+    for i in random.sample(range(n), int(n * invalid_fraction)):
+        pos = random.randrange(len(sequences[i]))
+        sequences[i] = sequences[i][:pos] + "1" + sequences[i][pos + 1:]
+    return sequences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sequences", type=int, default=100000)
+    parser.add_argument("--length", type=int, default=300)
+    parser.add_argument("--invalid-fraction", type=float, default=0.01)
+    args = parser.parse_args()
+
+    sequences = _random_sequences(args.sequences, args.length, args.invalid_fraction)
+    residues = sum(len(s) for s in sequences)
+    print(f"{len(sequences)} sequences, {residues} residues")
+
+    start = time.perf_counter()
+    expected = [is_amino_acid_sequence(seq) for seq in sequences]
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = validate_sequences(sequences)
+    bulk = time.perf_counter() - start
+
+    assert result["valid"].tolist() == expected
+    print(f"{'is_amino_acid_sequence':<24} {baseline:8.3f}s  {residues / baseline / 1e6:8.1f} M residues/s")
+    print(f"{'validate_sequences':<24} {bulk:8.3f}s  {residues / bulk / 1e6:8.1f} M residues/s")
+    print(f"speedup: {baseline / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
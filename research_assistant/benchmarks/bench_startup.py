@@ -0,0 +1,67 @@
+"""
+Startup time of the `run` entry point and of the job server workers, each measured in a fresh interpreter.
+
+    python benchmarks/bench_startup.py --repeat 5 --workers 4
+    python benchmarks/bench_startup.py --src /path/to/another/checkout/src   # compare with another tree
+
+- import main: `import research_assistant.main`, what `run` pays before reading the message
+- first crew: build the full crew of a job (preprocess, model selection and the folding tasks)
+- server start: JobServer(workers) with warm crews of each of the DEFAULT_SHAPES for every worker
+The agents use ScriptedLLM and the LLM cache is off, so no model is called or loaded.
+"""
+import os, sys, json, argparse, subprocess, statistics
+
+
+CHILD = r"""
+import os, sys, json, time
+os.environ.update({'LLM_CACHE_DIR': "", 'TRACE_FILE': "", 'RESULTS_DB': "", 'CREWAI_DISABLE_TELEMETRY': "true", 'OTEL_SDK_DISABLED': "true"})
+workers = int(sys.argv[1])
+result = {}
+
+start = time.perf_counter()
+import research_assistant.main
+result['import main'] = time.perf_counter() - start
+result['modules'] = len(sys.modules)
+
+from research_assistant.crew import ResearchAssistant
+from research_assistant.server import JobServer, CrewPool
+from research_assistant.tools.stubs import ScriptedLLM
+
+start = time.perf_counter()
+ResearchAssistant(llm=ScriptedLLM()).crew()
+result['first crew'] = time.perf_counter() - start
+
+start = time.perf_counter()
+server = JobServer(workers=workers, pool=CrewPool(llm=ScriptedLLM()))
+result['server start'] = time.perf_counter() - start
+result['crews built'] = server.pool.stats['built']
+print(json.dumps(result))
+"""
+
+TIMINGS = ['import main', 'first crew', 'server start']
+
+
+def _run(src, workers):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (src, os.environ.get("PYTHONPATH")) if p))
+    out = subprocess.run([sys.executable, "-c", CHILD, str(workers)], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"),
+                        help="directory of the research_assistant package")
+    args = parser.parse_args()
+
+    runs = [_run(args.src, args.workers) for _ in range(args.repeat)]
+    print(f"{args.src}: {runs[0]['modules']} modules imported by main, {runs[0]['crews built']} crews warmed for {args.workers} workers")
+    print(f"{'step':>13} {'p50 s':>7} {'min s':>7} {'max s':>7}")
+    for step in TIMINGS:
+        seconds = [run[step] for run in runs]
+        print(f"{step:>13} {statistics.median(seconds):>7.3f} {min(seconds):>7.3f} {max(seconds):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
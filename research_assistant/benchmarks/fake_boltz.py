@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+Fake `boltz` executable for benchmarks and tests on machines without boltz or a GPU.
+Accepts the `boltz predict` arguments used by research_assistant, sleeps to emulate model loading
+(FAKE_BOLTZ_LOAD_SECONDS, default 2) and prediction (FAKE_BOLTZ_PREDICT_SECONDS per structure, default 0.1),
+and writes a Boltz-like output tree. Progress lines are printed as they happen, like `boltz predict`.
+"""
+import os, sys, argparse
+
+from research_assistant.tools.boltz_worker import StubBoltzRunner
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="boltz")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    predict = subparsers.add_parser("predict")
+    predict.add_argument("input_path")
+    predict.add_argument("--out_dir", default="./")
+    predict.add_argument("--devices", default="1")
+    predict.add_argument("--output_format", default="mmcif")
+    predict.add_argument("--use_msa_server", action="store_true")
+    args = parser.parse_args()
+
+    runner = StubBoltzRunner(
+        load_seconds=float(os.getenv("FAKE_BOLTZ_LOAD_SECONDS", 2.0)),
+        predict_seconds=float(os.getenv("FAKE_BOLTZ_PREDICT_SECONDS", 0.1)),
+    )
+    output = runner.predict(args.input_path, args.out_dir, use_msa_server=args.use_msa_server, output_format=args.output_format,
+                            progress=lambda line: print(line, flush=True))
+    return output['returncode']
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,225 @@ from crewai.tasks.task_output import TaskOutput
 
 
 # Uncomment the following line to use an example of a custom tool
-from research_assistant.tools.custom_tool import Preprocess, PreprocessOutput, ModelSelectionOutput, ESMFoldTool, BoltzTool
-import os
+from research_assistant.tools.custom_tool import Preprocess, ModelSelectionOutput, FoldToolOutput
+from research_assistant.tools.backends import backends, get_backend, folding_tasks
+from research_assistant.tools.sequence_parser import parse_sequence_input
+from research_assistant.tools.model_selection import NO_SUITABLE_MODEL, parse_num_chains, select_models, apply_feedback
+from research_assistant.tools.report import render_report
+from research_assistant.tools.workspace import Workspace
+from research_assistant.tools.tracing import get_tracer, trace_crewai_events
+from research_assistant.tools.llm_cache import cached_llm
+from research_assistant.tools.checkpoints import get_checkpoint_store, verified_outputs
+from loguru import logger
+import os, time
+from contextlib import contextmanager
 
 # Check our tools documentations for more information on how to use them
 # from crewai_tools import SerperDevTool
 
+def fast_path_outputs(message):
+	"""
+	Compute locally the outputs of the tasks that don't need the LLM for this message.
+	Well-formed inputs (FASTA, bare sequences, "N copies of X") are parsed and passed straight to the Preprocess tool.
+	message: str, the user's message
+	return: dict, task name -> task output, to pass as ResearchAssistant(precomputed=...)
+	"""
+	parsed = parse_sequence_input(message)
+	if parsed is None:
+		return {}
+	return {'preprocess_task': Preprocess()._run(**parsed)}
+
+
+def propose_models(preprocess_output):
+	"""
+	Proposal of the rules of the model_selection_agent, for the output of the Preprocess tool
+	preprocess_output: str, output of the preprocess task
+	return: tuple, (ModelSelectionOutput, number of chains), or (None, None) if the output was not written by the Preprocess tool
+	"""
+	num_chains = parse_num_chains(preprocess_output)
+	if num_chains is None:
+		return None, None
+	return select_models(num_chains), num_chains
+
+
+def selection_outputs(proposal, num_chains, feedback):
+	"""
+	Outputs of the model selection after the human feedback on the proposal.
+	The folding tasks of the models that are not selected are skipped.
+	feedback: str, the human feedback, "" accepts the proposal
+	return: tuple, (dict of precomputed task outputs, dict of human feedback for the tasks that still have to interpret it)
+	"""
+	selection = apply_feedback(proposal, num_chains, feedback)
+	if selection is None:
+		# free text feedback: the model_selection_agent interprets it
+		return {}, {'model_selection_task': f"Initial proposal: {proposal}\nHuman feedback: {feedback}"}
+	precomputed = {'model_selection_task': str(selection)}
+	for model, name in folding_tasks().items():
+		if model not in selection.selected_models:
+			precomputed[name] = str(FoldToolOutput(model_name=model, model_is_selected=False))
+	return precomputed, {}
+
+
+def rejected_outputs(reason=""):
+	"""
+	Outputs of the model selection when the proposal is rejected: no model is run
+	return: tuple, see selection_outputs
+	"""
+	selection = ModelSelectionOutput(selected_models=[NO_SUITABLE_MODEL], explanation=f"The proposal was rejected. {reason}".strip())
+	precomputed = {'model_selection_task': str(selection)}
+	for model, name in folding_tasks().items():
+		precomputed[name] = str(FoldToolOutput(model_name=model, model_is_selected=False))
+	return precomputed, {}
+
+
+def select_models_outputs(preprocess_output, ask_human=input, policy=None):
+	"""
+	Select the models with the rules of the model_selection_agent instead of the LLM, and check with the human.
+	The folding tasks of the models that are not selected are skipped.
+	preprocess_output: str, output of the preprocess task
+	ask_human: callable, shows the proposal to the human and returns their feedback
+	policy: callable (proposal, num_chains) -> bool, approves proposals without asking the human, see tools/approvals.py.
+		Defaults to None, which asks the human for every proposal.
+	return: tuple, (dict of precomputed task outputs, dict of human feedback for the tasks that still have to interpret it)
+	"""
+	proposal, num_chains = propose_models(preprocess_output)
+	if proposal is None:
+		return {}, {}
+	if policy is not None and policy(proposal, num_chains):
+		return selection_outputs(proposal, num_chains, "")
+	feedback = ask_human(
+		f"Proposed models: {', '.join(proposal.selected_models)}. {proposal.explanation}\n"
+		"Press Enter to accept, or give your feedback: "
+	)
+	return selection_outputs(proposal, num_chains, feedback)
+
+
+def save_checkpoint(job_id, **kwargs):
+	"""
+	Add the finished stages of a job to its checkpoint, when the checkpoints are enabled (see tools/checkpoints.py)
+	job_id: str, ID of the job
+	kwargs: see CheckpointStore.save
+	"""
+	store = get_checkpoint_store()
+	if store is not None:
+		store.save(job_id, **kwargs)
+
+
+@contextmanager
+def new_assistant(**kwargs):
+	"""
+	Build a new ResearchAssistant for one crew run. See ResearchAssistant for the arguments.
+	"""
+	yield ResearchAssistant(**kwargs)
+
+
+def prepare(message, workspace, assistant=new_assistant):
+	"""
+	First stage of a job: the output of the preprocess task, computed locally or by the preprocess agent
+	message: str, the user's message
+	workspace: Workspace, directories of the job
+	assistant: context manager factory of the ResearchAssistant of each crew run, see kickoff
+	return: dict, task name -> precomputed task output
+	"""
+	save_checkpoint(workspace.job_id, message=message)
+	precomputed = fast_path_outputs(message)
+	if 'preprocess_task' not in precomputed:
+		with assistant(task_names=['preprocess_task'], workspace=workspace) as preprocess:
+			precomputed['preprocess_task'] = preprocess.crew().kickoff(inputs={'message': message}).raw
+	save_checkpoint(workspace.job_id, outputs=precomputed)
+	return precomputed
+
+
+def fold(message, precomputed, feedback, workspace, assistant=new_assistant):
+	"""
+	Last stage of a job: run the tasks that are not precomputed, i.e. the model selection agent if the human feedback
+	needs to be interpreted, and the folding agents of the selected models
+	message: str, the user's message
+	precomputed: dict, task name -> precomputed task output
+	feedback: dict, task name -> human feedback
+	workspace: Workspace, directories of the job
+	assistant: context manager factory of the ResearchAssistant of each crew run, see kickoff
+	return: str, the final report
+	"""
+	# the model selection, and the crew saves each of its tasks as it finishes (see ResearchAssistant.checkpoint_task)
+	save_checkpoint(workspace.job_id, outputs=precomputed, feedback=feedback)
+	with assistant(precomputed=precomputed, feedback=feedback, workspace=workspace) as research_assistant:
+		if all(name in precomputed for name in folding_tasks().values()):
+			logger.info(f"Job {workspace.job_id}: no model to run, {precomputed.get('model_selection_task')}")
+			report = research_assistant.report({})
+		else:
+			report = research_assistant.crew().kickoff(inputs={'message': message}).raw
+	save_checkpoint(workspace.job_id, report=report)
+	return report
+
+
+def run_stages(message, workspace, precomputed, feedback, ask_human=input, assistant=new_assistant, policy=None):
+	"""
+	Run the stages of a job that are not precomputed: preprocess, model selection, then the folding tasks
+	message: str, the user's message
+	workspace: Workspace, directories of the job
+	precomputed: dict, task name -> output of the completed stages
+	feedback: dict, task name -> human feedback
+	ask_human, assistant, policy: see kickoff
+	return: str, the final report
+	"""
+	if 'preprocess_task' not in precomputed:
+		precomputed.update(prepare(message, workspace, assistant))
+	if 'model_selection_task' not in precomputed and 'model_selection_task' not in feedback:
+		with get_tracer().span("model_selection"):
+			selected, feedback = select_models_outputs(precomputed['preprocess_task'], ask_human, policy)
+		precomputed.update(selected)
+	return fold(message, precomputed, feedback, workspace, assistant)
+
+
+def kickoff(message, ask_human=input, assistant=new_assistant, policy=None):
+	"""
+	Run the crew on the user's message. Only the steps that need an LLM are run by the agents: the preprocess agent
+	for messages the sequence parser can't read, the model selection agent for free text feedback, and the folding agents.
+	message: str, the user's message
+	ask_human: callable, shows the model selection proposal to the human and returns their feedback
+	assistant: context manager factory of the ResearchAssistant of each crew run, called with the arguments of
+		ResearchAssistant. Defaults to new_assistant. The job server passes a pool of pre-built crews instead.
+	policy: callable (proposal, num_chains) -> bool, approves proposals without asking the human, see select_models_outputs
+	return: str, the final report
+	"""
+	workspace = Workspace()
+	# the trace of the job, see tools/tracing.py
+	with get_tracer().span("job", trace_id=workspace.job_id):
+		return run_stages(message, workspace, {}, {}, ask_human, assistant, policy)
+
+
+def resume(job_id, ask_human=input, assistant=new_assistant, policy=None):
+	"""
+	Resume a job from its checkpoint (see tools/checkpoints.py): the completed stages whose outputs still exist are
+	skipped, and only the remaining ones are run, in the directories of the job. Run it from the directory the job
+	was started in, the paths of the outputs are relative to it.
+	job_id: str, ID of the job, e.g. run-date-241201-time-143005-1f2e3d4c
+	ask_human, assistant, policy: see kickoff
+	return: str, the final report
+	"""
+	store = get_checkpoint_store()
+	checkpoint = store.load(job_id) if store is not None else None
+	if checkpoint is None:
+		raise ValueError(f"No checkpoint of job {job_id} in {store.root if store is not None else 'CHECKPOINT_DIR (disabled)'}")
+	if checkpoint['report'] is not None:
+		logger.info(f"Job {job_id} already finished")
+		return checkpoint['report']
+	precomputed = verified_outputs(checkpoint)
+	# the feedback of a completed task was already taken into account
+	feedback = {name: value for name, value in checkpoint['feedback'].items() if name not in precomputed}
+	logger.info(f"Resuming job {job_id}, completed stages: {sorted(precomputed)}")
+	with get_tracer().span("job", trace_id=job_id, resumed=sorted(precomputed)):
+		return run_stages(checkpoint['message'], Workspace(job_id), precomputed, feedback, ask_human, assistant, policy)
+
+
+def shape_of(precomputed, feedback, task_names=None):
+	"""
+	Shape of a crew run: the names of the precomputed tasks, of the tasks with feedback, and of the tasks to run
+	"""
+	return (tuple(sorted(precomputed)), tuple(sorted(feedback)), tuple(task_names) if task_names is not None else None)
+
+
 @CrewBase
 class ResearchAssistant():
 	"""ResearchAssistant crew"""
@@ -18,12 +231,151 @@ class ResearchAssistant():
 	agents_config = 'config/agents.yaml'
 	tasks_config = 'config/tasks.yaml'
 
+	def __init__(self, precomputed=None, feedback=None, task_names=None, workspace=None, llm=None):
+		"""
+		precomputed: dict, task name -> output of the tasks that were computed without the LLM, e.g. by fast_path_outputs().
+			These tasks are left out of the crew, and their outputs are given to the downstream tasks in their description.
+		feedback: dict, task name -> human feedback already collected for the task. These tasks don't ask the human again.
+		task_names: list[str], the tasks to run. Defaults to all tasks.
+		workspace: Workspace, directories of the job. Defaults to a new workspace, so that crews can run concurrently.
+		llm: LLM of the agents, e.g. ScriptedLLM to run without a model. Defaults to the crewai default LLM.
+			Its responses are cached, see tools/llm_cache.py.
+		"""
+		self.precomputed = precomputed or {}
+		self.feedback = feedback or {}
+		self.task_names = task_names
+		self.workspace = workspace or Workspace()
+		self.llm = llm
+		self._agent_names = {}
+		# agents and tasks of the fold backends, built on first use (see fold_agent)
+		self._fold_agents = {}
+		self._fold_tasks = {}
+
+	def shape(self):
+		"""
+		The tasks and descriptions of the crew depend only on which tasks are precomputed or have feedback,
+		not on their values: crews of the same shape can be reused for other jobs with reset().
+		"""
+		return shape_of(self.precomputed, self.feedback, self.task_names)
+
+	def reset(self, precomputed=None, feedback=None, workspace=None):
+		"""
+		Prepare the crew for another job of the same shape, without rebuilding the agents, tools and tasks
+		precomputed: dict, task name -> output of the precomputed tasks of the job
+		feedback: dict, task name -> human feedback of the job
+		workspace: Workspace, directories of the job. Defaults to a new workspace.
+		"""
+		if shape_of(precomputed or {}, feedback or {}, self.task_names) != self.shape():
+			raise ValueError("The job does not have the shape of this crew")
+		self.precomputed = precomputed or {}
+		self.feedback = feedback or {}
+		self.workspace = workspace or Workspace()
+		# the agents are memoized: these are the agents of the crew
+		for agent in self._fold_agents.values():
+			for tool in agent.tools:
+				tool.workspace = self.workspace
+
+	def _agent(self, name, cache_llm=True, **kwargs):
+		"""
+		cache_llm: bool, whether the LLM turns of the agent are read from the LLM response cache (see tools/llm_cache.py).
+			Agents whose prompts carry the answers of a human must not replay old turns.
+		"""
+		llm = cached_llm(self.llm) if cache_llm else self.llm
+		if llm is not None:
+			kwargs['llm'] = llm
+		agent = Agent(config=self.agents_config[name], **kwargs)
+		self._agent_names[agent.id] = name
+		return agent
+
+	def _context(self, *task_names):
+		"""
+		Context of a task: the upstream tasks that run in the crew. The outputs of precomputed upstream tasks are
+		interpolated in the description instead (see add_precomputed_outputs).
+		return: tuple, (list of tasks, suffix of the description)
+		"""
+		context = [getattr(self, name)() for name in task_names if name not in self.precomputed]
+		suffix = "".join(f"\nOutput of the {name}:\n{{{name}_output}}\n" for name in task_names if name in self.precomputed)
+		return context, suffix
+
+	def _task(self, name, context=(), **kwargs):
+		config = self.tasks_config[name]
+		context, suffix = self._context(*context)
+		if name in self.feedback:
+			suffix += f"\nThe human already gave feedback on the initial proposal, revise it accordingly:\n{{{name}_feedback}}\n"
+			kwargs['human_input'] = False
+		return Task(
+			config=config,
+			name=name,
+			description=config['description'] + suffix,
+			context=context,
+			**kwargs
+		)
+
+	@before_kickoff
+	def add_precomputed_outputs(self, inputs):
+		# the descriptions of the tasks downstream of precomputed tasks refer to their outputs
+		for name, output in self.precomputed.items():
+			inputs[f"{name}_output"] = output
+		for name, feedback in self.feedback.items():
+			inputs[f"{name}_feedback"] = feedback
+		return inputs
+
+	@before_kickoff
+	def start_trace(self, inputs):
+		# the crew's tasks and LLM turns are recorded in the trace of the job, from the crewai events
+		trace_crewai_events()
+		get_tracer().bind_agents(self._agent_names, self.workspace.job_id)
+		self._trace_start = (time.time(), time.perf_counter())
+		self._tokens_at_start = {agent.id: agent._token_process.get_summary() for agent in self.agents}
+		return inputs
+
 	@before_kickoff # Optional hook to be executed before the crew starts
 	def pull_data_example(self, inputs):
 		# Example of pulling data from an external API, dynamically changing the inputs
 		# inputs['extra_data'] = "This is extra data"
 		return inputs
 
+	def report(self, task_outputs):
+		"""
+		Final report of the folding tasks, rendered from the tool outputs instead of by a reporter agent
+		task_outputs: dict, task name -> raw output of the tasks run by the crew
+		return: str, the report
+		"""
+		outputs = {**self.precomputed, **task_outputs}
+		return render_report([outputs[name] for name in folding_tasks().values() if name in outputs])
+
+	def checkpoint_task(self, output):
+		"""
+		Save the output of a task to the checkpoint of the job as soon as the task finishes: the folding tasks run
+		concurrently, a resumed job skips the ones that completed
+		output: TaskOutput
+		"""
+		save_checkpoint(self.workspace.job_id, outputs={output.name: output.raw})
+
+	@after_kickoff
+	def report_results(self, output):
+		if any(t.name in folding_tasks().values() for t in output.tasks_output):
+			output.raw = self.report({t.name: t.raw for t in output.tasks_output})
+		return output
+
+	@after_kickoff
+	def end_trace(self, output):
+		tracer = get_tracer()
+		# token counters of the agents are cumulative, and pooled crews run many jobs
+		for agent in self.agents:
+			start, end = self._tokens_at_start.get(agent.id), agent._token_process.get_summary()
+			if start is not None and end.successful_requests > start.successful_requests:
+				tracer.add_tokens(
+					self._agent_names.get(agent.id, agent.role),
+					prompt_tokens=end.prompt_tokens - start.prompt_tokens,
+					completion_tokens=end.completion_tokens - start.completion_tokens,
+					requests=end.successful_requests - start.successful_requests,
+				)
+		tracer.record("crew.kickoff", time.perf_counter() - self._trace_start[1], trace_id=self.workspace.job_id,
+			start=self._trace_start[0], tasks=[t.name for t in output.tasks_output])
+		tracer.unbind_agents(self._agent_names)
+		return output
+
 	@after_kickoff # Optional hook to be executed after the crew has finished
 	def log_results(self, output):
 		# Example of logging results, dynamically changing the output
@@ -32,8 +384,8 @@ class ResearchAssistant():
 	
 	@agent
 	def preprocess_agent(self) -> Agent:
-		return Agent(
-			config=self.agents_config['preprocess_agent'],
+		return self._agent(
+			'preprocess_agent',
 			verbose=True, 
 			tools=[Preprocess(result_as_answer=True)],
 		)
@@ -46,90 +398,73 @@ class ResearchAssistant():
 	
 	@agent
 	def model_selection_agent(self) -> Agent:
-		return Agent(
-			config=self.agents_config['model_selection_agent'],
+		return self._agent(
+			'model_selection_agent',
+			# its task asks the human for feedback (human_input)
+			cache_llm=False,
 			verbose=True,
 		)
 	
 	@task
 	def model_selection_task(self) -> Task:
-		return Task(
-			config=self.tasks_config['model_selection_task'], 
-			context=[self.preprocess_task()], 
+		return self._task(
+			'model_selection_task', 
+			context=['preprocess_task'], 
 			human_input=True
 		)
 	
-	@agent
-	def esmfold_agent(self) -> Agent:
-		return Agent(
-			config=self.agents_config['esmfold_agent'],
-			verbose=True,
-			tools=[ESMFoldTool(result_as_answer=True)]
-		)
+	def backends_in_use(self):
+		"""
+		return: list[str], the models whose folding tasks run in this crew: not precomputed, and in task_names
+		"""
+		return [b.name for b in backends() if b.task not in self.precomputed and (self.task_names is None or b.task in self.task_names)]
 
-	@task
-	def esmfold_task(self) -> Task:
-		return Task(
-			config=self.tasks_config['esmfold_task'],
-			context=[self.preprocess_task(), self.model_selection_task()], 
-			agent=self.esmfold_agent(), 
-			async_execution=True
-		)
+	def fold_agent(self, model):
+		"""
+		Agent of a fold backend, with the tool of the backend. The tool is imported and the agent built on first use,
+		so that a crew only builds the backends it runs (see tools/backends.py).
+		model: str, name of the backend, e.g. "Boltz"
+		"""
+		if model not in self._fold_agents:
+			backend = get_backend(model)
+			self._fold_agents[model] = self._agent(
+				backend.agent,
+				verbose=True,
+				tools=[backend.tool_class()(result_as_answer=True, workspace=self.workspace)]
+			)
+		return self._fold_agents[model]
 
-	@agent
-	def boltz_agent(self) -> Agent:
-		return Agent(
-			config=self.agents_config['boltz_agent'],
-			verbose=True,
-			tools=[BoltzTool(result_as_answer=True)]
-		)
-
-	@task
-	def boltz_task(self) -> Task:
-		return Task(
-			config=self.tasks_config['boltz_task'],
-			context=[self.preprocess_task(), self.model_selection_task()], 
-			agent=self.boltz_agent(),
-			async_execution=True
-		)
-	
-	# @agent
-	# def igfold_agent(self) -> Agent:
-	# 	return Agent(
-	# 		config=self.agents_config['igfold_agent'],
-	# 		verbose=True,
-	# 		tools=[IgFoldTool()]
-	# 	)
-
-	# @task
-	# def igfold_task(self) -> Task:
-	# 	return Task(
-	# 		config=self.tasks_config['igfold_task'],
-	# 		context=[self.preprocess_task(), self.model_selection_task()], 
-	# 		agent=self.igfold_agent(), 
-	# 	)
-
-	@agent
-	def reporter_agent(self) -> Agent:
-		return Agent(
-			config=self.agents_config['reporter_agent'],
-			context=[self.esmfold_task(), self.boltz_task()], # add more folding tasks here 
-			verbose=True,
-		)
-	
-	@task
-	def reporter_task(self) -> Task:
-		return Task(
-			config=self.tasks_config['reporter_task'],
-			context=[self.esmfold_task(), self.boltz_task()], # add more folding tasks here 
-		)
+	def fold_task(self, model):
+		"""
+		Folding task of a fold backend, run by fold_agent(model)
+		"""
+		if model not in self._fold_tasks:
+			backend = get_backend(model)
+			self._fold_tasks[model] = self._task(
+				backend.task,
+				context=['preprocess_task', 'model_selection_task'],
+				agent=self.fold_agent(model),
+				async_execution=True
+			)
+		return self._fold_tasks[model]
 
 	@crew
 	def crew(self) -> Crew:
 		"""Creates the ResearchAssistant crew"""
+		# the folding tasks of the backends in use, after the tasks of the decorated methods
+		in_use = self.backends_in_use()
+		self.tasks = self.tasks + [self.fold_task(model) for model in in_use]
+		self.agents = self.agents + [self.fold_agent(model) for model in in_use]
+		# leave out the precomputed tasks, and the agents that only worked on them
+		tasks = [t for t in self.tasks if t.name not in self.precomputed and (self.task_names is None or t.name in self.task_names)]
+		agents = [a for a in self.agents if any(t.agent is a for t in tasks)]
+		if tasks and tasks[-1].async_execution:
+			# nothing runs after the last folding task (the report is rendered in report_results), and the crew must not end with several async tasks
+			tasks[-1].async_execution = False
 		return Crew(
-			agents=self.agents, # Automatically created by the @agent decorator
-			tasks=self.tasks, # Automatically created by the @task decorator
+			agents=agents, # Automatically created by the @agent decorator
+			tasks=tasks, # Automatically created by the @task decorator
 			process=Process.sequential,
+			task_callback=self.checkpoint_task,
 			verbose=True
 		)
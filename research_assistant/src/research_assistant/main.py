@@ -2,7 +2,10 @@
 import sys
 import warnings
 
-from research_assistant.crew import ResearchAssistant
+from research_assistant.crew import ResearchAssistant, kickoff
+from research_assistant.tools.sequence_parser import fast_path_stats
+from research_assistant.tools.tracing import get_tracer
+from loguru import logger
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
@@ -38,8 +41,10 @@ def run():
     inputs = {
         'message': example_input2
     }
-    crew = ResearchAssistant().crew()
-    crew.kickoff(inputs=inputs)
+    # well-formed inputs and model selection are handled locally, the agents only handle what needs an LLM
+    kickoff(inputs['message'])
+    logger.info(f"Sequence parser fast path: {fast_path_stats()}")
+    logger.info(f"Time per stage: {get_tracer().stats()}")
 
     # print()
     # print("DEBUG: preprocess task output....RAW")
@@ -56,6 +61,84 @@ def run():
 
 
 
+def run_batch():
+    """
+    Fold every record of a large FASTA, CSV or JSONL file, without the agents.
+    Results are streamed to <output_dir>/manifest.jsonl as they finish.
+    """
+    import argparse
+    from research_assistant.tools.batch import run_batch as _run_batch
+
+    parser = argparse.ArgumentParser(description=run_batch.__doc__)
+    parser.add_argument("input", help="path to a .fasta/.fa/.faa, .csv or .jsonl file. Chains of a complex are separated by ':'")
+    parser.add_argument("--output-dir", default="output/batch")
+    parser.add_argument("--models", nargs="+", default=["ESMFold", "Boltz"], choices=["ESMFold", "Boltz"])
+    parser.add_argument("--esmfold-concurrency", type=int, default=8)
+    parser.add_argument("--boltz-batch-size", type=int, default=8)
+    parser.add_argument("--boltz-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--no-msa-server", action="store_true")
+    args = parser.parse_args()
+
+    _run_batch(
+        args.input,
+        output_dir=args.output_dir,
+        models=args.models,
+        esmfold_concurrency=args.esmfold_concurrency,
+        boltz_batch_size=args.boltz_batch_size,
+        boltz_workers=args.boltz_workers,
+        queue_size=args.queue_size,
+        use_msa_server=not args.no_msa_server,
+    )
+
+
+def serve():
+    """
+    Serve the crew to several tenants over HTTP, with pooled crews, per-tenant queues and admission control.
+    """
+    import argparse, contextlib
+    from research_assistant.server import CrewPool, JobServer, serve as _serve, use_stub_backends
+
+    parser = argparse.ArgumentParser(description=serve.__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-queued", type=int, default=100)
+    parser.add_argument("--max-queued-per-tenant", type=int, default=20)
+    parser.add_argument("--stub", action="store_true", help="run without network access: scripted LLM and stub fold backends")
+    parser.add_argument("--approvals", default="none", choices=["none", "policy", "review"],
+                        help="proposals of the jobs submitted without feedback: accepted (none), approved by the policy or else "
+                             "queued for the reviewer (policy), or all queued for the reviewer (review)")
+    parser.add_argument("--approval-timeout", type=float, default=3600, help="seconds a proposal waits for the reviewer")
+    parser.add_argument("--approval-default", default="approve", choices=["approve", "reject"], help="action on proposals past their deadline")
+    args = parser.parse_args()
+
+    pool = None
+    # the stub backends are stopped when the server exits
+    backends = contextlib.ExitStack()
+    if args.stub:
+        from research_assistant.tools.stubs import ScriptedLLM
+        backends.enter_context(use_stub_backends())
+        pool = CrewPool(llm=ScriptedLLM())
+    approvals = None
+    if args.approvals != "none":
+        from research_assistant.tools.approvals import ApprovalQueue, unambiguous, never
+        approvals = ApprovalQueue(policy=unambiguous if args.approvals == "policy" else never, timeout=args.approval_timeout, default=args.approval_default)
+    job_server = JobServer(workers=args.workers, max_queued=args.max_queued, max_queued_per_tenant=args.max_queued_per_tenant, pool=pool, approvals=approvals)
+    http_server = _serve(job_server, host=args.host, port=args.port)
+    logger.info(f"Serving on http://{args.host}:{http_server.server_address[1]}")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        job_server.shutdown()
+        if approvals is not None:
+            approvals.close()
+        backends.close()
+
+
 def train():
     """
     Train the crew for a given number of iterations.
@@ -79,6 +162,35 @@ def replay():
     except Exception as e:
         raise Exception(f"An error occurred while replaying the crew: {e}")
 
+def resume():
+    """
+    Resume crew jobs from their checkpoints: the completed stages are skipped, only the remaining ones are run.
+    """
+    import argparse
+    from research_assistant.crew import resume as _resume
+    from research_assistant.tools.checkpoints import get_checkpoint_store
+
+    parser = argparse.ArgumentParser(description=resume.__doc__)
+    parser.add_argument("job_ids", nargs="*", help="IDs of the jobs to resume. Defaults to every job without a final report.")
+    args = parser.parse_args()
+
+    store = get_checkpoint_store()
+    if store is None:
+        raise SystemExit("Checkpoints are disabled (CHECKPOINT_DIR is empty)")
+    job_ids = args.job_ids or store.incomplete()
+    logger.info(f"Resuming {len(job_ids)} jobs")
+    failed = []
+    for job_id in job_ids:
+        # a job that fails again keeps its checkpoint and does not stop the other jobs
+        try:
+            _resume(job_id)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed to resume: {e!r}")
+            failed.append(job_id)
+    logger.info(f"Time per stage: {get_tracer().stats()}")
+    if failed:
+        raise SystemExit(f"{len(failed)} of {len(job_ids)} jobs failed to resume: {', '.join(failed)}")
+
 def test():
     """
     Test the crew execution and returns the results.
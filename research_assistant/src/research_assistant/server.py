@@ -0,0 +1,476 @@
+import os, json, time, uuid, threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+from research_assistant.crew import ResearchAssistant, kickoff, shape_of, prepare, fold, propose_models, selection_outputs, rejected_outputs
+from research_assistant.tools.tracing import get_tracer
+from research_assistant.tools.llm_cache import get_llm_cache
+from research_assistant.tools.approvals import APPROVE, REJECT
+from research_assistant.tools.workspace import Workspace
+
+
+class JobRejected(Exception):
+    """Raised by JobServer.submit when admission control rejects a job."""
+
+
+class CrewPool:
+    """
+    Pool of pre-built ResearchAssistant crews, by shape (see ResearchAssistant.shape). Building a crew reads
+    agents.yaml and tasks.yaml and creates every Agent, Tool and Task; a pooled crew is only reset for the next job.
+    A crew is used by one job at a time.
+    """
+    def __init__(self, llm=None):
+        """
+        llm: LLM of the agents of the crews. Defaults to the crewai default LLM.
+        """
+        self.llm = llm
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.stats = {'built': 0, 'reused': 0}
+
+    def _build(self, precomputed=None, feedback=None, task_names=None, workspace=None):
+        assistant = ResearchAssistant(precomputed=precomputed, feedback=feedback, task_names=task_names, workspace=workspace, llm=self.llm)
+        with self._lock:
+            self.stats['built'] += 1
+        return assistant
+
+    def warm(self, shapes, n=1):
+        """
+        Build n crews of each shape ahead of the jobs
+        shapes: list of dict, keyword arguments of ResearchAssistant describing a shape, e.g.
+            {'precomputed': {'preprocess_task': "", 'model_selection_task': ""}}. Only the keys of precomputed and feedback matter.
+        n: int, number of crews per shape
+        """
+        for kwargs in shapes:
+            for _ in range(n):
+                assistant = self._build(**kwargs)
+                assistant.crew()
+                with self._lock:
+                    self._idle.setdefault(assistant.shape(), []).append(assistant)
+
+    @contextmanager
+    def assistant(self, precomputed=None, feedback=None, task_names=None, workspace=None):
+        """
+        Check out a crew of the shape of the job, reset for the job, and return it to the pool afterwards.
+        Same arguments as ResearchAssistant. Can be passed as the `assistant` of crew.kickoff.
+        """
+        shape = shape_of(precomputed or {}, feedback or {}, task_names)
+        with self._lock:
+            idle = self._idle.get(shape)
+            assistant = idle.pop() if idle else None
+            if assistant is not None:
+                self.stats['reused'] += 1
+        if assistant is None:
+            assistant = self._build(precomputed=precomputed, feedback=feedback, task_names=task_names, workspace=workspace)
+        else:
+            assistant.reset(precomputed=precomputed, feedback=feedback, workspace=workspace)
+        yield assistant
+        # not reached when the run raised: a crew left in the middle of a run is not reused
+        with self._lock:
+            self._idle.setdefault(shape, []).append(assistant)
+
+
+# the shape of jobs whose input is read by the sequence parser and whose proposal is accepted
+DEFAULT_SHAPES = [
+    {'precomputed': {'preprocess_task': "", 'model_selection_task': ""}},
+    {'precomputed': {'preprocess_task': "", 'model_selection_task': "", 'esmfold_task': ""}},
+]
+
+
+class Job:
+    def __init__(self, tenant, message, feedback=None):
+        self.id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.message = message
+        self.feedback = feedback
+        self.state = "queued"
+        # stages of a job waiting for the approval of its proposal, see JobServer._run
+        self.stage = "prepare"
+        self.workspace = None
+        self.precomputed = None
+        self.selection_feedback = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def status(self):
+        return {
+            'id': self.id,
+            'tenant': self.tenant,
+            'state': self.state,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class JobServer:
+    """
+    Runs ResearchAssistant jobs concurrently on pooled crews.
+    Jobs wait in one FIFO queue per tenant, and workers take the next job from the tenants in round-robin order,
+    so a tenant submitting many jobs does not delay the jobs of the other tenants.
+    Admission control rejects jobs when the queue, or the tenant's share of it, is full.
+    With an approval queue, a job whose model selection proposal is not approved by the policy leaves its worker
+    (state "awaiting_approval") until the proposal is decided, then goes back to the front of its tenant's queue.
+    """
+    def __init__(self, workers=4, max_queued=100, max_queued_per_tenant=20, pool=None, warm=1, keep_finished=10000, approvals=None):
+        """
+        workers: int, number of jobs running at the same time
+        max_queued: int, maximum number of queued jobs, all tenants together
+        max_queued_per_tenant: int, maximum number of queued jobs of a tenant
+        pool: CrewPool, pool of pre-built crews. Defaults to a new pool with the crewai default LLM.
+        warm: int, number of crews of each of the DEFAULT_SHAPES built per worker at start
+        keep_finished: int, number of finished jobs kept for status and result queries
+        approvals: ApprovalQueue, where the proposals of the jobs submitted without feedback wait for approval
+            (see tools/approvals.py). Defaults to None: jobs submitted without feedback accept the proposal.
+        """
+        self.max_queued = max_queued
+        self.max_queued_per_tenant = max_queued_per_tenant
+        self.pool = pool or CrewPool()
+        self.keep_finished = keep_finished
+        self.approvals = approvals
+        if approvals is not None:
+            approvals.on_decision = self._resume
+        self._cond = threading.Condition()
+        self._queues = OrderedDict() # tenant -> deque of jobs, in round-robin order
+        self._jobs = {}
+        self._finished = deque()
+        self._queued = 0
+        self._running = 0
+        self._awaiting_approval = 0
+        self._stopping = False
+        self._started = time.time()
+        self._latencies = deque(maxlen=1000)
+        self._counts = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        if warm:
+            self.pool.warm(DEFAULT_SHAPES, n=warm * workers)
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, tenant, message, feedback=None):
+        """
+        Queue a job
+        tenant: str, the tenant submitting the job
+        message: str, the user's message
+        feedback: str, feedback on the model selection proposal, "" accepts the proposal. Defaults to None: the proposal
+            waits in the approval queue, or is accepted if the server has no approval queue.
+        return: str, job ID
+        """
+        with self._cond:
+            if self._stopping:
+                raise JobRejected("The server is shutting down")
+            if self._queued >= self.max_queued:
+                self._counts['rejected'] += 1
+                raise JobRejected(f"The queue is full ({self._queued} jobs)")
+            queue = self._queues.get(tenant)
+            if queue is not None and len(queue) >= self.max_queued_per_tenant:
+                self._counts['rejected'] += 1
+                raise JobRejected(f"Tenant {tenant} has {len(queue)} queued jobs")
+            job = Job(tenant, message, feedback)
+            self._queues.setdefault(tenant, deque()).append(job)
+            self._jobs[job.id] = job
+            self._queued += 1
+            self._counts['submitted'] += 1
+            self._cond.notify()
+        return job.id
+
+    def _next_job(self):
+        # round-robin: take the first tenant's oldest job, then move the tenant to the back
+        tenant, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[tenant]
+        if queue:
+            self._queues[tenant] = queue
+        self._queued -= 1
+        return job
+
+    def _decided(self, job, approval):
+        selected, feedback = selection_outputs(approval.proposal, approval.num_chains, approval.feedback) if approval.decision == APPROVE \
+            else rejected_outputs(approval.feedback)
+        job.precomputed.update(selected)
+        job.selection_feedback = feedback
+        job.stage = "fold"
+
+    def _run(self, job):
+        """
+        Run a job. With an approval queue, the job runs in two stages: "prepare" (preprocess and proposal) and
+        "fold", and is parked in between while its proposal waits for the reviewer.
+        return: tuple, (whether the job is parked, the final report)
+        """
+        if self.approvals is None or job.feedback is not None:
+            feedback = job.feedback or ""
+            return False, kickoff(job.message, ask_human=lambda proposal: feedback, assistant=self.pool.assistant)
+        if job.stage == "prepare":
+            job.workspace = Workspace()
+            with get_tracer().span("job.prepare", trace_id=job.workspace.job_id):
+                job.precomputed = prepare(job.message, job.workspace, self.pool.assistant)
+            proposal, num_chains = propose_models(job.precomputed['preprocess_task'])
+            if proposal is None:
+                # the model selection agent makes the proposal: nobody answers its prompt, it keeps its proposal
+                job.selection_feedback = {'model_selection_task': "No feedback, keep the initial proposal."}
+                job.stage = "fold"
+            else:
+                # parked before the proposal is visible to the reviewer, so that _resume sees every decision
+                with self._cond:
+                    job.state = "awaiting_approval"
+                    self._awaiting_approval += 1
+                approval = self.approvals.submit(job.id, proposal, num_chains)
+                if approval.decided_by != "policy":
+                    return True, None
+                with self._cond:
+                    job.state = "running"
+                    self._awaiting_approval -= 1
+                self._decided(job, approval)
+        with get_tracer().span("job", trace_id=job.workspace.job_id):
+            return False, fold(job.message, job.precomputed, job.selection_feedback, job.workspace, self.pool.assistant)
+
+    def _resume(self, approval):
+        # called by the approval queue: the job goes back to the front of its tenant's queue for the fold stage
+        with self._cond:
+            job = self._jobs.get(approval.job_id)
+            if job is None or job.state != "awaiting_approval":
+                return
+            self._decided(job, approval)
+            job.state = "queued"
+            self._awaiting_approval -= 1
+            self._queues.setdefault(job.tenant, deque()).appendleft(job)
+            self._queued += 1
+            self._cond.notify()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queues and not self._stopping:
+                    self._cond.wait()
+                if not self._queues:
+                    return
+                job = self._next_job()
+                job.state = "running"
+                if job.started_at is None:
+                    job.started_at = time.time()
+                    self._latencies.append(job.started_at - job.submitted_at)
+                self._running += 1
+            try:
+                parked, job.result = self._run(job)
+                state = "done"
+            except Exception as e:
+                logger.exception(f"Job {job.id} of tenant {job.tenant} failed")
+                parked, job.error = False, str(e)
+                state = "failed"
+            with self._cond:
+                self._running -= 1
+                if parked:
+                    # the job is resumed by the approval queue, maybe already
+                    continue
+                job.state = state
+                job.finished_at = time.time()
+                self._counts['completed' if state == "done" else 'failed'] += 1
+                self._finished.append(job.id)
+                while len(self._finished) > self.keep_finished:
+                    del self._jobs[self._finished.popleft()]
+            job.done.set()
+
+    def _job(self, job_id):
+        with self._cond:
+            if job_id not in self._jobs:
+                raise KeyError(f"Unknown job {job_id}")
+            return self._jobs[job_id]
+
+    def status(self, job_id):
+        """
+        return: dict, the state of the job: queued, running, done or failed, and its timestamps
+        """
+        return self._job(job_id).status()
+
+    def result(self, job_id, timeout=None):
+        """
+        Wait for a job to finish
+        job_id: str, job ID
+        timeout: float, seconds to wait. Defaults to None, which waits until the job finishes.
+        return: str, the final report, or None if the job did not finish within timeout
+        """
+        job = self._job(job_id)
+        if not job.done.wait(timeout):
+            return None
+        if job.state == "failed":
+            raise RuntimeError(f"Job {job_id} failed: {job.error}")
+        return job.result
+
+    def metrics(self):
+        """
+        return: dict, queue depth (total and per tenant), running jobs, job counters, queue latency percentiles
+            over the last 1000 jobs, throughput since the start, crew pool counters, and LLM response cache counters
+        """
+        with self._cond:
+            latencies = sorted(self._latencies)
+            elapsed = time.time() - self._started
+            metrics = {
+                'queued': self._queued,
+                'queued_per_tenant': {tenant: len(queue) for tenant, queue in self._queues.items()},
+                'running': self._running,
+                'awaiting_approval': self._awaiting_approval,
+                **self._counts,
+                'throughput_jobs_per_second': self._counts['completed'] / elapsed if elapsed else 0.0,
+            }
+        metrics['queue_latency_p50'] = latencies[len(latencies) // 2] if latencies else 0.0
+        metrics['queue_latency_p95'] = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+        metrics['crew_pool'] = dict(self.pool.stats)
+        if self.approvals is not None:
+            metrics['approvals'] = dict(self.approvals.stats)
+        llm_cache = get_llm_cache()
+        if llm_cache is not None:
+            metrics['llm_cache'] = llm_cache.stats()
+        return metrics
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting jobs. Queued jobs are still run, jobs awaiting approval are not.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    job_server = None
+
+    def _send(self, status, payload):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _approvals(self, parts, request):
+        approvals = self.job_server.approvals
+        if approvals is None:
+            return self._send(404, {'error': "The server has no approval queue"})
+        if parts == ["approvals"]:
+            return self._send(200, {'approved': approvals.approve_all(request.get('job_ids'), feedback=request.get('feedback', ""))})
+        decision = request.get('decision', APPROVE)
+        if decision == APPROVE:
+            decided = approvals.approve(parts[1], feedback=request.get('feedback', ""))
+        elif decision == REJECT:
+            decided = approvals.reject(parts[1], reason=request.get('feedback', ""))
+        else:
+            return self._send(400, {'error': f"Invalid decision {decision}"})
+        if not decided:
+            return self._send(404, {'error': f"No pending proposal for job {parts[1]}"})
+        self._send(200, {'id': parts[1], 'decision': decision})
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if parts[0] == "approvals" and len(parts) <= 2:
+                return self._approvals(parts, request)
+            if parts != ["jobs"]:
+                return self._send(404, {'error': "Not found"})
+            job_id = self.job_server.submit(request.get('tenant', "default"), request['message'], request.get('feedback'))
+        except JobRejected as e:
+            return self._send(429, {'error': str(e)})
+        except (KeyError, ValueError) as e:
+            return self._send(400, {'error': f"Invalid request: {e}"})
+        self._send(202, {'id': job_id})
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        try:
+            if parts == ["metrics"]:
+                return self._send(200, self.job_server.metrics())
+            if parts == ["metrics", "prometheus"]:
+                return self._send(200, get_tracer().prometheus())
+            if parts == ["approvals"] and self.job_server.approvals is not None:
+                return self._send(200, self.job_server.approvals.pending())
+            if len(parts) == 2 and parts[0] == "jobs":
+                return self._send(200, self.job_server.status(parts[1]))
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                status = self.job_server.status(parts[1])
+                if status['state'] in ("queued", "running", "awaiting_approval"):
+                    return self._send(202, status)
+                if status['state'] == "failed":
+                    return self._send(500, status)
+                return self._send(200, {**status, 'result': self.job_server.result(parts[1])})
+        except KeyError as e:
+            return self._send(404, {'error': str(e)})
+        self._send(404, {'error': "Not found"})
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(job_server, host="127.0.0.1", port=8000):
+    """
+    Expose a JobServer over HTTP:
+    POST /jobs {"tenant", "message", "feedback"} -> 202 {"id"}, or 429 when the job is rejected.
+        Without feedback, the proposal of the job waits in the approval queue of the server, if it has one.
+    GET /jobs/<id> -> status of the job
+    GET /jobs/<id>/result -> 200 with the report when the job is done, 202 while it is queued, running or awaiting approval
+    GET /approvals -> the proposals waiting for approval
+    POST /approvals {"job_ids", "feedback"} -> approve the proposals of the jobs, all pending proposals without job_ids
+    POST /approvals/<id> {"decision": "approve" or "reject", "feedback"} -> decide the proposal of a job
+    GET /metrics -> queue and throughput metrics
+    GET /metrics/prometheus -> p50/p95 duration of each stage of the jobs and tokens per agent, in the Prometheus text format
+    return: ThreadingHTTPServer, call serve_forever() to handle requests
+    """
+    handler = type("JobServerHandler", (_Handler,), {'job_server': job_server})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@contextmanager
+def use_stub_backends(esmfold_delay=0.0, boltz_load_seconds=0.0, boltz_predict_seconds=0.0):
+    """
+    Configure the fold backends with local stand-ins: a stub ESMFold endpoint and a Boltz worker with the stub runner.
+    The MSA store is left as configured: the stub runner writes the MSAs of the chains it is asked to fetch, so the
+    Boltz jobs harvest and reuse them as with Boltz.
+    On exit the stub ESMFold server is stopped, the Boltz worker is drained, its socket is removed and the
+    environment is restored.
+
+    # Example usage:
+    ```python
+    with use_stub_backends() as esmfold:
+        report = kickoff(message, assistant=CrewPool(llm=ScriptedLLM()).assistant)
+    ```
+    yield: the stub ESMFold server
+    """
+    from research_assistant.tools.stubs import start_stub_esmfold_server
+    from research_assistant.tools.boltz_worker import get_boltz_worker
+    environ = {
+        'ESMFOLD_URL': None,
+        'BOLTZ_BACKEND': "worker",
+        'BOLTZ_WORKER_RUNNER': "stub",
+    }
+    previous = {name: os.environ.get(name) for name in environ}
+    server, environ['ESMFOLD_URL'] = start_stub_esmfold_server(delay=esmfold_delay)
+    os.environ.update(environ)
+    worker = get_boltz_worker()
+    previous_runner = (worker.runner, worker.runner_kwargs)
+    worker.runner = "stub"
+    worker.runner_kwargs = {'load_seconds': boltz_load_seconds, 'predict_seconds': boltz_predict_seconds}
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        worker.close()
+        worker.runner, worker.runner_kwargs = previous_runner
+        if os.path.exists(worker.address):
+            os.remove(worker.address)
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
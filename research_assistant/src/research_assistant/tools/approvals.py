@@ -0,0 +1,200 @@
+"""
+Approval of the model selection proposals without waiting on a human:
+- a policy approves the proposals that leave nothing to decide (see unambiguous)
+- the other proposals wait in an ApprovalQueue, which a reviewer works through at their own pace, one by one or
+  in bulk. A proposal that is not decided before its deadline gets the default action.
+The job server parks the jobs whose proposal is pending and frees the worker: jobs waiting on a human don't
+hold back the other jobs.
+"""
+import time, threading
+from loguru import logger
+
+from research_assistant.tools.model_selection import NO_SUITABLE_MODEL
+
+
+APPROVE = "approve"
+REJECT = "reject"
+
+
+def unambiguous(proposal, num_chains):
+    """
+    Default auto-approve policy: the rules of the model selection left no choice. A structure with several chains
+    can only be folded by Boltz, and a single chain is folded by every model. A proposal without a suitable model
+    (e.g. no valid chain in the input) needs a human.
+    proposal: ModelSelectionOutput, from model_selection.select_models
+    num_chains: int, number of chains of the structure
+    return: bool, whether to approve the proposal without asking
+    """
+    return num_chains >= 1 and NO_SUITABLE_MODEL not in proposal.selected_models
+
+
+def never(proposal, num_chains):
+    """
+    Policy that sends every proposal to the reviewer
+    """
+    return False
+
+
+class Approval:
+    """
+    The decision on the proposal of a job
+    """
+    def __init__(self, job_id, proposal, num_chains, deadline, default):
+        self.job_id = job_id
+        self.proposal = proposal
+        self.num_chains = num_chains
+        self.created_at = time.time()
+        self.deadline = deadline
+        self.default = default
+        self.decision = None # APPROVE or REJECT
+        self.feedback = ""
+        self.decided_by = None # "policy", "reviewer" or "deadline"
+        self.decided_at = None
+        self.done = threading.Event()
+
+    def status(self):
+        return {
+            'job_id': self.job_id,
+            'proposal': str(self.proposal),
+            'num_chains': self.num_chains,
+            'created_at': self.created_at,
+            'deadline': self.deadline,
+            'default': self.default,
+            'decision': self.decision,
+            'feedback': self.feedback,
+            'decided_by': self.decided_by,
+            'decided_at': self.decided_at,
+        }
+
+
+class ApprovalQueue:
+    """
+    Pending model selection proposals, decided by a policy, by a reviewer, or by their deadline.
+    `on_decision` is called with the Approval once the reviewer or the deadline decided it, from the thread that
+    decided it. Proposals approved by the policy are returned decided by submit, without calling on_decision.
+    """
+    def __init__(self, policy=unambiguous, timeout=3600.0, default=APPROVE, on_decision=None):
+        """
+        policy: callable (proposal, num_chains) -> bool, approves proposals without the reviewer. See unambiguous and never.
+        timeout: float, seconds a proposal waits for the reviewer before the default action. None waits forever.
+        default: str, APPROVE or REJECT, the action on proposals past their deadline
+        on_decision: callable, called with each Approval decided by the reviewer or the deadline
+        """
+        if default not in (APPROVE, REJECT):
+            raise ValueError(f"Invalid default action {default}, must be {APPROVE} or {REJECT}")
+        self.policy = policy
+        self.timeout = timeout
+        self.default = default
+        self.on_decision = on_decision
+        self._cond = threading.Condition()
+        self._pending = {} # job ID -> Approval, in order of submission
+        self._closed = False
+        self.stats = {'policy': 0, 'reviewer': 0, 'deadline': 0}
+        self._expirer = threading.Thread(target=self._expire_loop, daemon=True)
+        self._expirer.start()
+
+    def submit(self, job_id, proposal, num_chains):
+        """
+        Ask for the approval of the proposal of a job
+        proposal: ModelSelectionOutput
+        num_chains: int, number of chains of the structure
+        return: Approval, already decided if the policy approved it
+        """
+        approval = Approval(job_id, proposal, num_chains, time.time() + self.timeout if self.timeout is not None else None, self.default)
+        if self.policy(proposal, num_chains):
+            self._decide(approval, APPROVE, "", "policy", notify=False)
+            return approval
+        with self._cond:
+            self._pending[job_id] = approval
+            self._cond.notify_all()
+        logger.info(f"Proposal of job {job_id} waits for approval: {proposal}")
+        return approval
+
+    def _decide(self, approval, decision, feedback, decided_by, notify=True):
+        approval.decision = decision
+        approval.feedback = feedback
+        approval.decided_by = decided_by
+        approval.decided_at = time.time()
+        with self._cond:
+            self.stats[decided_by] += 1
+        approval.done.set()
+        if notify and self.on_decision is not None:
+            self.on_decision(approval)
+
+    def _pop(self, job_ids):
+        with self._cond:
+            return [self._pending.pop(job_id) for job_id in job_ids if job_id in self._pending]
+
+    def approve(self, job_id, feedback=""):
+        """
+        Approve the proposal of a job
+        feedback: str, changes to the proposal, e.g. "only Boltz", read like the feedback of a human at the prompt
+        return: bool, whether the job had a pending proposal
+        """
+        return len(self.approve_all([job_id], feedback=feedback)) == 1
+
+    def reject(self, job_id, reason=""):
+        """
+        Reject the proposal of a job: no model is run
+        return: bool, whether the job had a pending proposal
+        """
+        approvals = self._pop([job_id])
+        for approval in approvals:
+            self._decide(approval, REJECT, reason, "reviewer")
+        return len(approvals) == 1
+
+    def approve_all(self, job_ids=None, feedback=""):
+        """
+        Approve many proposals at once
+        job_ids: list[str], jobs to approve. Defaults to all pending jobs.
+        feedback: str, feedback given to each job
+        return: list[str], the jobs that were approved
+        """
+        with self._cond:
+            job_ids = list(self._pending) if job_ids is None else job_ids
+        approvals = self._pop(job_ids)
+        for approval in approvals:
+            self._decide(approval, APPROVE, feedback, "reviewer")
+        if approvals:
+            logger.info(f"Approved the proposals of {len(approvals)} jobs")
+        return [approval.job_id for approval in approvals]
+
+    def pending(self):
+        """
+        return: list[dict], the pending proposals, oldest first
+        """
+        with self._cond:
+            return [approval.status() for approval in self._pending.values()]
+
+    def expire(self, now=None):
+        """
+        Apply the default action to the proposals past their deadline
+        return: list[str], the jobs that were decided
+        """
+        now = time.time() if now is None else now
+        with self._cond:
+            expired = [job_id for job_id, approval in self._pending.items() if approval.deadline is not None and approval.deadline <= now]
+        approvals = self._pop(expired)
+        for approval in approvals:
+            logger.warning(f"No decision on the proposal of job {approval.job_id} before its deadline: {approval.default}")
+            self._decide(approval, approval.default, "", "deadline")
+        return [approval.job_id for approval in approvals]
+
+    def _expire_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                deadlines = [a.deadline for a in self._pending.values() if a.deadline is not None]
+                self._cond.wait(max(0.0, min(deadlines) - time.time()) if deadlines else None)
+                if self._closed:
+                    return
+            self.expire()
+
+    def close(self):
+        """
+        Stop the deadline thread. Pending proposals stay pending.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
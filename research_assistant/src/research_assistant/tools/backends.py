@@ -0,0 +1,110 @@
+"""
+Registry of the fold backends of the crew. A backend is registered by name with the import path of its tool, and
+its tool module is imported the first time an agent of the backend is built: a crew only imports and builds the
+backends it runs (see ResearchAssistant.crew).
+
+Adding a backend, e.g. IgFold:
+1. write its tool, a crewai BaseTool returning the str of a FoldToolOutput, e.g. research_assistant.tools.igfold_tool:IgFoldTool
+2. add its agent to config/agents.yaml and its task to config/tasks.yaml (without an `agent:` key, the crew sets it)
+3. register it:
+```python
+register_backend(FoldBackend("IgFold", tool="research_assistant.tools.igfold_tool:IgFoldTool",
+                             agent="igfold_agent", task="igfold_task", max_chains=2, pattern=r"\\big[\\s\\-_]?fold\\b"))
+```
+The model selection rules (tools/model_selection.py) then propose it for the structures it can fold.
+"""
+import re, importlib, threading
+
+
+class FoldBackend:
+    """
+    A fold backend: its tool, the agent and task of the crew that run it, and the structures it can fold
+    """
+    def __init__(self, name, tool, agent, task, max_chains=None, pattern=None):
+        """
+        name: str, name of the model, e.g. "ESMFold", as selected by the model selection
+        tool: str, import path of the tool class, "module:Class"
+        agent: str, name of the agent in config/agents.yaml
+        task: str, name of the task in config/tasks.yaml
+        max_chains: int, maximum number of chains of a structure. Defaults to None: no limit.
+        pattern: str, regular expression of the names people use for the model, e.g. "Boltz-1". Defaults to the name.
+        """
+        self.name = name
+        self.tool = tool
+        self.agent = agent
+        self.task = task
+        self.max_chains = max_chains
+        self.pattern = re.compile(pattern or rf"\b{re.escape(name)}\b", re.IGNORECASE)
+        self._tool_class = None
+
+    def tool_class(self):
+        """
+        return: the tool class, imported on first use
+        """
+        if self._tool_class is None:
+            module, name = self.tool.split(":")
+            self._tool_class = getattr(importlib.import_module(module), name)
+        return self._tool_class
+
+    def supports(self, num_chains):
+        """
+        return: bool, whether the backend can fold a structure with num_chains chains
+        """
+        return self.max_chains is None or num_chains <= self.max_chains
+
+
+# name -> FoldBackend, in the order the models are recommended and reported
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(backend):
+    """
+    Register a fold backend, or replace the backend of the same name
+    backend: FoldBackend
+    """
+    with _backends_lock:
+        _backends[backend.name] = backend
+    return backend
+
+
+def get_backend(name):
+    """
+    return: FoldBackend
+    """
+    try:
+        return _backends[name]
+    except KeyError:
+        raise ValueError(f"Unknown fold backend {name}, registered backends: {list(_backends)}")
+
+
+def backends():
+    """
+    return: list[FoldBackend], the registered backends in order
+    """
+    with _backends_lock:
+        return list(_backends.values())
+
+
+def backend_names():
+    """
+    return: list[str], names of the registered backends in order
+    """
+    return [backend.name for backend in backends()]
+
+
+def folding_tasks():
+    """
+    return: dict, model name -> name of its folding task, in the order of the final report
+    """
+    return {backend.name: backend.task for backend in backends()}
+
+
+register_backend(FoldBackend(
+    "ESMFold", tool="research_assistant.tools.esmfold_tool:ESMFoldTool", agent="esmfold_agent", task="esmfold_task",
+    max_chains=1, pattern=r"\besm[\s\-_]?fold(?:[\s\-_]?v?\d)?\b",
+))
+register_backend(FoldBackend(
+    "Boltz", tool="research_assistant.tools.boltz_tool:BoltzTool", agent="boltz_agent", task="boltz_task",
+    pattern=r"\bboltz(?:[\s\-_]?v?\d)?\b",
+))
@@ -0,0 +1,303 @@
+import os, re, csv, json, time, queue, hashlib, threading
+from loguru import logger
+
+from research_assistant.tools.cache import normalize_sequence
+from research_assistant.tools.validation import validate_sequences
+from research_assistant.tools.model_selection import select_models
+
+
+def read_fasta(path):
+    """
+    Stream the records of a FASTA file. Chains of a complex are separated by ":" in the sequence, e.g. "SEQ1:SEQ2".
+    path: str, path to the FASTA file
+    yield: dict, with keys id (first word of the header) and sequences
+    """
+    with open(path, "r") as f:
+        record_id, lines = None, []
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if record_id is not None:
+                    yield {'id': record_id, 'sequences': "".join(lines).split(":")}
+                record_id = line[1:].split()[0] if line[1:].split() else ""
+                lines = []
+            elif line and record_id is not None:
+                lines.append(line)
+        if record_id is not None:
+            yield {'id': record_id, 'sequences': "".join(lines).split(":")}
+
+
+def read_csv(path):
+    """
+    Stream the records of a CSV file with an `id` (or `name`) column and a `sequence` (or `sequences`) column.
+    Chains of a complex are separated by ":".
+    path: str, path to the CSV file
+    yield: dict, with keys id and sequences
+    """
+    with open(path, "r", newline="") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            sequences = row.get('sequence') or row.get('sequences') or ""
+            yield {'id': row.get('id') or row.get('name') or f"record{i}", 'sequences': sequences.split(":")}
+
+
+def read_jsonl(path):
+    """
+    Stream the records of a JSON lines file, one {"id": ..., "sequences": [...]} (or "sequence": "...") object per line
+    path: str, path to the JSONL file
+    yield: dict, with keys id and sequences
+    """
+    with open(path, "r") as f:
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            sequences = record.get('sequences') or record.get('sequence') or []
+            if isinstance(sequences, str):
+                sequences = sequences.split(":")
+            yield {'id': str(record.get('id') or record.get('name') or f"record{i}"), 'sequences': sequences}
+
+
+READERS = {
+    '.fasta': read_fasta,
+    '.fa': read_fasta,
+    '.faa': read_fasta,
+    '.csv': read_csv,
+    '.jsonl': read_jsonl,
+}
+
+
+def read_records(path):
+    """
+    Stream the records of a FASTA, CSV or JSONL file, selected by the file extension
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Unsupported input format {ext}, expected one of {sorted(READERS)}")
+    return READERS[ext](path)
+
+
+class Manifest:
+    """
+    Thread-safe JSON lines writer of the batch results, flushed after every line so that results are
+    visible as soon as they finish and a crashed run keeps what it completed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, "w")
+        self.counts = {'results': 0, 'failed': 0, 'duplicates': 0, 'invalid': 0, 'rejected': 0}
+
+    def write(self, entry, count='results'):
+        line = json.dumps(entry)
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+            self.counts[count] += 1
+            if count == 'results' and not entry.get('success'):
+                self.counts['failed'] += 1
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+def _record_key(sequences):
+    # 16 bytes per unique record is all the dedupe index keeps in memory
+    h = hashlib.sha256()
+    for seq in sequences:
+        h.update(seq.encode("ascii", errors="replace"))
+        h.update(b":")
+    return h.digest()[:16]
+
+
+def _safe_name(record_id, key):
+    # unique and usable as a file name, even when ids repeat or contain path separators
+    return f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', record_id)[:64]}_{key.hex()[:8]}"
+
+
+def run_batch(input_path, output_dir="output/batch", models=("ESMFold", "Boltz"), esmfold_concurrency=8, boltz_batch_size=8,
+              boltz_workers=1, queue_size=64, use_msa_server=True, esmfold_url=None, report_every=10.0):
+    """
+    Fold every record of a large FASTA/CSV/JSONL file with the fold backends, without loading the input in memory.
+    Records are streamed through bounded queues to the backends: single chains go to ESMFold (esmfold_concurrency
+    requests in flight) and all records to Boltz, in batches of boltz_batch_size structures per Boltz run.
+    Models are selected with the rules of the model selection agent. Identical records are folded once.
+    Results are written to <output_dir>/manifest.jsonl as they finish, one line per record and model, with the
+    confidence of the successful predictions (mean_plddt, confident_fraction, chain_plddt, ptm, iptm).
+    ESMFold predictions are written in the format of the environment variable ESMFOLD_OUTPUT_FORMAT, e.g. "pdb.gz".
+    All predictions are also added to the results store (see results_store.get_results_store).
+    Boltz jobs are checked against the GPU memory before they are queued (see resources.get_fold_scheduler): a structure
+    that would not fit is not run by Boltz, and its manifest line gives the reason. The Boltz jobs of a window of
+    queue_size records are run longest first, in batches of similar sizes, and concurrent Boltz runs share the GPU memory.
+    Memory use is bounded by the queue sizes, plus 16 bytes and the id of each unique record for the dedupe index.
+    input_path: str, path to a .fasta/.fa/.faa, .csv or .jsonl file
+    output_dir: str, the directory to save the predictions and the manifest to
+    models: list[str], the models to run when the rules allow it
+    esmfold_concurrency: int, number of ESMFold requests in flight
+    boltz_batch_size: int, number of structures per Boltz run
+    boltz_workers: int, number of concurrent Boltz runs
+    queue_size: int, maximum number of records waiting for each backend
+    use_msa_server: bool, whether Boltz computes the MSAs with the remote MSA server
+    esmfold_url: str, ESMFold-compatible endpoint. Defaults to the ESMFold NIM endpoint.
+    report_every: float, seconds between two progress logs
+    return: dict, counters of the run and records_per_second
+    """
+    from research_assistant.tools.esmfold_tool import predict_with_esmfold, esmfold_output_suffix
+    from research_assistant.tools.boltz_batch import predict_with_boltz_batch
+    from research_assistant.tools.confidence import summarize_predictions, try_summarize_prediction, confidence_fields
+    from research_assistant.tools.results_store import get_results_store
+    from research_assistant.tools.resources import get_fold_scheduler
+
+    esmfold_dir = os.path.join(output_dir, "esmfold_result")
+    suffix = esmfold_output_suffix()
+    boltz_input_dir = os.path.join(output_dir, "boltz_input")
+    boltz_result_dir = os.path.join(output_dir, "boltz_result")
+    os.makedirs(esmfold_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, "manifest.jsonl"))
+    store = get_results_store()
+    scheduler = get_fold_scheduler()
+
+    esmfold_queue = queue.Queue(maxsize=queue_size)
+    boltz_queue = queue.Queue(maxsize=max(1, queue_size // boltz_batch_size))
+    stats = {'records': 0, 'unique': 0, 'esmfold_jobs': 0, 'boltz_jobs': 0}
+    start = time.perf_counter()
+
+    def _esmfold_worker():
+        while True:
+            job = esmfold_queue.get()
+            if job is None:
+                return
+            record_id, name, sequence = job
+            started = time.perf_counter()
+            try:
+                result = predict_with_esmfold(sequence, output_dir=esmfold_dir, output_file_name=f"{name}{suffix}", delete_old_dir=False, query_url=esmfold_url)
+            except Exception as e:
+                # a dead worker would block the reader on the full queue
+                logger.error(f"ESMFold prediction of {name} failed with error: {e}")
+                result = {'success': False, 'output_file_path': None, 'error': str(e)}
+            summary = try_summarize_prediction(result['output_file_path']) if result['success'] else None
+            manifest.write({'id': record_id, 'name': name, 'model': "ESMFold", 'success': result['success'],
+                            'output_file_path': result['output_file_path'], 'error': None if result['success'] else str(result['error']),
+                            **confidence_fields(summary)})
+            if store is not None:
+                # the manifest has the result: a store error is logged, it must not kill the worker and block the reader
+                try:
+                    store.record([sequence], "ESMFold", path=result['output_file_path'], success=result['success'], runtime=time.perf_counter() - started,
+                                 parameters={'query_url': esmfold_url}, confidence=confidence_fields(summary), structure_name=name)
+                except Exception as e:
+                    logger.error(f"Could not record the ESMFold prediction of {name} in {store.path}: {e}")
+
+    def _boltz_worker():
+        while True:
+            batch = boltz_queue.get()
+            if batch is None:
+                return
+            batch_id, jobs, ids, estimate = batch
+            try:
+                # the structures of a batch run one after the other: the batch needs the memory of its largest structure
+                with scheduler.reserve(estimate.memory_gb):
+                    started = time.perf_counter()
+                    results = predict_with_boltz_batch(
+                        jobs,
+                        yaml_dir=os.path.join(boltz_input_dir, f"batch{batch_id}"),
+                        result_dir=os.path.join(boltz_result_dir, f"batch{batch_id}"),
+                        use_msa_server=use_msa_server
+                    )
+            except Exception as e:
+                logger.error(f"Boltz batch {batch_id} failed with error: {e}")
+                results = {name: {'success': False, 'output_file_path': None, 'error': str(e)} for name in jobs}
+            # confidence of the whole batch at once
+            succeeded = [name for name, result in results.items() if result['success']]
+            summaries = dict(zip(succeeded, summarize_predictions([results[name]['output_file_path'] for name in succeeded])))
+            for name, result in results.items():
+                manifest.write({'id': ids[name], 'name': name, 'model': "Boltz", 'success': result['success'],
+                                'output_file_path': result['output_file_path'], 'error': result['error'],
+                                **confidence_fields(summaries.get(name))})
+            # the structures of a batch share the runtime of the Boltz run
+            runtime = (time.perf_counter() - started) / max(1, len(results))
+            for name in succeeded:
+                scheduler.estimator.observe("Boltz", jobs[name], seconds=runtime)
+            if store is not None:
+                try:
+                    store.record_many({'sequences': jobs[name], 'model': "Boltz", 'path': result['output_file_path'], 'success': result['success'],
+                                       'runtime': runtime, 'parameters': {'use_msa_server': use_msa_server}, 'confidence': confidence_fields(summaries.get(name)),
+                                       'structure_name': name} for name, result in results.items())
+                except Exception as e:
+                    logger.error(f"Could not record the predictions of Boltz batch {batch_id} in {store.path}: {e}")
+
+    def _report():
+        elapsed = time.perf_counter() - start
+        return {**stats, **manifest.counts, 'seconds': elapsed, 'records_per_second': stats['records'] / elapsed if elapsed else 0.0}
+
+    done = threading.Event()
+
+    def _reporter():
+        while not done.wait(report_every):
+            logger.info(f"Batch progress: {_report()}")
+
+    esmfold_threads = [threading.Thread(target=_esmfold_worker, daemon=True) for _ in range(esmfold_concurrency if "ESMFold" in models else 0)]
+    boltz_threads = [threading.Thread(target=_boltz_worker, daemon=True) for _ in range(boltz_workers if "Boltz" in models else 0)]
+    for worker in esmfold_threads + boltz_threads + [threading.Thread(target=_reporter, daemon=True)]:
+        worker.start()
+
+    def _queue_boltz_jobs(jobs, ids, n_batches):
+        # longest first, so that the last batches to finish are short ones
+        for batch_jobs, estimate in scheduler.plan(jobs, boltz_batch_size):
+            boltz_queue.put((n_batches, batch_jobs, {name: ids[name] for name in batch_jobs}, estimate))
+            n_batches += 1
+        return n_batches
+
+    seen = {}
+    boltz_jobs, boltz_ids, n_batches = {}, {}, 0
+    try:
+        for record in read_records(input_path):
+            stats['records'] += 1
+            sequences = [normalize_sequence(seq) for seq in record['sequences'] if seq.strip()]
+            key = _record_key(sequences)
+            if key in seen:
+                manifest.write({'id': record['id'], 'duplicate_of': seen[key]}, count='duplicates')
+                continue
+            seen[key] = record['id']
+            stats['unique'] += 1
+            name = _safe_name(record['id'], key)
+
+            validation = validate_sequences(sequences)
+            if len(sequences) == 0 or not validation["valid"].all():
+                bad = [i + 1 for i in range(len(sequences)) if not validation["valid"][i]]
+                manifest.write({'id': record['id'], 'name': name, 'success': False,
+                                'error': f"invalid chains {bad}" if bad else "no sequence"}, count='invalid')
+                continue
+
+            selected = [m for m in select_models(len(sequences)).selected_models if m in models]
+            if "ESMFold" in selected:
+                # blocks when ESMFold is behind: the reader never runs ahead of the backends by more than queue_size records
+                esmfold_queue.put((record['id'], name, sequences[0]))
+                stats['esmfold_jobs'] += 1
+            if "Boltz" in selected:
+                decision, estimate, reason = scheduler.admit("Boltz", sequences, alternatives=[m for m in selected if m != "Boltz"])
+                if decision != "run":
+                    manifest.write({'id': record['id'], 'name': name, 'model': "Boltz", 'success': False, 'error': reason,
+                                    'rerouted_to': estimate.model if decision == "reroute" else None}, count='rejected')
+                    continue
+                boltz_jobs[name] = sequences
+                boltz_ids[name] = record['id']
+                stats['boltz_jobs'] += 1
+                if len(boltz_jobs) >= max(queue_size, boltz_batch_size):
+                    n_batches = _queue_boltz_jobs(boltz_jobs, boltz_ids, n_batches)
+                    boltz_jobs, boltz_ids = {}, {}
+        if boltz_jobs:
+            _queue_boltz_jobs(boltz_jobs, boltz_ids, n_batches)
+    finally:
+        for _ in esmfold_threads:
+            esmfold_queue.put(None)
+        for _ in boltz_threads:
+            boltz_queue.put(None)
+        for worker in esmfold_threads + boltz_threads:
+            worker.join()
+        done.set()
+        manifest.close()
+
+    report = _report()
+    logger.success(f"Batch finished: {report['records']} records ({report['unique']} unique) in {report['seconds']:.1f}s, "
+                   f"{report['records_per_second']:.1f} records/s, {report['failed']} failed predictions")
+    return report
@@ -0,0 +1,211 @@
+import os, re, glob, signal
+from loguru import logger
+
+from research_assistant.tools.helpers import write_sequences_to_yaml
+from research_assistant.tools.cache import normalize_sequence
+from research_assistant.tools.msa_store import get_msa_store, prepare_msas, harvest_msas
+from research_assistant.tools.tracing import get_tracer
+from research_assistant.tools.boltz_runner import run_streaming
+
+
+def build_boltz_command(input_path, result_dir, output_format="pdb", use_msa_server=True, devices=1, executable=None):
+    """
+    Build the `boltz predict` command line
+    input_path: str, path to an input YAML file, or to a directory of input YAML files
+    result_dir: str, the directory to save the results to
+    output_format: str, "pdb" or "mmcif"
+    use_msa_server: bool, whether to compute the MSAs with the remote MSA server
+    devices: int, number of devices to use
+    executable: str, the boltz executable. Defaults to env BOLTZ_EXECUTABLE or "boltz".
+    return: list[str], the command
+    """
+    command = [
+        executable or os.getenv("BOLTZ_EXECUTABLE", "boltz"),
+        "predict",
+        input_path,
+        "--out_dir", result_dir,
+        "--devices", str(devices),
+        "--output_format", output_format,
+    ]
+    if use_msa_server:
+        command.append("--use_msa_server")
+    return command
+
+
+def boltz_output_dir(result_dir, input_path):
+    """
+    Boltz writes its results to <result_dir>/boltz_results_<name of the input file or directory>
+    """
+    stem = os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0]
+    return os.path.join(result_dir, f"boltz_results_{stem}")
+
+
+def collect_boltz_predictions(result_dir, input_path, names):
+    """
+    Check which structures Boltz predicted, one by one
+    result_dir: str, the --out_dir of the boltz run
+    input_path: str, the input file or directory of the boltz run
+    names: list[str], names of the structures, i.e. the names of the input YAML files without extension
+    return: dict, name -> {'success', 'output_file_path', 'error'}. output_file_path is the directory of the predictions of that structure.
+    """
+    predictions_dir = os.path.join(boltz_output_dir(result_dir, input_path), "predictions")
+    results = {}
+    for name in names:
+        structure_dir = os.path.join(predictions_dir, name)
+        structures = glob.glob(os.path.join(structure_dir, f"{name}_model_*.pdb")) + glob.glob(os.path.join(structure_dir, f"{name}_model_*.cif"))
+        if structures:
+            results[name] = {
+                'success': True,
+                'output_file_path': structure_dir,
+                'error': None
+            }
+        else:
+            results[name] = {
+                'success': False,
+                'output_file_path': None,
+                'error': f"Boltz did not write a structure for {name} to {structure_dir}"
+            }
+    return results
+
+
+def run_boltz(input_path, result_dir, use_msa_server=True, backend=None, executable=None, on_event=None, timeout=None, idle_timeout=None):
+    """
+    Run a Boltz prediction with the selected backend
+    input_path: str, path to an input YAML file or a directory of input YAML files
+    result_dir: str, the directory to save the results to
+    use_msa_server: bool, whether to compute the MSAs with the remote MSA server
+    backend: str, "subprocess" runs `boltz predict` in a new process, "worker" sends the job to the long-lived Boltz worker.
+        Defaults to env BOLTZ_BACKEND or "subprocess".
+    executable: str, the boltz executable of the subprocess backend
+    on_event: callable, called with the progress events of the subprocess backend, see boltz_runner.run_streaming
+    timeout: float, wall-clock timeout in seconds. Defaults to env BOLTZ_TIMEOUT or 7200. 0 disables it.
+        The worker backend waits for the result of the worker for at most this long, see BoltzWorkerClient.predict.
+    idle_timeout: float, seconds without output after which the subprocess is killed. Defaults to env BOLTZ_IDLE_TIMEOUT or 900. 0 disables it.
+    return: dict, with keys returncode, stdout, stderr, timed_out and error (see boltz_runner.run_streaming).
+        The subprocess backend only returns the last lines of the output. The worker backend adds the peak GPU memory of the job, peak_memory_gb.
+    """
+    backend = backend or os.getenv("BOLTZ_BACKEND", "subprocess")
+    timeout = float(timeout if timeout is not None else os.getenv("BOLTZ_TIMEOUT", 7200)) or None
+    # the subprocess span includes process startup and model loading, the worker backend records them separately
+    # (boltz.worker_start when a worker is started, boltz.worker_inference for the job itself)
+    with get_tracer().span("boltz.run", backend=backend, use_msa_server=use_msa_server) as span:
+        if backend == "worker":
+            from research_assistant.tools.boltz_worker import get_boltz_worker
+            logger.info(f"Sending Boltz prediction of {input_path} to the Boltz worker")
+            try:
+                output = get_boltz_worker().predict(input_path, result_dir, use_msa_server=use_msa_server, timeout=timeout or 0)
+                output.setdefault('timed_out', None)
+            except TimeoutError as e:
+                logger.error(f"Boltz worker timed out: {e}")
+                output = {'returncode': -signal.SIGKILL, 'stdout': "", 'stderr': "", 'timed_out': "wall", 'error': str(e)}
+        elif backend == "subprocess":
+            command = build_boltz_command(input_path, result_dir, use_msa_server=use_msa_server, executable=executable)
+            logger.info(f"Running Boltz prediction with command: {' '.join(command)}")
+            idle_timeout = float(idle_timeout if idle_timeout is not None else os.getenv("BOLTZ_IDLE_TIMEOUT", 900)) or None
+            output = run_streaming(command, on_event=on_event, timeout=timeout, idle_timeout=idle_timeout)
+        else:
+            raise ValueError(f"Unknown Boltz backend: {backend}")
+        span['returncode'] = output['returncode']
+        span['timed_out'] = output['timed_out']
+    return output
+
+
+def parse_failed_examples(stdout):
+    """
+    Number of failed examples reported by boltz, or None if boltz did not get to report it
+    """
+    match = re.search(r"Number of failed examples: (\d+)", stdout or "")
+    return int(match.group(1)) if match else None
+
+
+def predict_with_boltz_batch(jobs, yaml_dir="input/boltz_input/batch", result_dir="output/boltz_result/batch", use_msa_server=True, backend=None, executable=None, msa_store=None, on_event=None):
+    """
+    Predict many structures with a single Boltz invocation, so that process startup, CUDA initialization
+    and checkpoint loading are paid once for the whole batch.
+    jobs: dict, structure name -> list of clean amino acid sequences of the structure. Names must be unique and usable as file names.
+    yaml_dir: str, the directory to write the input YAML files to. It should only contain the inputs of this batch.
+    result_dir: str, the directory to save the results to
+    use_msa_server: bool, whether to compute the MSAs with the remote MSA server
+    backend: str, "subprocess" or "worker", see run_boltz
+    executable: str, the boltz executable of the subprocess backend
+    msa_store: MSAStore, store of previously computed MSAs. Defaults to None, which uses get_msa_store().
+        Only the chains missing from the store are sent to the MSA server.
+    on_event: callable, called with the progress events of the Boltz run, see run_boltz
+    return: dict, structure name -> {'success', 'output_file_path', 'error'}
+
+    # Example usage:
+    ```python
+    results = predict_with_boltz_batch({
+        "keytruda": [light_chain, heavy_chain],
+        "bsa": [bsa],
+    })
+    failed = [name for name, r in results.items() if not r['success']]
+    ```
+    """
+    if not jobs:
+        return {}
+
+    os.makedirs(yaml_dir, exist_ok=True)
+    os.makedirs(result_dir, exist_ok=True)
+
+    if msa_store is None and use_msa_server:
+        msa_store = get_msa_store()
+
+    results = {}
+    names = []
+    clean_jobs = {}
+    msa_misses = {}
+    for name, sequences in jobs.items():
+        sequences = [normalize_sequence(seq) for seq in sequences]
+        msa_paths = None
+        if msa_store is not None:
+            msa_paths, msa_misses[name] = prepare_msas(msa_store, sequences)
+        try:
+            write_sequences_to_yaml(
+                sequences=sequences,
+                output_file=os.path.join(yaml_dir, f"{name}.yaml"),
+                msa_paths=msa_paths
+            )
+            names.append(name)
+            clean_jobs[name] = sequences
+        except ValueError as e:
+            results[name] = {
+                'success': False,
+                'output_file_path': None,
+                'error': str(e)
+            }
+    if not names:
+        return results
+
+    if msa_store is not None:
+        # all MSAs are in the store: no need to contact the MSA server at all
+        use_msa_server = use_msa_server and any(msa_misses.get(name) for name in names)
+
+    logger.info(f"Running Boltz prediction of {len(names)} structures")
+    try:
+        output = run_boltz(yaml_dir, result_dir, use_msa_server=use_msa_server, backend=backend, executable=executable, on_event=on_event)
+    except Exception as e:
+        # e.g. the executable is missing, or the worker died, timed out or failed to start
+        logger.error(f"Failed to run Boltz: {e!r}")
+        for name in names:
+            results[name] = {'success': False, 'output_file_path': None, 'error': str(e)}
+        return results
+
+    results.update(collect_boltz_predictions(result_dir, yaml_dir, names))
+    if msa_store is not None:
+        for name in names:
+            if use_msa_server and msa_misses.get(name):
+                harvest_msas(msa_store, boltz_output_dir(result_dir, yaml_dir), name, clean_jobs[name], msa_misses[name])
+        logger.info(f"MSA store: {msa_store.cache.stats()}")
+    n_failed = sum(not results[name]['success'] for name in names)
+    reported = parse_failed_examples(output['stdout'])
+    if reported is not None and reported != n_failed:
+        logger.warning(f"Boltz reported {reported} failed examples, but {n_failed} structures are missing")
+    if n_failed:
+        logger.error(f"Boltz failed to predict {n_failed}/{len(names)} structures (exit code {output['returncode']})")
+        for name in names:
+            if not results[name]['success'] and output['returncode'] != 0:
+                results[name]['error'] += f"\n{output.get('error') or ''}\n{output['stderr'][-2000:]}"
+    else:
+        logger.success(f"Boltz successfully predicted {len(names)} structures and saved to {result_dir}")
+    return results
@@ -0,0 +1,176 @@
+"""
+Streaming runner of the `boltz predict` subprocess. The output is parsed line by line as it arrives, instead of
+being buffered until the process exits, so that:
+- progress events (input checks, MSA generation, structure prediction, ...) are emitted while Boltz runs
+- a run that stops printing (e.g. stuck on an MSA request) is killed after an idle timeout, and any run after
+  a wall-clock timeout. The whole process group is killed, including the processes started by Boltz.
+- a run that reports a fatal error is stopped early, even if Boltz does not exit by itself
+- only the last lines of the output are kept in memory
+"""
+import os, re, time, queue, signal, threading, subprocess
+from collections import deque
+from loguru import logger
+
+from research_assistant.tools.tracing import get_tracer
+
+
+# stages of a Boltz run, recognized from its output, in order
+STAGE_PATTERNS = [
+    ('download', re.compile(r"Downloading")),
+    ('checking', re.compile(r"Checking input data")),
+    ('processing', re.compile(r"Processing (input data|\d+ inputs?)")),
+    ('msa', re.compile(r"Generating MSA|MSA server|\b(SUBMIT|PENDING|RUNNING|COMPLETE)\b")),
+    ('predicting', re.compile(r"Running structure prediction|Predicting DataLoader")),
+    ('writing', re.compile(r"Number of failed examples")),
+]
+# a traceback alone is not fatal (Boltz logs the ones it recovers from): other failures are known from the exit code
+FATAL_PATTERN = re.compile(r"CUDA out of memory|OutOfMemoryError|^Error: ")
+FRACTION_PATTERN = re.compile(r"(\d+)/(\d+) \[")
+
+
+def parse_progress(line):
+    """
+    Parse a line of the output of Boltz
+    line: str, a line of stdout or stderr. Progress bars are split on carriage returns.
+    return: tuple, (stage or None, fraction done of a progress bar or None, whether the line reports a fatal error)
+    """
+    stage = next((name for name, pattern in STAGE_PATTERNS if pattern.search(line)), None)
+    match = FRACTION_PATTERN.search(line)
+    fraction = int(match.group(1)) / int(match.group(2)) if match and int(match.group(2)) else None
+    return stage, fraction, bool(FATAL_PATTERN.search(line))
+
+
+def _read_lines(pipe, name, lines):
+    # progress bars rewrite their line with \r: each update is a line
+    buffer = b""
+    while True:
+        chunk = os.read(pipe.fileno(), 65536)
+        if not chunk:
+            break
+        buffer += chunk
+        *complete, buffer = re.split(rb"[\r\n]", buffer)
+        for line in complete:
+            if line.strip():
+                lines.put((name, line.decode("utf-8", errors="replace")))
+    if buffer.strip():
+        lines.put((name, buffer.decode("utf-8", errors="replace")))
+    lines.put((name, None))
+
+
+def _kill_group(process, grace):
+    # SIGTERM to the whole process group, then SIGKILL if it is still running after grace seconds
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_streaming(command, on_event=None, timeout=None, idle_timeout=None, failure_grace=10.0, kill_grace=10.0, tail_lines=200, env=None):
+    """
+    Run a command, parse its output as it arrives and enforce timeouts
+    command: list[str], the command, e.g. from build_boltz_command
+    on_event: callable, called with each progress event, a dict with keys:
+        event: "started", "stage" (a new stage started), "progress" (a progress bar moved), "error" (a fatal error was printed),
+            "timeout" or "exited"
+        stage: str, the current stage
+        fraction: float, fraction done of the current progress bar, or None
+        line: str, the line of output of the event, or None
+        elapsed: float, seconds since the start
+    timeout: float, wall-clock timeout in seconds. None means no timeout.
+    idle_timeout: float, seconds without any output after which the run is considered stuck. None means no timeout.
+    failure_grace: float, seconds the process has to exit by itself after printing a fatal error
+    kill_grace: float, seconds between SIGTERM and SIGKILL
+    tail_lines: int, number of last lines of stdout and of stderr kept
+    env: dict, environment of the process. Defaults to the current environment.
+    return: dict, with keys returncode, stdout and stderr (the last lines), timed_out ("wall", "idle" or None),
+        error (the first fatal error line, or the timeout, or None) and stages (stage -> seconds)
+    """
+    start = time.perf_counter()
+    state = {'stage': "starting", 'fraction': None, 'stage_started': start}
+    stages = {}
+
+    def _emit(event, line=None):
+        payload = {'event': event, 'stage': state['stage'], 'fraction': state['fraction'], 'line': line, 'elapsed': time.perf_counter() - start}
+        if event in ("stage", "error", "timeout"):
+            logger.info(f"Boltz {event}: {state['stage']} after {payload['elapsed']:.1f}s{f' ({line.strip()[:200]})' if line else ''}")
+        if on_event is not None:
+            try:
+                on_event(payload)
+            except Exception:
+                logger.exception("Boltz progress callback failed")
+
+    def _enter(stage):
+        now = time.perf_counter()
+        stages[state['stage']] = stages.get(state['stage'], 0.0) + now - state['stage_started']
+        state.update(stage=stage, fraction=None, stage_started=now)
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True, env=env)
+    lines = queue.Queue()
+    tails = {'stdout': deque(maxlen=tail_lines), 'stderr': deque(maxlen=tail_lines)}
+    readers = [threading.Thread(target=_read_lines, args=(pipe, name, lines), daemon=True) for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr))]
+    for reader in readers:
+        reader.start()
+    _emit("started")
+
+    open_streams, last_output, timed_out, error, failed_at, exited_at, killed = 2, start, None, None, None, None, False
+    while open_streams:
+        now = time.perf_counter()
+        if not killed:
+            if timeout is not None and now - start > timeout:
+                timed_out, error = "wall", f"Boltz did not finish within {timeout}s"
+            elif idle_timeout is not None and now - last_output > idle_timeout:
+                timed_out, error = "idle", f"Boltz printed nothing for {idle_timeout}s during {state['stage']}"
+            if timed_out:
+                _emit("timeout", error)
+            if timed_out or (failed_at is not None and now - failed_at > failure_grace):
+                _kill_group(process, kill_grace)
+                killed = True
+        if exited_at is None and process.poll() is not None:
+            exited_at = now
+        if exited_at is not None and not killed and now - exited_at > kill_grace:
+            # Boltz exited, but processes it started still hold the pipes open
+            _kill_group(process, kill_grace)
+            killed = True
+
+        try:
+            name, line = lines.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if line is None:
+            open_streams -= 1
+            continue
+        last_output = time.perf_counter()
+        tails[name].append(line)
+        stage, fraction, fatal = parse_progress(line)
+        if fatal and error is None:
+            error, failed_at = line.strip(), time.perf_counter()
+            _emit("error", line)
+        if stage is not None and stage != state['stage']:
+            _enter(stage)
+            _emit("stage", line)
+        if fraction is not None and fraction != state['fraction']:
+            state['fraction'] = fraction
+            _emit("progress", line)
+
+    for reader in readers:
+        reader.join()
+    returncode = process.wait()
+    _enter("exited")
+    _emit("exited")
+    # time of each stage in the trace of the job, e.g. startup (until the first stage), msa, predicting
+    for stage, seconds in stages.items():
+        get_tracer().record(f"boltz.stage.{'startup' if stage == 'starting' else stage}", seconds)
+    return {
+        'returncode': returncode,
+        'stdout': "\n".join(tails['stdout']),
+        'stderr': "\n".join(tails['stderr']),
+        'timed_out': timed_out,
+        'error': error,
+        'stages': stages,
+    }
@@ -0,0 +1,173 @@
+from crewai.tools import BaseTool
+from typing import Type, List, Optional
+from pydantic import BaseModel, Field
+import os, time
+from loguru import logger
+from research_assistant.tools.cache import normalize_sequence
+from research_assistant.tools.workspace import Workspace
+from research_assistant.tools.tracing import get_tracer, traced
+from research_assistant.tools.custom_tool import FoldToolOutput, add_confidence, preprare_directory
+
+
+class BoltzToolInput(BaseModel):
+    """Input schema for BoltzTool."""
+    selected_models: List[str] = Field(..., description="List of selected models")
+    structure_name: str = Field(..., description="Name of the structure to predict")
+    sequences: List[str] = Field(..., description="List of all clean amino acid sequences in this structure, or their handles (seq:...), as written by the Preprocess tool")
+
+@traced("boltz.predict")
+def predict_with_boltz(sequences, yaml_dir = "input/boltz_input", yaml_file_name = "protein1.yaml", result_dir="output/boltz_result/protein1", delete_old_dir=False, backend=None, msa_store=None, on_event=None):
+    """
+    Predict the structure of a protein with Boltz model
+    sequences: list[str], list of clean amino acid sequences of the protein that will be used for prediction
+    yaml_dir: str, the directory to save the input YAML file. Defaults to "input/boltz_input".
+    yaml_file_name: str, the name of the input YAML file. Defaults to "protein1.yaml".
+    result_dir: str, the directory to save the output PDB file. Defaults to "output/boltz_result/protein1".
+    delete_old_dir: bool, whether to delete the old directory. Defaults to False.
+    backend: str, "subprocess" runs `boltz predict` in a new process, "worker" sends the job to the long-lived Boltz worker.
+        Defaults to env BOLTZ_BACKEND or "subprocess".
+    msa_store: MSAStore, store of previously computed MSAs. Defaults to None, which uses get_msa_store().
+        Identical chains are looked up once, and only the chains missing from the store are sent to the MSA server.
+    on_event: callable, called with the progress events of the Boltz run (stages, progress bars, errors, timeouts), see boltz_runner.run_streaming
+    return: dict, the result of the prediction. `peak_memory_gb` is the peak GPU memory of the run, when the backend measures it.
+    """
+    from research_assistant.tools.helpers import write_sequences_to_yaml
+    from research_assistant.tools.boltz_batch import run_boltz, boltz_output_dir, collect_boltz_predictions, parse_failed_examples
+    from research_assistant.tools.msa_store import get_msa_store, prepare_msas, harvest_msas
+
+    # prepare input directory
+    preprare_directory(yaml_dir, delete_old=delete_old_dir)
+
+    # reuse the MSAs of the chains that were already sent to the MSA server
+    sequences = [normalize_sequence(seq) for seq in sequences]
+    msa_store = msa_store if msa_store is not None else get_msa_store()
+    msa_paths, msa_misses = None, list(dict.fromkeys(sequences))
+    if msa_store is not None:
+        with get_tracer().span("boltz.msa_lookup", chains=len(sequences)) as span:
+            msa_paths, msa_misses = prepare_msas(msa_store, sequences)
+            span['misses'] = len(msa_misses)
+
+    input_yaml_path = os.path.join(yaml_dir, yaml_file_name)
+    logger.info(f"Writing input sequences to YAML at: {input_yaml_path}")
+    write_sequences_to_yaml(
+        sequences=sequences, 
+        output_file=input_yaml_path,
+        msa_paths=msa_paths
+    )
+
+    result = {
+        'success': False,
+        'error': None,
+        'output_file_path': None,
+        'peak_memory_gb': None
+    }
+
+    try:
+        # Run the prediction, capture the output
+        output = run_boltz(input_yaml_path, result_dir, use_msa_server=bool(msa_misses), backend=backend, on_event=on_event)
+        print(output['stdout'])
+        result['peak_memory_gb'] = output.get('peak_memory_gb')
+        name = os.path.splitext(yaml_file_name)[0]
+        prediction = collect_boltz_predictions(result_dir, input_yaml_path, [name])[name]
+        if msa_store is not None and msa_misses:
+            with get_tracer().span("boltz.msa_harvest", chains=len(msa_misses)):
+                harvest_msas(msa_store, boltz_output_dir(result_dir, input_yaml_path), name, sequences, msa_misses)
+            logger.info(f"MSA store: {msa_store.cache.stats()}")
+        if prediction['success']:
+            logger.success(f"Boltz successfully predicted the structure of protein and saved to {result_dir}")
+            result['success'] = True
+            result['output_file_path'] = result_dir
+        else:
+            logger.error(f"Boltz failed (exit code {output['returncode']}, failed examples: {parse_failed_examples(output['stdout'])}): {output.get('error')}")
+            result['error'] = (f"{output['error']}\n" if output.get('error') else "") + output['stdout'] + output['stderr'][-2000:]
+    except Exception as e:
+        # e.g. the executable is missing, an unknown backend, or the worker died, timed out or failed to start
+        logger.error(f"Failed to run Boltz: {e!r}")
+        result['error'] = str(e)
+
+    return result
+
+
+class BoltzTool(BaseTool):
+    name: str = "Use Boltz to predict protein structure"
+    description: str = "Use Boltz to predict the structure of a protein"
+    args_schema: Type[BaseModel] = BoltzToolInput
+    workspace: Optional[Workspace] = None # directories of the job. Defaults to a new workspace per call.
+
+    @traced("tool.boltz")
+    def _run(self, selected_models: List[str], structure_name: str, sequences: List[str]) -> str:
+
+        # directories unique to this job
+        workspace = self.workspace or Workspace()
+        logger.info(f"Job ID: {workspace.job_id}")
+
+        output_base_dir = workspace.path("output/boltz_result")
+        logger.debug(f"Prepared output directory: {output_base_dir}")
+        
+        yaml_dir = workspace.path("input/boltz_input")
+        logger.debug(f"Prepared YAML input directory: {yaml_dir}")
+
+        result = FoldToolOutput(
+            model_name="Boltz",        
+        )
+
+        # check if Boltz, Boltz-1, Boltz-2 in the selected models
+        if "Boltz" not in selected_models:
+            result.model_is_selected = False
+            result.output_file_path = None
+            result.success = False
+        else:
+            # generate output file name
+            result_dir = output_base_dir
+            yaml_file_name = f"{structure_name}.yaml"
+
+            # the agent passes the handles of the sequences
+            from research_assistant.tools.sequence_store import resolve_sequences
+            result.model_is_selected = True
+            try:
+                sequences = resolve_sequences(sequences)
+            except ValueError as e:
+                logger.error(f"Boltz input of {structure_name}: {e}")
+                result.error = str(e)
+                return str(result)
+
+            # check that the structure fits in GPU memory before launching Boltz
+            from research_assistant.tools.resources import get_fold_scheduler
+            scheduler = get_fold_scheduler()
+            decision, estimate, reason = scheduler.admit("Boltz", sequences, alternatives=[m for m in selected_models if m != "Boltz"])
+            if decision != "run":
+                result.success = False
+                result.output_file_path = None
+                result.error = reason
+                return str(result)
+
+            # predict the structure, once the running jobs leave enough GPU memory
+            logger.warning(f"Predicting the structure of {structure_name} with Boltz (estimated {estimate.memory_gb:.1f} GB, {estimate.seconds:.0f}s)")
+            with scheduler.reserve(estimate.memory_gb):
+                started = time.perf_counter()
+                pred_r = predict_with_boltz(
+                    sequences=sequences, 
+                    yaml_dir=yaml_dir,
+                    yaml_file_name=yaml_file_name,
+                    result_dir=result_dir
+                )
+                runtime = time.perf_counter() - started
+
+            # update the result
+            result.success = pred_r['success']
+            result.output_file_path = pred_r['output_file_path']
+            if result.success:
+                scheduler.estimator.observe("Boltz", sequences, seconds=runtime, memory_gb=pred_r.get('peak_memory_gb'))
+                add_confidence(result, result.output_file_path, name=structure_name)
+
+            # index the prediction
+            from research_assistant.tools.results_store import record_prediction
+            record_prediction(sequences, "Boltz", result, runtime=runtime, structure_name=structure_name, job_id=workspace.job_id,
+                              parameters={'backend': os.getenv("BOLTZ_BACKEND", "subprocess")}, peak_memory_gb=pred_r.get('peak_memory_gb'))
+
+            from research_assistant.tools.msa_store import get_msa_store
+            msa_store = get_msa_store()
+            if msa_store is not None:
+                logger.info(f"MSA store report: {msa_store.report()}")
+
+        return str(result)
@@ -0,0 +1,461 @@
+"""
+Long-lived Boltz worker: a local process that loads Boltz once and runs prediction jobs sent over a unix socket,
+so that interactive runs don't pay process startup, CUDA initialization and checkpoint loading on every call.
+
+Start a worker by hand, with the same BOLTZ_WORKER_ADDRESS and BOLTZ_WORKER_AUTHKEY as its clients:
+    python -m research_assistant.tools.boltz_worker --runner boltz --max-jobs 100
+or let BoltzWorkerClient start one on first use (predict_with_boltz(..., backend="worker")). By default a client
+starts its worker on a socket in a private directory of its process, with a random authkey passed to the worker.
+"""
+import os, sys, time, json, glob, atexit, shutil, secrets, argparse, tempfile, subprocess, threading, traceback, contextlib, io
+from multiprocessing.connection import Client, Listener
+from loguru import logger
+
+
+def default_address():
+    """
+    Socket of the workers started by this process: in a private directory, created on first use and removed at exit
+    return: str, path of the unix socket
+    """
+    global _default_address
+    with _defaults_lock:
+        if _default_address is None:
+            directory = tempfile.mkdtemp(prefix="research_assistant_boltz_")
+            atexit.register(shutil.rmtree, directory, ignore_errors=True)
+            _default_address = os.path.join(directory, "worker.sock")
+        return _default_address
+
+
+def default_authkey():
+    """
+    return: bytes, random shared secret of the workers started by this process
+    """
+    global _default_authkey
+    with _defaults_lock:
+        if _default_authkey is None:
+            _default_authkey = secrets.token_hex(32).encode()
+        return _default_authkey
+
+_default_address = None
+_default_authkey = None
+_defaults_lock = threading.Lock()
+
+
+class BoltzRunner:
+    """
+    Run boltz in-process. Boltz is imported once, and checkpoint loading is memoized so that the
+    model weights are loaded on the first job and reused by the following ones.
+    """
+    def __init__(self):
+        import boltz.main
+        self._main = boltz.main
+        self._memoize_checkpoint_loading()
+
+    def _memoize_checkpoint_loading(self):
+        # boltz.main.predict loads the checkpoint with <ModelClass>.load_from_checkpoint on every call.
+        # The arguments are the same from one job to the next, so the loaded model can be reused.
+        try:
+            from boltz.model import model as boltz_model
+        except ImportError:
+            return
+        for name in ("Boltz1", "Boltz2"):
+            cls = getattr(boltz_model, name, None)
+            if cls is None:
+                continue
+            load = cls.load_from_checkpoint
+            loaded = {}
+
+            def cached_load(*args, _load=load, _loaded=loaded, **kwargs):
+                key = repr((args, sorted(kwargs.items())))
+                if key not in _loaded:
+                    _loaded.clear()
+                    _loaded[key] = _load(*args, **kwargs)
+                return _loaded[key]
+
+            cls.load_from_checkpoint = cached_load
+
+    def predict(self, input_path, result_dir, use_msa_server=True, output_format="pdb"):
+        args = [input_path, "--out_dir", result_dir, "--devices", "1", "--output_format", output_format]
+        if use_msa_server:
+            args.append("--use_msa_server")
+        stdout = io.StringIO()
+        returncode = 0
+        torch = self._torch_cuda()
+        if torch is not None:
+            torch.cuda.reset_peak_memory_stats()
+        with contextlib.redirect_stdout(stdout):
+            try:
+                self._main.predict.main(args=args, standalone_mode=False)
+            except SystemExit as e:
+                returncode = e.code or 0
+            except Exception as e:
+                logger.exception(f"Boltz prediction of {input_path} failed")
+                print(f"Error: {e}")
+                returncode = 1
+        output = {'returncode': returncode, 'stdout': stdout.getvalue(), 'stderr': ""}
+        if torch is not None:
+            # peak of the job, measured in the process that ran it (see resources.ResourceEstimator)
+            output['peak_memory_gb'] = torch.cuda.max_memory_allocated() / 1024**3
+        return output
+
+    @staticmethod
+    def _torch_cuda():
+        try:
+            import torch
+        except ImportError:
+            return None
+        return torch if torch.cuda.is_available() else None
+
+
+class StubBoltzRunner:
+    """
+    Stand-in for BoltzRunner that runs on CPU without boltz installed. It sleeps `load_seconds` once
+    to emulate model loading and `predict_seconds` per structure, and writes the output tree of Boltz with
+    synthetic structures, confidence files and MSAs (see stub_structures.write_stub_boltz_prediction).
+    """
+    def __init__(self, load_seconds=2.0, predict_seconds=0.1):
+        self.predict_seconds = predict_seconds
+        time.sleep(load_seconds)
+
+    def predict(self, input_path, result_dir, use_msa_server=True, output_format="pdb", progress=None):
+        """
+        progress: callable, called with each line of output as it is printed, e.g. print. The lines mimic those of `boltz predict`.
+        """
+        import yaml
+        from research_assistant.tools.boltz_batch import boltz_output_dir
+        from research_assistant.tools.stub_structures import write_stub_boltz_prediction
+        lines = []
+        def _print(line):
+            lines.append(line)
+            if progress is not None:
+                progress(line)
+
+        if os.path.isdir(input_path):
+            inputs = sorted(glob.glob(os.path.join(input_path, "*.yaml")))
+        else:
+            inputs = [input_path]
+        _print("Checking input data.")
+        _print(f"Processing {len(inputs)} inputs with 1 threads.")
+        structures = []
+        for fp in inputs:
+            with open(fp, "r") as f:
+                entries = yaml.safe_load(f).get("sequences", [])
+            # an entity with a list of IDs is one chain per ID, in the order of the entities like Boltz
+            proteins = [entry["protein"] for entry in entries if "protein" in entry]
+            chains = [(chain, protein["sequence"]) for protein in proteins for chain in (protein["id"] if isinstance(protein["id"], list) else [protein["id"]])]
+            structures.append((os.path.splitext(os.path.basename(fp))[0], chains))
+            if use_msa_server:
+                _print(f"Generating MSA for {fp} with {len(proteins)} protein entities.")
+        _print(f"Running structure prediction for {len(inputs)} inputs.")
+        for i, (name, chains) in enumerate(structures):
+            time.sleep(self.predict_seconds)
+            write_stub_boltz_prediction(boltz_output_dir(result_dir, input_path), name, [seq for _, seq in chains], output_format=output_format,
+                                        use_msa_server=use_msa_server, chain_ids=[chain for chain, _ in chains])
+            _print(f"Predicting DataLoader 0: {100 * (i + 1) // len(structures):3d}%| {i + 1}/{len(structures)} [00:00<00:00]")
+        _print("Number of failed examples: 0")
+        return {'returncode': 0, 'stdout': "\n".join(lines) + "\n", 'stderr': ""}
+
+
+RUNNERS = {
+    "boltz": BoltzRunner,
+    "stub": StubBoltzRunner,
+}
+
+
+def serve(address, authkey, runner="boltz", max_jobs=None, runner_kwargs=None):
+    """
+    Run the worker: load the runner once, then serve requests until drained or recycled.
+    Each connection is handled in its own thread so that health checks are answered while a job runs;
+    jobs themselves run one at a time.
+    Requests are dicts with an "op" key:
+    - {"op": "ping"}: health check, returns pid, uptime, jobs_done, busy and state
+    - {"op": "predict", "input_path", "result_dir", "use_msa_server", "output_format"}: run a job. If the runner raises,
+      the job fails with returncode 1 and the traceback in stderr, and the worker keeps serving.
+    - {"op": "drain"}: stop accepting new jobs, finish the accepted ones and exit
+    address: str, path of the unix socket
+    authkey: bytes, shared secret of the connection
+    runner: str, "boltz" or "stub"
+    max_jobs: int, exit after this many jobs so that the client starts a fresh worker. None means never recycle.
+    runner_kwargs: dict, keyword arguments of the runner
+    """
+    started = time.time()
+    if os.path.exists(address):
+        os.remove(address)
+    logger.info(f"Boltz worker {os.getpid()} loading runner '{runner}'")
+    model = RUNNERS[runner](**(runner_kwargs or {}))
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    logger.info(f"Boltz worker {os.getpid()} ready on {address} after {time.time() - started:.1f}s")
+
+    job_lock = threading.Lock()
+    status = {'jobs_done': 0, 'busy': False, 'state': "ready"}
+
+    def _stop_accepting(state):
+        status['state'] = state
+        # wake up the accept loop so that it notices the new state
+        try:
+            with Client(address, family="AF_UNIX", authkey=authkey) as conn:
+                conn.send({'op': "ping"})
+                conn.recv()
+        except (OSError, EOFError):
+            pass
+
+    def _handle(conn):
+        with conn:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            op = request.get("op")
+            if op == "ping":
+                conn.send({'ok': True, 'pid': os.getpid(), 'uptime': time.time() - started, 'max_jobs': max_jobs, **status})
+            elif op == "predict":
+                with job_lock:
+                    status['busy'] = True
+                    job_started = time.time()
+                    try:
+                        output = model.predict(
+                            request["input_path"],
+                            request["result_dir"],
+                            use_msa_server=request.get("use_msa_server", True),
+                            output_format=request.get("output_format", "pdb"),
+                        )
+                        output['ok'] = True
+                    except Exception as e:
+                        logger.exception(f"Boltz worker {os.getpid()} failed to predict {request['input_path']}")
+                        output = {'ok': False, 'error': f"Boltz worker failed: {e}", 'returncode': 1, 'stdout': "", 'stderr': traceback.format_exc()}
+                    finally:
+                        status['jobs_done'] += 1
+                        status['busy'] = False
+                    recycle = max_jobs is not None and status['jobs_done'] >= max_jobs and status['state'] == "ready"
+                    if recycle:
+                        # before the reply: a job sent right after it must not be accepted
+                        status['state'] = "recycling"
+                output.update({'seconds': time.time() - job_started, 'jobs_done': status['jobs_done'], 'state': status['state']})
+                conn.send(output)
+                if recycle:
+                    _stop_accepting("recycling")
+            elif op == "drain":
+                conn.send({'ok': True, 'jobs_done': status['jobs_done'], 'state': "draining"})
+                _stop_accepting("draining")
+            else:
+                conn.send({'ok': False, 'error': f"Unknown op: {op}"})
+
+    handlers = []
+    try:
+        while status['state'] == "ready":
+            conn = listener.accept()
+            if status['state'] != "ready":
+                conn.close()
+                break
+            handler = threading.Thread(target=_handle, args=(conn,), daemon=True)
+            handler.start()
+            handlers = [h for h in handlers if h.is_alive()] + [handler]
+    finally:
+        listener.close()
+        if os.path.exists(address):
+            os.remove(address)
+        # graceful drain: finish the jobs that were already accepted
+        for handler in handlers:
+            handler.join()
+        logger.info(f"Boltz worker {os.getpid()} exiting ({status['state']}) after {status['jobs_done']} jobs")
+
+
+class BoltzWorkerClient:
+    """
+    Client of a Boltz worker. Starts the worker if it is not running, and starts a new one when the
+    previous one recycled itself after max_jobs.
+    """
+    def __init__(self, address=None, authkey=None, runner=None, max_jobs=None, start_timeout=600, runner_kwargs=None):
+        """
+        address: str, path of the unix socket. Defaults to env BOLTZ_WORKER_ADDRESS or default_address().
+        authkey: bytes, shared secret, passed to the workers started by this client. Defaults to env BOLTZ_WORKER_AUTHKEY or default_authkey().
+        runner: str, runner of workers started by this client, "boltz" or "stub". Defaults to env BOLTZ_WORKER_RUNNER or "boltz".
+        max_jobs: int, jobs before a worker started by this client recycles. Defaults to env BOLTZ_WORKER_MAX_JOBS or 100.
+        start_timeout: float, seconds to wait for a new worker to load its model
+        runner_kwargs: dict, keyword arguments of the runner of workers started by this client
+        """
+        self.address = address or os.getenv("BOLTZ_WORKER_ADDRESS") or default_address()
+        self.authkey = authkey or os.getenv("BOLTZ_WORKER_AUTHKEY", "").encode() or default_authkey()
+        self.runner = runner or os.getenv("BOLTZ_WORKER_RUNNER", "boltz")
+        self.max_jobs = max_jobs if max_jobs is not None else int(os.getenv("BOLTZ_WORKER_MAX_JOBS", 100))
+        self.start_timeout = start_timeout
+        self.runner_kwargs = runner_kwargs or {}
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _request(self, request, timeout=None):
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send(request)
+            if timeout is not None and not conn.poll(timeout):
+                raise TimeoutError(f"Boltz worker did not answer within {timeout}s")
+            return conn.recv()
+
+    def health(self):
+        """
+        return: dict, the worker status, or None if no worker is listening
+        """
+        try:
+            return self._request({'op': "ping"}, timeout=5)
+        except (OSError, EOFError):
+            return None
+
+    def start(self):
+        """
+        Start a worker process and wait until it is ready
+        """
+        command = [
+            sys.executable, "-m", "research_assistant.tools.boltz_worker",
+            "--address", self.address,
+            "--runner", self.runner,
+            "--max-jobs", str(self.max_jobs),
+            "--runner-kwargs", json.dumps(self.runner_kwargs),
+        ]
+        from research_assistant.tools.tracing import get_tracer
+        logger.info(f"Starting Boltz worker: {' '.join(command)}")
+        with get_tracer().span("boltz.worker_start", runner=self.runner):
+            self._process = subprocess.Popen(command, env={**os.environ, "BOLTZ_WORKER_AUTHKEY": self.authkey.decode()})
+            deadline = time.time() + self.start_timeout
+            while time.time() < deadline:
+                if self._process.poll() is not None:
+                    raise RuntimeError(f"Boltz worker exited with code {self._process.returncode} during startup")
+                status = self.health()
+                if status is not None:
+                    return status
+                time.sleep(0.05)
+            raise TimeoutError(f"Boltz worker did not start within {self.start_timeout}s")
+
+    def ensure_started(self):
+        """
+        Start a worker unless a ready one is listening
+        return: dict, the worker status
+        """
+        with self._lock:
+            status = self.health()
+            if status is None or status['state'] != "ready":
+                self._wait_for_exit()
+                status = self.start()
+            return status
+
+    def _wait_for_exit(self):
+        # a recycling or draining worker removes its socket when it exits
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+        deadline = time.time() + 30
+        while os.path.exists(self.address) and time.time() < deadline:
+            time.sleep(0.05)
+
+    def predict(self, input_path, result_dir, use_msa_server=True, output_format="pdb", timeout=None):
+        """
+        Run a prediction job on the worker
+        timeout: float, seconds to wait for the result, including the wait for the previous jobs of the worker.
+            Defaults to env BOLTZ_TIMEOUT or 7200. 0 disables it. A worker started by this client is killed when
+            the timeout expires, so that the next job starts a fresh one.
+        return: dict, with keys returncode, stdout and stderr, like the subprocess backend, and peak_memory_gb when the worker runs on a GPU.
+            A job that failed in the worker has returncode 1 and an error.
+        """
+        timeout = float(timeout if timeout is not None else os.getenv("BOLTZ_TIMEOUT", 7200)) or None
+        request = {
+            'op': "predict",
+            'input_path': os.path.abspath(input_path),
+            'result_dir': os.path.abspath(result_dir),
+            'use_msa_server': use_msa_server,
+            'output_format': output_format,
+        }
+        try:
+            response = self._submit(request, timeout)
+        except TimeoutError:
+            raise
+        except (OSError, EOFError):
+            # the worker stopped accepting jobs (recycled or drained) between the health check and the request
+            response = self._submit(request, timeout)
+        if response['state'] == "recycling":
+            logger.info(f"Boltz worker recycles after {response['jobs_done']} jobs")
+        from research_assistant.tools.tracing import get_tracer
+        # time of the job in the worker, without the round trip and the wait for the previous job
+        get_tracer().record("boltz.worker_inference", response['seconds'], returncode=response['returncode'])
+        return response
+
+    def _submit(self, request, timeout):
+        self.ensure_started()
+        try:
+            return self._request(request, timeout=timeout)
+        except TimeoutError:
+            self._kill()
+            raise
+
+    def _kill(self):
+        # a killed worker does not remove its socket
+        with self._lock:
+            if self._process is not None:
+                logger.error(f"Killing Boltz worker {self._process.pid}")
+                self._process.kill()
+                self._process.wait()
+                self._process = None
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.address)
+
+    def drain(self):
+        """
+        Ask the worker to finish its current job and exit
+        """
+        try:
+            response = self._request({'op': "drain"}, timeout=5)
+        except (OSError, EOFError):
+            return None
+        self._wait_for_exit()
+        return response
+
+
+    def close(self):
+        """
+        Drain the worker if this client started it. Workers started by hand are left running.
+        """
+        if self._process is not None:
+            self.drain()
+            # a worker that was already recycling does not answer the drain
+            self._wait_for_exit()
+
+
+def get_boltz_worker():
+    """
+    Get the process-wide Boltz worker client of the address in env BOLTZ_WORKER_ADDRESS (default_address() if it is not set),
+    configured with the BOLTZ_WORKER_* environment variables. The workers started by the clients are drained at exit.
+    """
+    address = os.getenv("BOLTZ_WORKER_ADDRESS") or default_address()
+    with _boltz_worker_clients_lock:
+        if address not in _boltz_worker_clients:
+            client = BoltzWorkerClient(address=address)
+            atexit.register(client.close)
+            _boltz_worker_clients[address] = client
+        return _boltz_worker_clients[address]
+
+_boltz_worker_clients = {}
+_boltz_worker_clients_lock = threading.Lock()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived Boltz worker")
+    parser.add_argument("--address", default=os.getenv("BOLTZ_WORKER_ADDRESS"), help="path of the unix socket, defaults to env BOLTZ_WORKER_ADDRESS")
+    parser.add_argument("--runner", default="boltz", choices=sorted(RUNNERS))
+    parser.add_argument("--max-jobs", type=int, default=None)
+    parser.add_argument("--runner-kwargs", default="{}", help="JSON dict of keyword arguments of the runner")
+    args = parser.parse_args()
+    if not args.address:
+        parser.error("--address or env BOLTZ_WORKER_ADDRESS is required")
+    if not os.getenv("BOLTZ_WORKER_AUTHKEY"):
+        parser.error("env BOLTZ_WORKER_AUTHKEY is required: the shared secret of the worker and its clients")
+    serve(
+        address=args.address,
+        authkey=os.getenv("BOLTZ_WORKER_AUTHKEY").encode(),
+        runner=args.runner,
+        max_jobs=args.max_jobs,
+        runner_kwargs=json.loads(args.runner_kwargs),
+    )
+
+
+if __name__ == "__main__":
+    main()
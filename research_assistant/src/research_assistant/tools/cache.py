@@ -0,0 +1,303 @@
+import os, time, hashlib, tempfile, threading
+from loguru import logger
+
+
+def normalize_sequence(sequence):
+    """
+    Normalize an amino acid sequence before hashing: remove spaces and newlines, convert to uppercase
+    sequence: str, amino acid sequence
+    return: str, normalized sequence
+    """
+    return "".join(sequence.split()).upper()
+
+
+def make_cache_key(*parts):
+    """
+    Build a content-addressed cache key from the given parts
+    parts: str, e.g. endpoint, model version and normalized sequence
+    return: str, hex sha256 digest
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key so that only one of them does the work.
+    The other callers block until the first one finishes and share its result (or its exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() once per key among concurrent callers
+        key: str, key of the call
+        fn: callable, the function to run
+        return: tuple, (result of fn, whether the result was shared from another caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
+        return call["result"], False
+
+
+class DiskCache:
+    """
+    Content-addressed on-disk cache of text payloads (PDB files, MSAs, ...).
+    Entries are stored as <root>/<key[:2]>/<key><suffix> and written atomically, so several
+    processes can share the same cache directory.
+    Eviction is age-based (entries older than max_age seconds are dropped on read) and
+    size-based (least recently used entries are removed once the cache grows over max_bytes).
+    """
+    def __init__(self, root, max_bytes=2 * 1024**3, max_age=30 * 24 * 3600, suffix=""):
+        """
+        root: str, directory of the cache
+        max_bytes: int, maximum total size of the cache in bytes. None means unlimited.
+        max_age: float, maximum age of an entry in seconds. None means entries never expire.
+        suffix: str, file suffix of the entries, e.g. ".pdb"
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.suffix = suffix
+        self.flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._size = None
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "writes": 0, "evictions": 0}
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key):
+        """
+        Path of the entry for key. The file may not exist.
+        """
+        return os.path.join(self.root, key[:2], f"{key}{self.suffix}")
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _is_expired(self, path):
+        if self.max_age is None:
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) > self.max_age
+        except FileNotFoundError:
+            return True
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._stats["evictions"] += 1
+            if self._size is not None:
+                self._size -= size
+
+    def contains(self, key):
+        """
+        Whether a fresh entry exists for key. Does not update the hit/miss counters.
+        """
+        path = self.path_for(key)
+        return os.path.exists(path) and not self._is_expired(path)
+
+    def get_path(self, key):
+        """
+        Path of the entry for key, for payloads that are read by another program
+        key: str, cache key
+        return: str or None if there is no fresh entry
+        """
+        path = self.path_for(key)
+        if os.path.exists(path) and self._is_expired(path):
+            logger.debug(f"Cache entry expired: {path}")
+            self._remove(path)
+        # refresh the access time used by the LRU eviction. mtime is kept as the age of the entry.
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return path
+
+    def get(self, key):
+        """
+        Read the entry for key
+        key: str, cache key
+        return: str or None if there is no fresh entry
+        """
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            return None
+
+    def put(self, key, value):
+        """
+        Write the entry for key atomically, then evict old entries if the cache is over max_bytes
+        key: str, cache key
+        value: str, payload to store, or an iterable of str pieces of the payload, written as they come
+        return: str, path of the entry
+        """
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for piece in ([value] if isinstance(value, str) else value):
+                    f.write(piece)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self._stats["writes"] += 1
+            if self._size is not None:
+                self._size += os.path.getsize(path) - old_size
+        self.evict()
+        return path
+
+    def get_or_compute(self, key, compute):
+        """
+        Read the entry for key, or compute and store it. Concurrent misses for the same key share one compute() call.
+        key: str, cache key
+        compute: callable returning the str payload. Exceptions are propagated to all waiting callers and nothing is stored.
+        return: tuple, (payload, whether it was a cache hit)
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        def _compute_and_store():
+            # another process may have filled the entry while we were waiting
+            if self.contains(key):
+                with open(self.path_for(key), "r") as f:
+                    return f.read()
+            value = compute()
+            self.put(key, value)
+            return value
+
+        value, shared = self.flight.do(key, _compute_and_store)
+        if shared:
+            self._count("coalesced")
+        return value, False
+
+    def get_or_compute_path(self, key, compute):
+        """
+        Like get_or_compute, for payloads that are too large to be held in memory: compute returns the payload
+        in pieces, which are written to the entry as they come, and the path of the entry is returned.
+        key: str, cache key
+        compute: callable returning an iterable of str pieces of the payload
+        return: tuple, (path of the entry, whether it was a cache hit)
+        """
+        path = self.get_path(key)
+        if path is not None:
+            return path, True
+
+        def _compute_and_store():
+            if self.contains(key):
+                return self.path_for(key)
+            return self.put(key, compute())
+
+        path, shared = self.flight.do(key, _compute_and_store)
+        if shared:
+            self._count("coalesced")
+        return path, False
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith(".tmp-") or not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st
+
+    def evict(self):
+        """
+        Remove expired entries and, if the cache is over max_bytes, the least recently used entries
+        until the cache is under 90% of max_bytes.
+        """
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            size = self._size
+        if size is not None and size <= self.max_bytes:
+            return
+
+        entries = list(self._entries())
+        size = sum(st.st_size for _, st in entries)
+        with self._lock:
+            self._size = size
+        if size <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        now = time.time()
+        # expired entries first, then least recently used
+        entries.sort(key=lambda e: (not (self.max_age is not None and now - e[1].st_mtime > self.max_age), e[1].st_atime))
+        for path, st in entries:
+            if size <= target:
+                break
+            self._remove(path)
+            size -= st.st_size
+        logger.info(f"Evicted cache entries under {self.root}, size is now {size} bytes")
+
+    def usage(self):
+        """
+        return: tuple, (number of entries, total size in bytes)
+        """
+        entries = list(self._entries())
+        return len(entries), sum(st.st_size for _, st in entries)
+
+    def clear(self):
+        """
+        Remove all entries of the cache
+        """
+        for path, _ in list(self._entries()):
+            self._remove(path)
+
+    def stats(self):
+        """
+        Hit/miss counters of this cache instance
+        return: dict, hits, misses, coalesced, writes, evictions and hit_rate
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,126 @@
+"""
+Durable checkpoints of the crew jobs: the message of a job and the output of each of its stages, saved as soon as
+the stage finishes, so that a job that died can be resumed without rerunning its completed stages
+(see crew.resume and the `resume` command).
+
+The outputs are the raw task outputs passed between the stages, i.e. the str of a PreprocessOutput, a
+ModelSelectionOutput or a FoldToolOutput: a resumed job passes them to the crew as precomputed outputs.
+"""
+import os, json, time, threading
+from loguru import logger
+
+from research_assistant.tools.workspace import atomic_write_text
+
+
+class CheckpointStore:
+    """
+    Checkpoints of the jobs, one JSON file per job: <root>/<job_id>.json
+    """
+    def __init__(self, root=os.path.join("output", "checkpoints")):
+        """
+        root: str, directory of the checkpoints
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, job_id):
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def load(self, job_id):
+        """
+        return: dict with keys job_id, message, outputs (task name -> raw output), feedback (task name -> human
+            feedback), report (None until the job finishes) and updated_at, or None if the job has no checkpoint
+        """
+        try:
+            with open(self.path_for(job_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, job_id, message=None, outputs=None, feedback=None, report=None):
+        """
+        Add to the checkpoint of a job. The stages of a job finish in several threads (the folding tasks run
+        concurrently): the checkpoint is read, updated and written atomically under a lock.
+        message: str, the user's message
+        outputs: dict, task name -> raw output of the finished tasks
+        feedback: dict, task name -> human feedback
+        report: str, the final report: the job is complete
+        return: dict, the checkpoint
+        """
+        with self._lock:
+            checkpoint = self.load(job_id) or {'job_id': job_id, 'message': None, 'outputs': {}, 'feedback': {}, 'report': None}
+            if message is not None:
+                checkpoint['message'] = message
+            checkpoint['outputs'].update(outputs or {})
+            checkpoint['feedback'].update(feedback or {})
+            if report is not None:
+                checkpoint['report'] = report
+            checkpoint['updated_at'] = time.time()
+            atomic_write_text(self.path_for(job_id), json.dumps(checkpoint))
+        return checkpoint
+
+    def incomplete(self):
+        """
+        return: list[str], IDs of the jobs without a final report, oldest first
+        """
+        checkpoints = []
+        for file_name in os.listdir(self.root):
+            if not file_name.endswith(".json"):
+                continue
+            checkpoint = self.load(file_name[:-len(".json")])
+            if checkpoint is not None and checkpoint.get('report') is None:
+                checkpoints.append((checkpoint['updated_at'], checkpoint['job_id']))
+        return [job_id for _, job_id in sorted(checkpoints)]
+
+
+def get_checkpoint_store():
+    """
+    Get the process-wide checkpoint store. Configured with the environment variable:
+    CHECKPOINT_DIR: directory of the checkpoints, defaults to "output/checkpoints". Set to an empty string to disable the checkpoints.
+    return: CheckpointStore or None if the checkpoints are disabled
+    """
+    global _checkpoint_store
+    root = os.getenv("CHECKPOINT_DIR", os.path.join("output", "checkpoints"))
+    if not root:
+        return None
+    with _checkpoint_store_lock:
+        if _checkpoint_store is None or _checkpoint_store.root != root:
+            _checkpoint_store = CheckpointStore(root)
+        return _checkpoint_store
+
+_checkpoint_store = None
+_checkpoint_store_lock = threading.Lock()
+
+
+def verified_outputs(checkpoint):
+    """
+    Outputs of the completed stages of a job whose artifacts still exist: the stages to skip when it is resumed.
+    - the preprocess output is kept if its sequence handles still resolve (see tools/sequence_store.py)
+    - a folding output is kept if the model was not selected, or if the prediction succeeded and its output
+      still exists. Failed predictions are run again.
+    checkpoint: dict, see CheckpointStore.load
+    return: dict, task name -> raw output
+    """
+    from research_assistant.tools.backends import folding_tasks
+    from research_assistant.tools.report import parse_fold_output
+    from research_assistant.tools.sequence_store import find_handles, resolve_sequences
+
+    outputs = dict(checkpoint['outputs'])
+    fold_task_names = set(folding_tasks().values())
+    for name, raw in list(outputs.items()):
+        if name == 'preprocess_task':
+            try:
+                resolve_sequences(find_handles(raw))
+            except ValueError as e:
+                logger.warning(f"Job {checkpoint['job_id']}: {name} is run again, {e}")
+                del outputs[name]
+        elif name in fold_task_names:
+            result = parse_fold_output(raw)
+            if result is None or (result.model_is_selected and not result.success):
+                logger.info(f"Job {checkpoint['job_id']}: {name} did not complete, it is run again")
+                del outputs[name]
+            elif result.model_is_selected and not (result.output_file_path and os.path.exists(result.output_file_path)):
+                logger.warning(f"Job {checkpoint['job_id']}: the output of {name} is missing ({result.output_file_path}), it is run again")
+                del outputs[name]
+    return outputs
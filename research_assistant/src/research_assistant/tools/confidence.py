@@ -0,0 +1,204 @@
+"""
+Confidence of the predicted structures: per-residue pLDDT read from the fold outputs, summarized per chain
+and per structure, for the report and the batch manifest.
+- ESMFold: the pLDDT is the B-factor of the atoms of the PDB. ATOM records are parsed by fixed-width column
+  slicing of the whole file at once with numpy, not line by line. Compressed PDBs and .coords.npy files
+  (see structure_io) are read too.
+- Boltz: the pLDDT is in plddt_<name>_model_0.npz, one value per token, and pTM/ipTM/confidence score in
+  confidence_<name>_model_0.json. The structure file is only read for the chains of the residues.
+pLDDT is reported on the 0-100 scale of ESMFold: values in [0, 1] (Boltz, some ESMFold versions) are scaled.
+"""
+import os, glob, json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from loguru import logger
+
+from research_assistant.tools.structure_io import COORDS_SUFFIX, CoordinateFile, fixed_width_records, column, open_structure
+
+
+CONFIDENT = 70.0 # pLDDT of a confident residue
+VERY_HIGH = 90.0 # pLDDT of a very high confidence residue
+
+
+def _residues(residue_keys, values):
+    # mean value of the atoms of each residue: atoms of a residue are consecutive records with the same key
+    if len(residue_keys) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    starts = np.flatnonzero(np.r_[True, residue_keys[1:] != residue_keys[:-1]])
+    return starts, np.add.reduceat(values, starts) / np.diff(np.r_[starts, len(values)])
+
+
+def _to_percent(plddt):
+    plddt = np.asarray(plddt, dtype=np.float64)
+    return plddt * 100 if len(plddt) and plddt.max() <= 1.0 else plddt
+
+
+def read_pdb_plddt(path_or_text):
+    """
+    Read the per-residue pLDDT of a PDB file from the B-factors of its ATOM records
+    path_or_text: str or bytes, path to a PDB file (.pdb, .pdb.gz, .pdb.zst or .coords.npy), or the content of a PDB file
+    return: tuple, (chain ID of each residue, pLDDT of each residue on the 0-100 scale), numpy arrays
+    """
+    if isinstance(path_or_text, str) and "\n" not in path_or_text:
+        if path_or_text.endswith(COORDS_SUFFIX):
+            chains, plddt = CoordinateFile(path_or_text).residue_plddt()
+            return chains, _to_percent(plddt)
+        with open_structure(path_or_text, "rb") as f:
+            data = f.read()
+    else:
+        data = path_or_text.encode() if isinstance(path_or_text, str) else path_or_text
+    records = fixed_width_records(data.splitlines(), hetatm=False)
+    b_factors = column(records, 60, 66)
+    if (b_factors == b"").any():
+        raise ValueError("ATOM records without B-factor column")
+    # residue: chain (column 22), residue number (23-26) and insertion code (27)
+    starts, plddt = _residues(column(records, 21, 27), b_factors.astype(np.float64))
+    return column(records, 21, 22)[starts].astype(str), _to_percent(plddt)
+
+
+def read_mmcif_chains(path):
+    """
+    Read the chain of each residue of an mmCIF file, from its atom_site loop
+    return: numpy array, chain ID of each residue
+    """
+    fields, rows = [], []
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("_atom_site."):
+                fields.append(line.strip().split(".", 1)[1])
+            elif line.startswith(("ATOM", "HETATM")):
+                rows.append(line.split())
+    if not rows:
+        return np.zeros(0, dtype=str)
+    table = np.array(rows, dtype=str)
+    chain = table[:, fields.index("auth_asym_id" if "auth_asym_id" in fields else "label_asym_id")]
+    residue = table[:, fields.index("auth_seq_id" if "auth_seq_id" in fields else "label_seq_id")]
+    starts, _ = _residues(np.char.add(np.char.add(chain, ":"), residue), np.zeros(len(chain)))
+    return chain[starts]
+
+
+def summarize_plddt(chains, plddt):
+    """
+    Summarize the per-residue pLDDT of a structure
+    chains: array, chain ID of each residue, or None if unknown
+    plddt: array, pLDDT of each residue on the 0-100 scale
+    return: dict, with keys n_residues, mean_plddt, median_plddt, min_plddt, confident_fraction (pLDDT >= 70),
+        very_high_fraction (pLDDT >= 90) and chains (chain ID -> n_residues, mean_plddt, confident_fraction)
+    """
+    plddt = np.asarray(plddt, dtype=np.float64)
+    if len(plddt) == 0:
+        raise ValueError("No residue with a pLDDT")
+    summary = {
+        'n_residues': int(len(plddt)),
+        'mean_plddt': float(plddt.mean()),
+        'median_plddt': float(np.median(plddt)),
+        'min_plddt': float(plddt.min()),
+        'confident_fraction': float((plddt >= CONFIDENT).mean()),
+        'very_high_fraction': float((plddt >= VERY_HIGH).mean()),
+        'chains': {},
+    }
+    if chains is not None and len(chains) == len(plddt):
+        # chains in order of appearance
+        chain_ids, first = np.unique(chains, return_index=True)
+        for chain_id in chain_ids[np.argsort(first)]:
+            values = plddt[chains == chain_id]
+            summary['chains'][str(chain_id)] = {
+                'n_residues': int(len(values)),
+                'mean_plddt': float(values.mean()),
+                'confident_fraction': float((values >= CONFIDENT).mean()),
+            }
+    return summary
+
+
+def summarize_esmfold(pdb_path):
+    """
+    Confidence summary of an ESMFold prediction, see summarize_plddt
+    pdb_path: str, path to the PDB file
+    """
+    chains, plddt = read_pdb_plddt(pdb_path)
+    return {'path': pdb_path, **summarize_plddt(chains, plddt), 'ptm': None, 'iptm': None, 'confidence_score': None}
+
+
+def summarize_boltz(structure_dir, model=0):
+    """
+    Confidence summary of a Boltz prediction, see summarize_plddt, with the pTM, ipTM and confidence score of Boltz
+    structure_dir: str, the predictions/<name> directory of the structure
+    model: int, the model (sample) to summarize. Boltz ranks model 0 first.
+    """
+    name = os.path.basename(os.path.normpath(structure_dir))
+    prefix = os.path.join(structure_dir, f"{name}_model_{model}")
+    with open(os.path.join(structure_dir, f"confidence_{name}_model_{model}.json"), "r") as f:
+        confidence = json.load(f)
+    # members of an npz are only read when accessed
+    with np.load(os.path.join(structure_dir, f"plddt_{name}_model_{model}.npz")) as npz:
+        plddt = _to_percent(npz['plddt'])
+    if os.path.exists(prefix + ".pdb"):
+        chains = read_pdb_plddt(prefix + ".pdb")[0]
+    elif os.path.exists(prefix + ".cif"):
+        chains = read_mmcif_chains(prefix + ".cif")
+    else:
+        chains = None
+    return {
+        'path': structure_dir,
+        **summarize_plddt(chains, plddt),
+        'ptm': confidence.get('ptm'),
+        'iptm': confidence.get('iptm') if len(confidence.get('chains_ptm', {})) > 1 else None,
+        'confidence_score': confidence.get('confidence_score'),
+    }
+
+
+def summarize_prediction(path, name=None):
+    """
+    Confidence summary of the output of a fold tool
+    path: str, a PDB file (ESMFold), or a Boltz result directory: the predictions/<name> directory of a structure,
+        or any directory above it, e.g. the result_dir of predict_with_boltz
+    name: str, the structure to summarize when the directory holds many. Defaults to the first one.
+    return: dict, see summarize_plddt
+    """
+    if os.path.isfile(path):
+        return summarize_esmfold(path)
+    pattern = f"confidence_{name or '*'}_model_0.json"
+    found = glob.glob(os.path.join(path, pattern)) or sorted(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+    if not found:
+        raise FileNotFoundError(f"No Boltz confidence file {pattern} under {path}")
+    return summarize_boltz(os.path.dirname(found[0]))
+
+
+def try_summarize_prediction(path, name=None):
+    """
+    Like summarize_prediction, but logs and returns None when the prediction can't be read
+    """
+    try:
+        return summarize_prediction(path, name=name)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not summarize the confidence of {path}: {e}")
+        return None
+
+
+def summarize_predictions(paths, max_workers=8):
+    """
+    Confidence summaries of many predictions, read in parallel
+    paths: list[str], paths accepted by summarize_prediction
+    max_workers: int, number of files read at once
+    return: list[dict], the summary of each path, or None if it could not be read
+    """
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(try_summarize_prediction, paths))
+
+
+def confidence_fields(summary):
+    """
+    Fields of FoldToolOutput from a confidence summary, rounded for the report
+    return: dict
+    """
+    if summary is None:
+        return {}
+    return {
+        'mean_plddt': round(summary['mean_plddt'], 1),
+        'confident_fraction': round(summary['confident_fraction'], 3),
+        'chain_plddt': " ".join(f"{chain}={stats['mean_plddt']:.1f}" for chain, stats in summary['chains'].items()) or None,
+        'ptm': round(summary['ptm'], 3) if summary['ptm'] is not None else None,
+        'iptm': round(summary['iptm'], 3) if summary['iptm'] is not None else None,
+    }
@@ -1,9 +1,10 @@
 from crewai.tools import BaseTool
-from typing import Type, List, Dict
+from typing import Type, List, Dict, Optional
 from pydantic import BaseModel, Field
-import os, shutil, requests
+import os, shutil
 from loguru import logger
-from abnumber import Chain
+from research_assistant.tools.validation import validate_sequences, clean_sequence
+from research_assistant.tools.tracing import get_tracer, traced
 # from igfold import IgFoldRunner
 
 
@@ -19,6 +20,7 @@ def is_amino_acid_sequence(seq):
     return all(char in valid_amino_acids for char in seq)
 
 # def process_mab_sequence(seq):
+#     from abnumber import Chain
 #     result = {
 #         'seq': None,
 #         'description': "Not a valid antibody sequence",
@@ -80,7 +82,7 @@ class PreprocessOutput(BaseModel):
     """Output schema for Preprocess."""
     structure_name: str = Field(description="Name of the structure to predict", default = "structure1")
     num_chains: int = Field(description="Number of chains in the protein", default = 0)
-    clean_sequences: List[str] = Field(description="List of cleaned sequences", default = [])
+    clean_sequences: List[str] = Field(description="List of cleaned sequences, or of their handles (seq:...) when the sequence store is enabled", default = [])
 
 # sequence_metadata: Dict[str, SequenceMetadata] = Field(description="SequenceMetadata of each sequence in the protein. Dict key is the chain ID, and value is the SquenceMetadat object, which includes clean_sequence, description, is_mab, vh_or_vl, and is_valid_sequence, etc", default={})
 
@@ -118,6 +120,7 @@ class Preprocess(BaseTool):
         
         # return metadata
 
+    @traced("tool.preprocess")
     def _run(self, structure_name: str, num_chains: int, sequences: List[str]) -> str:
 
         # sequence_metadata = {}
@@ -135,15 +138,24 @@ class Preprocess(BaseTool):
         # #     sequence_metadata['B'] = seq2_metadata
 
         clean_sequences = []
+        validation = validate_sequences(sequences)
         for i, seq in enumerate(sequences):
-            is_protein_sequence = self._process_monomer(seq)
-            if is_protein_sequence:
+            if validation["valid"][i]:
                 clean_sequences.append(seq)
+            elif validation["length"][i] == 0:
+                logger.warning(f"Dropped chain {i + 1} of {structure_name}: the sequence is empty")
             else:
-                pass
+                pos = int(validation["first_bad"][i])
+                logger.warning(f"Dropped chain {i + 1} of {structure_name}: invalid residue {clean_sequence(seq)[pos]!r} at position {pos + 1}")
             # seq_metadata = self._process_monomer(seq)
             # sequence_metadata[f'chain {chr(65+i)}'] = seq_metadata
 
+        # pass short handles to the next agents instead of the full sequences
+        from research_assistant.tools.sequence_store import get_sequence_store
+        store = get_sequence_store()
+        if store is not None:
+            clean_sequences = [store.put(seq) for seq in clean_sequences]
+
         # return the result
         result = PreprocessOutput(
             structure_name=structure_name,
@@ -162,277 +174,38 @@ class ModelSelectionOutput(BaseModel):
     selected_models: list[str] = Field(description="List of selected models", default = [])
     explanation: str = Field(description="Explanation of why you selected some models, and why other models aren't selected", default = "")
 
-class ESMFoldToolInput(BaseModel):
-    """Input schema for ESMFoldTool."""
-    selected_models: List[str] = Field(..., description="List of selected models")
-    structure_name: str = Field(..., description="Name of the structure to predict")
-    sequence: str = Field(..., description="Clean amino acid sequence of this structure")
-
-
-class ESMFoldPlayground:
-    def __init__(self, NGC_API_KEY, query_url=None):
-        """
-        Initialize the ESMFoldPlayground class
-        NGC_API_KEY: str, the API key to use
-        query_url: str, the url to send the request to, default is the ESMFold NIM endpoint
-        """
-        self.NGC_API_KEY = NGC_API_KEY
-        self.query_url = query_url if query_url is not None else "https://health.api.nvidia.com/v1/biology/nvidia/esmfold"
-
-    
-    def predict(self,sequence, output_dir=None, output_file_name="predicted_protein.pdb", delete_old_dir=False):
-        """
-        Main function to run the molecular docking
-        sequence: str, single aa sequence
-        output_dir: str, the directory to save the output to. If there are existing contents, it will be deleted and recreated. Defaults to None, and it will not save the output PDB file. 
-        output_file_name: str, the name of the output PDB file. Defaults to "predicted_protein.pdb". Only used when output_dir is not None.
-        delete_old_dir: bool, whether to delete the old directory. Defaults to True.
-        return response object
-        """
-
-        # prepare output directory
-        if output_dir is not None:
-            logger.info(f"Preparing output directory: {output_dir}")
-            preprare_directory(output_dir, delete_old=delete_old_dir)
-        
-        # prepare data
-        data = {
-            "sequence": sequence,
-        }
-
-        # prepare headers
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.NGC_API_KEY}"
-        }
-        
-        # send request
-        logger.info(f"Sending request to {self.query_url}")
-        response = requests.post(self.query_url, headers=headers, json=data)
-        
-        # check response
-        if response.status_code == 200:
-            logger.success("ESMFold request successful")
-            # get the result
-            result = response.json()
-            # Write PDB file
-            if output_dir is not None:
-                fp = os.path.join(output_dir, output_file_name)
-                with open(fp, "w") as f:
-                    f.write(result["pdbs"][0])
-        else:
-            logger.error(f"ESMFold Request failed with status code {response.status_code}. Output file will not be saved.")
-            logger.error("Response content:", response.content)
-            
-        return response
-    
-
-def predict_with_esmfold(sequence, output_dir="output/esmfold_result", output_file_name="predicted_structure.pdb", delete_old_dir=True):
-    # get NGC API key
-    NGC_API_KEY = os.getenv("NVIDIA_NIM_API_KEY")
-
-    # initialize the ESMFoldPlayground class
-    esmfold_playground = ESMFoldPlayground(
-        NGC_API_KEY=NGC_API_KEY
-    )
-
-    # run prediction
-    output_file_path = os.path.join(output_dir, output_file_name)
-    try: 
-        response = esmfold_playground.predict(
-            sequence=sequence,
-            output_dir=output_dir,
-            output_file_name=output_file_name,
-            delete_old_dir=delete_old_dir
-        )
-        if response.status_code == 200:
-            return {
-                'success': True,
-                'output_file_path': output_file_path, 
-                'error': None
-            }
-        else:
-            return {
-                'success': False,
-                'error': response.content, 
-                'output_file_path': None
-            }
-
-    except Exception as e:
-        print(f"Failed to predict with ESMFold with error: {e}")
-        return {
-            'success': False,
-            'error': str(e), 
-            'output_file_path': None
-        }
-
-
-
-class ESMFoldTool(BaseTool):
-
-    name: str = "Using ESMFold to predict protein structure"
-    description: str = "Use ESMFold to predict the structure of a protein"
-    args_schema: Type[BaseModel] = ESMFoldToolInput
-
-    def _run(self, selected_models: List[str], structure_name: str, sequence: str) -> str:
-
-        from research_assistant.tools.helpers import get_run_id
-        # directory to save the output
-        output_base_dir = os.path.join("output/esmfold_result", get_run_id())
-        preprare_directory(output_base_dir, delete_old=True)
-        logger.debug(f"Prepared output directory: {output_base_dir}")
-
-        result = FoldToolOutput(
-            model_name="ESMFold",
-        )
-
-        # check if ESMFold is in the selected models
-        if "ESMFold" not in selected_models:
-            result.model_is_selected = False
-            result.output_file_path = None
-            result.success = False
-        else:
-            # generate output file name
-            output_file_name= f"{structure_name}.pdb"
-            
-            # predict the structure
-            logger.warning(f"Predicting the structure of {structure_name} with ESMFold")
-            pred_r = predict_with_esmfold(sequence, output_dir=output_base_dir, output_file_name=output_file_name)
-
-            # update the result
-            result.success = pred_r['success']
-            result.output_file_path = pred_r['output_file_path']
-            result.model_is_selected = True
-        
-        return str(result)
-
-
 class FoldToolOutput(BaseModel):
     """Output schema for different protein folding tools."""
     model_name: str = Field(description="Name of the protein folding tool", default = "")
     model_is_selected: bool = Field(description="Whether the model is selected by the model_selection_agent", default = False)
     success: bool = Field(description="Whether the prediction is successful", default = False)
     output_file_path: str = Field(description="Path to the output results (PDB files or directories)", default = "")
+    mean_plddt: Optional[float] = Field(description="Mean pLDDT of the residues of the predicted structure, 0-100", default = None)
+    confident_fraction: Optional[float] = Field(description="Fraction of the residues with pLDDT >= 70", default = None)
+    chain_plddt: Optional[str] = Field(description="Mean pLDDT of each chain, e.g. 'A=86.0 B=84.1'", default = None)
+    ptm: Optional[float] = Field(description="Predicted TM score of the structure (Boltz)", default = None)
+    iptm: Optional[float] = Field(description="Interface predicted TM score of the complex (Boltz)", default = None)
+    error: Optional[str] = Field(description="Why the model was not run, e.g. not enough GPU memory", default = None)
 
 
-class BoltzToolInput(BaseModel):
-    """Input schema for BoltzTool."""
-    selected_models: List[str] = Field(..., description="List of selected models")
-    structure_name: str = Field(..., description="Name of the structure to predict")
-    sequences: List[str] = Field(..., description="List of all clean amino acid sequences in this structure")
-
-def predict_with_boltz(sequences, yaml_dir = "input/boltz_input", yaml_file_name = "protein1.yaml", result_dir="output/boltz_result/protein1", delete_old_dir=False):
+def add_confidence(result, path, name=None):
     """
-    Predict the structure of a protein with Boltz model
-    sequences: list[str], list of clean amino acid sequences of the protein that will be used for prediction
-    yaml_dir: str, the directory to save the input YAML file. Defaults to "input/boltz_input".
-    yaml_file_name: str, the name of the input YAML file. Defaults to "protein1.yaml".
-    result_dir: str, the directory to save the output PDB file. Defaults to "output/boltz_result/protein1".
-    delete_old_dir: bool, whether to delete the old directory. Defaults to False.
-    return: dict, the result of the prediction
+    Add the confidence summary of a successful prediction to a FoldToolOutput, so that the report can rank the models
+    result: FoldToolOutput
+    path: str, the output of the prediction, see confidence.summarize_prediction
+    name: str, the structure in a Boltz result directory
     """
-    from research_assistant.tools.helpers import write_sequences_to_yaml
-    import subprocess
-
-    # prepare input directory
-    preprare_directory(yaml_dir, delete_old=delete_old_dir)
-
-    input_yaml_path = os.path.join(yaml_dir, yaml_file_name)
-    logger.info(f"Writing input sequences to YAML at: {input_yaml_path}")
-    write_sequences_to_yaml(
-        sequences=sequences, 
-        output_file=input_yaml_path
-    )
-
-    # Define the CLI command and arguments
-    command = [
-        "boltz", 
-        "predict", 
-        input_yaml_path, 
-        "--out_dir", result_dir, 
-        "--devices", "1", 
-        "--output_format", "pdb", 
-        "--use_msa_server"
-    ]
-
-    result = {
-        'success': False,
-        'error': None,
-        'output_file_path': None
-    }
-
-    try:
-        logger.info(f"Running Boltz prediction with command: {' '.join(command)}")
-        # Run the command, capture the output
-        output = subprocess.run(command, capture_output=True, text=True)
-        print(output.stdout)
-        if "Number of failed examples: 0" in output.stdout:
-            logger.success(f"Boltz successfully predicted the structure of protein and saved to {result_dir}")
-            result['success'] = True
-            result['output_file_path'] = result_dir
-        else:
-            result['error'] = output.stdout
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Command failed with return code {e.returncode}")
-        logger.error("Error Output:\n", e.stderr)
-        result['error'] = str(e)
-
+    from research_assistant.tools.confidence import try_summarize_prediction, confidence_fields
+    with get_tracer().span("tool.confidence", model=result.model_name):
+        summary = try_summarize_prediction(path, name=name)
+    if summary is None:
+        return result
+    for field, value in confidence_fields(summary).items():
+        setattr(result, field, value)
+    logger.info(f"{result.model_name} mean pLDDT: {result.mean_plddt} ({result.chain_plddt})")
     return result
 
 
-class BoltzTool(BaseTool):
-    name: str = "Use Boltz to predict protein structure"
-    description: str = "Use Boltz to predict the structure of a protein"
-    args_schema: Type[BaseModel] = BoltzToolInput
-
-    def _run(self, selected_models: List[str], structure_name: str, sequences: List[str]) -> str:
-
-        # get run ID
-
-        from research_assistant.tools.helpers import get_run_id
-
-        logger.info(f"Getting run ID: {get_run_id()}")
-        run_id = get_run_id()
-
-        output_base_dir = os.path.join("output/boltz_result", run_id)
-        preprare_directory(output_base_dir, delete_old=True)
-        logger.debug(f"Prepared output directory: {output_base_dir}")
-        
-        yaml_dir = os.path.join("input/boltz_input", run_id)
-        preprare_directory(yaml_dir, delete_old=True)
-        logger.debug(f"Prepared YAML input directory: {yaml_dir}")
-
-        result = FoldToolOutput(
-            model_name="Boltz",        
-        )
-
-        # check if Boltz, Boltz-1, Boltz-2 in the selected models
-        if "Boltz" not in selected_models:
-            result.model_is_selected = False
-            result.output_file_path = None
-            result.success = False
-        else:
-            # generate output file name
-            result_dir = output_base_dir
-            yaml_file_name = f"{structure_name}.yaml"
-            
-            # predict the structure
-            logger.warning(f"Predicting the structure of {structure_name} with Boltz")
-            pred_r = predict_with_boltz(
-                sequences=sequences, 
-                yaml_dir=yaml_dir,
-                yaml_file_name=yaml_file_name,
-                result_dir=result_dir
-            )
-
-            # update the result
-            result.success = pred_r['success']
-            result.output_file_path = pred_r['output_file_path']
-            result.model_is_selected = True
-
-        return str(result)
-
-
 # class IgFoldToolInput(BaseModel):
 #     """
 #     Input schema for IgFoldTool
@@ -0,0 +1,230 @@
+import os, asyncio
+import httpx
+from loguru import logger
+
+from research_assistant.tools.cache import make_cache_key, normalize_sequence
+from research_assistant.tools.workspace import atomic_write_text
+
+
+DEFAULT_ESMFOLD_URL = "https://health.api.nvidia.com/v1/biology/nvidia/esmfold"
+
+
+class AsyncESMFoldClient:
+    """
+    Async ESMFold client that keeps a pool of keep-alive connections to the endpoint and
+    runs up to max_concurrency requests at a time. Works with any ESMFold-compatible query_url,
+    i.e. an endpoint that takes {"sequence": ...} and returns {"pdbs": [...]}.
+
+    Example usage:
+    ```python
+    async with AsyncESMFoldClient(NGC_API_KEY, max_concurrency=16) as client:
+        async for result in client.predict_many(sequences, output_dir="output/esmfold_result/library1"):
+            print(result["name"], result["success"])
+    ```
+    """
+    def __init__(self, NGC_API_KEY, query_url=None, max_concurrency=8, timeout=300, model_version="esmfold", cache=None, scheduler=None):
+        """
+        NGC_API_KEY: str, the API key to use
+        query_url: str, the url to send the requests to, default is the ESMFold NIM endpoint
+        max_concurrency: int, maximum number of requests in flight, also the size of the connection pool
+        timeout: float, timeout of a single request in seconds
+        model_version: str, version of the model behind query_url, part of the cache key
+        cache: DiskCache, cache of predicted PDB strings. Defaults to None (no caching).
+        scheduler: RequestScheduler, rate limits and retries the requests. Defaults to None, each request is sent once.
+        """
+        self.NGC_API_KEY = NGC_API_KEY
+        self.query_url = query_url if query_url is not None else DEFAULT_ESMFOLD_URL
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.model_version = model_version
+        self.cache = cache
+        self.scheduler = scheduler
+        self._client = None
+        self._semaphore = None
+        self._inflight = {}
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.NGC_API_KEY}"
+            },
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=self.timeout,
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_pdb(self, sequence):
+        """
+        Send one request. return: tuple, (pdb string or None, status code, error)
+        """
+        async with self._semaphore:
+            if self.scheduler is None:
+                response = await self._client.post(self.query_url, json={"sequence": sequence})
+            else:
+                response = await self.scheduler.acall(lambda: self._client.post(self.query_url, json={"sequence": sequence}))
+        if response.status_code != 200:
+            return None, response.status_code, response.text
+        return response.json()["pdbs"][0], 200, None
+
+    async def _fetch_pdb_cached(self, sequence):
+        key = make_cache_key(self.query_url, self.model_version, normalize_sequence(sequence))
+        pdb = await asyncio.to_thread(self.cache.get, key)
+        if pdb is not None:
+            return pdb, 200, None, True
+
+        # coalesce identical sequences that are in flight at the same time
+        future = self._inflight.get(key)
+        if future is not None:
+            pdb, status_code, error = await asyncio.shield(future)
+            return pdb, status_code, error, False
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            pdb, status_code, error = await self._fetch_pdb(sequence)
+            if pdb is not None:
+                await asyncio.to_thread(self.cache.put, key, pdb)
+            future.set_result((pdb, status_code, error))
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved in case nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        return pdb, status_code, error, False
+
+    async def apredict(self, sequence, name="structure1", output_dir=None):
+        """
+        Predict the structure of a single sequence
+        sequence: str, single aa sequence
+        name: str, name of the structure, used as file name of the output PDB file
+        output_dir: str, the directory to save the output PDB file to. Defaults to None, and the PDB string is returned in the result instead.
+        return: dict, with keys name, success, output_file_path, pdb, error, status_code, cache_hit
+        """
+        if self._client is None:
+            raise RuntimeError("AsyncESMFoldClient must be used as an async context manager")
+
+        result = _failed_result(name)
+        try:
+            if self.cache is None:
+                pdb, status_code, error = await self._fetch_pdb(sequence)
+            else:
+                pdb, status_code, error, result['cache_hit'] = await self._fetch_pdb_cached(sequence)
+        except httpx.HTTPError as e:
+            logger.error(f"ESMFold request for {name} failed with error: {e}")
+            result['error'] = str(e)
+            return result
+
+        result['status_code'] = status_code
+        if pdb is None:
+            logger.error(f"ESMFold request for {name} failed with status code {status_code}")
+            result['error'] = error
+            return result
+
+        result['success'] = True
+        if output_dir is None:
+            result['pdb'] = pdb
+        else:
+            fp = os.path.join(output_dir, f"{name}.pdb")
+            await asyncio.to_thread(_write_text, fp, pdb)
+            result['output_file_path'] = fp
+        return result
+
+    async def predict_many(self, sequences, output_dir=None):
+        """
+        Predict many sequences concurrently and yield results as they complete (not in input order).
+        At most 2 * max_concurrency sequences are pulled from `sequences` ahead of the completed ones,
+        so large iterables and generators are not loaded in memory.
+        sequences: iterable of str, or of (name, sequence) tuples. Unnamed sequences are named "seq<index>".
+        output_dir: str, the directory to save the output PDB files to. Defaults to None (PDB strings are returned in the results).
+        yield: dict, see apredict. Also contains the input `index`.
+        """
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+        async def _run(index, item):
+            name, sequence = item if isinstance(item, tuple) else (f"seq{index}", item)
+            try:
+                result = await self.apredict(sequence, name=name, output_dir=output_dir)
+            except Exception as e:
+                # e.g. a malformed response: only this sequence fails, the others keep running
+                logger.error(f"ESMFold prediction of {name} failed with error: {e!r}")
+                result = _failed_result(name, error=repr(e))
+            result['index'] = index
+            return result
+
+        pending = set()
+        items = enumerate(sequences)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < 2 * self.max_concurrency:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(_run(index, item)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+
+def _failed_result(name, error=None):
+    return {
+        'name': name,
+        'success': False,
+        'output_file_path': None,
+        'pdb': None,
+        'error': error,
+        'status_code': None,
+        'cache_hit': False
+    }
+
+
+def _write_text(fp, text):
+    atomic_write_text(fp, text)
+
+
+def predict_many_with_esmfold(sequences, output_dir="output/esmfold_result", query_url=None, max_concurrency=8, cache=None, scheduler=None, callback=None):
+    """
+    Synchronous wrapper around AsyncESMFoldClient.predict_many
+    sequences: iterable of str, or of (name, sequence) tuples
+    output_dir: str, the directory to save the output PDB files to. Defaults to "output/esmfold_result".
+    query_url: str, ESMFold-compatible endpoint. Defaults to the ESMFold NIM endpoint.
+    max_concurrency: int, maximum number of requests in flight
+    cache: DiskCache, cache of predicted PDB strings. Defaults to None (no caching).
+    scheduler: RequestScheduler, rate limits and retries the requests. Defaults to None, each request is sent once.
+    callback: callable, called with each result as soon as it completes
+    return: list[dict], results in completion order
+    """
+    NGC_API_KEY = os.getenv("NVIDIA_NIM_API_KEY")
+
+    async def _main():
+        results = []
+        async with AsyncESMFoldClient(NGC_API_KEY, query_url=query_url, max_concurrency=max_concurrency, cache=cache, scheduler=scheduler) as client:
+            async for result in client.predict_many(sequences, output_dir=output_dir):
+                if callback is not None:
+                    callback(result)
+                results.append(result)
+        return results
+
+    results = asyncio.run(_main())
+    n_success = sum(r['success'] for r in results)
+    logger.info(f"ESMFold predicted {n_success}/{len(results)} structures")
+    return results
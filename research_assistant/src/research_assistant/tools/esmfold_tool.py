@@ -0,0 +1,378 @@
+from crewai.tools import BaseTool
+from typing import Type, List, Optional
+from pydantic import BaseModel, Field
+import os, json, time, threading, requests
+from loguru import logger
+from research_assistant.tools.cache import DiskCache, make_cache_key, normalize_sequence
+from research_assistant.tools.rate_limit import RequestScheduler
+from research_assistant.tools.workspace import Workspace, atomic_write_text
+from research_assistant.tools.tracing import get_tracer, traced
+from research_assistant.tools.custom_tool import FoldToolOutput, add_confidence, preprare_directory
+
+
+class ESMFoldToolInput(BaseModel):
+    """Input schema for ESMFoldTool."""
+    selected_models: List[str] = Field(..., description="List of selected models")
+    structure_name: str = Field(..., description="Name of the structure to predict")
+    sequence: str = Field(..., description="Clean amino acid sequence of this structure, or its handle (seq:...), as written by the Preprocess tool")
+
+
+class ESMFoldRequestError(Exception):
+    """Raised inside a cached ESMFold request when the endpoint does not return 200, so nothing is cached."""
+    def __init__(self, response):
+        super().__init__(f"ESMFold request failed with status code {response.status_code}")
+        self.response = response
+
+
+def cached_esmfold_response(query_url, pdb):
+    """
+    Build a requests.Response for a PDB string served from the cache, so callers of ESMFoldPlayground.predict
+    can handle cache hits like a regular 200 response. The response has `from_cache = True`.
+    query_url: str, the url the request would have been sent to
+    pdb: str, the cached PDB string
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.url = query_url
+    response.headers["Content-Type"] = "application/json"
+    response._content = json.dumps({"pdbs": [pdb]}).encode("utf-8")
+    response.from_cache = True
+    return response
+
+
+def get_esmfold_cache():
+    """
+    Get the process-wide ESMFold prediction cache. Configured with the environment variables:
+    ESMFOLD_CACHE_DIR: directory of the cache, defaults to "cache/esmfold". Set to an empty string to disable the cache.
+    ESMFOLD_CACHE_MAX_BYTES: maximum size of the cache in bytes, defaults to 2 GB
+    ESMFOLD_CACHE_MAX_AGE_DAYS: maximum age of a cached prediction in days, defaults to 30
+    return: DiskCache or None if the cache is disabled
+    """
+    global _esmfold_cache
+    cache_dir = os.getenv("ESMFOLD_CACHE_DIR", os.path.join("cache", "esmfold"))
+    if not cache_dir:
+        return None
+    with _esmfold_cache_lock:
+        if _esmfold_cache is None or _esmfold_cache.root != cache_dir:
+            _esmfold_cache = DiskCache(
+                cache_dir,
+                max_bytes=int(os.getenv("ESMFOLD_CACHE_MAX_BYTES", 2 * 1024**3)),
+                max_age=float(os.getenv("ESMFOLD_CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600,
+                suffix=".pdb",
+            )
+        return _esmfold_cache
+
+_esmfold_cache = None
+_esmfold_cache_lock = threading.Lock()
+
+
+def get_esmfold_scheduler():
+    """
+    Get the process-wide scheduler of ESMFold requests, shared by all calls so that the rate limit applies to the whole process.
+    Configured with the environment variables:
+    ESMFOLD_MAX_REQUESTS_PER_SECOND: rate limit of the requests, defaults to no limit
+    ESMFOLD_BURST: number of requests that can be sent at once, defaults to 1
+    ESMFOLD_MAX_RETRIES: maximum retries of a throttled (429) or failed (5xx) request, defaults to 5
+    return: RequestScheduler
+    """
+    global _esmfold_scheduler
+    with _esmfold_cache_lock:
+        if _esmfold_scheduler is None:
+            rate = os.getenv("ESMFOLD_MAX_REQUESTS_PER_SECOND")
+            _esmfold_scheduler = RequestScheduler(
+                rate=float(rate) if rate else None,
+                burst=int(os.getenv("ESMFOLD_BURST", 1)),
+                max_retries=int(os.getenv("ESMFOLD_MAX_RETRIES", 5)),
+                retry_exceptions=(requests.ConnectionError, requests.Timeout),
+            )
+        return _esmfold_scheduler
+
+_esmfold_scheduler = None
+
+
+def esmfold_output_suffix():
+    """
+    Suffix of the ESMFold outputs of the tool and the batch runs, from the environment variable ESMFOLD_OUTPUT_FORMAT:
+    "pdb" (default), "pdb.gz", "pdb.zst" or "coords.npy", see structure_io.structure_writer
+    """
+    output_format = os.getenv("ESMFOLD_OUTPUT_FORMAT", "pdb").lstrip(".")
+    if output_format not in ("pdb", "pdb.gz", "pdb.zst", "coords.npy"):
+        raise ValueError(f"Unknown ESMFold output format: {output_format}")
+    return f".{output_format}"
+
+
+class ESMFoldPlayground:
+    def __init__(self, NGC_API_KEY, query_url=None, model_version="esmfold", cache=None, scheduler=None):
+        """
+        Initialize the ESMFoldPlayground class
+        NGC_API_KEY: str, the API key to use
+        query_url: str, the url to send the request to. Defaults to env ESMFOLD_URL or the ESMFold NIM endpoint.
+        model_version: str, version of the model behind query_url. Part of the cache key, change it when the endpoint is upgraded.
+        cache: DiskCache, cache of predicted PDB strings. Defaults to None, every call is sent to the endpoint.
+        scheduler: RequestScheduler, rate limits and retries the requests. Defaults to None, each request is sent once.
+        """
+        self.NGC_API_KEY = NGC_API_KEY
+        self.query_url = query_url if query_url is not None else os.getenv("ESMFOLD_URL", "https://health.api.nvidia.com/v1/biology/nvidia/esmfold")
+        self.model_version = model_version
+        self.cache = cache
+        self.scheduler = scheduler
+
+    def cache_key(self, sequence):
+        """
+        Cache key of a sequence: hash of the endpoint, the model version and the normalized sequence
+        """
+        return make_cache_key(self.query_url, self.model_version, normalize_sequence(sequence))
+
+    def _post(self, sequence, stream=False):
+        # prepare data
+        data = {
+            "sequence": sequence,
+        }
+
+        # prepare headers
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.NGC_API_KEY}"
+        }
+        
+        # send request
+        logger.info(f"Sending request to {self.query_url}")
+        with get_tracer().span("esmfold.http", url=self.query_url, sequence_length=len(sequence)) as span:
+            if self.scheduler is None:
+                response = requests.post(self.query_url, headers=headers, json=data, stream=stream)
+            else:
+                response = self.scheduler.call(lambda: requests.post(self.query_url, headers=headers, json=data, stream=stream))
+            span['status_code'] = response.status_code
+        return response
+
+    def _cached_post(self, sequence):
+        def _fetch_pdb():
+            response = self._post(sequence)
+            if response.status_code != 200:
+                raise ESMFoldRequestError(response)
+            return response.json()["pdbs"][0]
+
+        try:
+            pdb, hit = self.cache.get_or_compute(self.cache_key(sequence), _fetch_pdb)
+        except ESMFoldRequestError as e:
+            return e.response
+        if hit:
+            logger.info("ESMFold prediction served from cache")
+        response = cached_esmfold_response(self.query_url, pdb)
+        response.from_cache = hit
+        return response
+
+    @staticmethod
+    def _stream_pdb(response):
+        # the PDB of a 200 response, decoded from the body as it is downloaded
+        from research_assistant.tools.structure_io import PDBStreamDecoder
+        decoder = PDBStreamDecoder()
+        try:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                yield from decoder.feed(chunk)
+            decoder.close()
+        finally:
+            response.close()
+
+    def _fetch_pdb_stream(self, sequence):
+        response = self._post(sequence, stream=True)
+        if response.status_code != 200:
+            raise ESMFoldRequestError(response)
+        return self._stream_pdb(response)
+
+    @traced("esmfold.predict")
+    def predict_to_file(self, sequence, output_path):
+        """
+        Predict the structure of a sequence and stream the PDB of the response to a file: the body is decoded as it
+        is downloaded and written as it is decoded, so the PDB is never held in memory, and no response is returned.
+        sequence: str, single aa sequence
+        output_path: str, the file to write. Its suffix sets the format: .pdb, .pdb.gz, .pdb.zst or .coords.npy,
+            see structure_io.structure_writer. The file is written atomically.
+        return: dict, with keys status_code, output_file_path (None if the request failed), from_cache and error (the body of a failed response)
+        """
+        from research_assistant.tools.structure_io import structure_writer, iter_structure_text
+        result = {'status_code': 200, 'output_file_path': None, 'from_cache': False, 'error': None}
+        try:
+            if self.cache is None:
+                pieces = self._fetch_pdb_stream(sequence)
+            else:
+                # the cache entry is written from the stream, then copied to the output
+                path, result['from_cache'] = self.cache.get_or_compute_path(self.cache_key(sequence), lambda: self._fetch_pdb_stream(sequence))
+                if result['from_cache']:
+                    logger.info("ESMFold prediction served from cache")
+                pieces = iter_structure_text(path)
+        except ESMFoldRequestError as e:
+            logger.error(f"ESMFold Request failed with status code {e.response.status_code}. Output file will not be saved.")
+            result['status_code'] = e.response.status_code
+            result['error'] = e.response.content[:2000]
+            e.response.close()
+            return result
+
+        with structure_writer(output_path) as f:
+            for text in pieces:
+                f.write(text)
+        logger.success(f"ESMFold request successful, saved to {output_path}")
+        result['output_file_path'] = output_path
+        return result
+
+    @traced("esmfold.predict")
+    def predict(self,sequence, output_dir=None, output_file_name="predicted_protein.pdb", delete_old_dir=False):
+        """
+        Main function to run the molecular docking
+        sequence: str, single aa sequence
+        output_dir: str, the directory to save the output to. If there are existing contents, it will be deleted and recreated. Defaults to None, and it will not save the output PDB file. 
+        output_file_name: str, the name of the output PDB file. Defaults to "predicted_protein.pdb". Only used when output_dir is not None.
+        delete_old_dir: bool, whether to delete the old directory. Defaults to True.
+        return response object. If a cache is set, `response.from_cache` tells whether the prediction was served from the cache.
+            The whole response is held in memory, use predict_to_file for long sequences and large batches.
+        """
+
+        # prepare output directory
+        if output_dir is not None:
+            logger.info(f"Preparing output directory: {output_dir}")
+            preprare_directory(output_dir, delete_old=delete_old_dir)
+
+        # send request, or read the prediction from the cache
+        if self.cache is None:
+            response = self._post(sequence)
+        else:
+            response = self._cached_post(sequence)
+        
+        # check response
+        if response.status_code == 200:
+            logger.success("ESMFold request successful")
+            # get the result
+            result = response.json()
+            # Write PDB file
+            if output_dir is not None:
+                atomic_write_text(os.path.join(output_dir, output_file_name), result["pdbs"][0])
+        else:
+            logger.error(f"ESMFold Request failed with status code {response.status_code}. Output file will not be saved.")
+            logger.error("Response content:", response.content)
+            
+        return response
+    
+
+def predict_with_esmfold(sequence, output_dir="output/esmfold_result", output_file_name="predicted_structure.pdb", delete_old_dir=True, cache=None, query_url=None):
+    """
+    Predict the structure of a single chain with the ESMFold NIM
+    sequence: str, clean amino acid sequence
+    output_dir: str, the directory to save the output PDB file. Defaults to "output/esmfold_result".
+    output_file_name: str, the name of the output PDB file. Defaults to "predicted_structure.pdb".
+        Its suffix sets the format: .pdb, .pdb.gz, .pdb.zst or .coords.npy, see structure_io.structure_writer.
+    delete_old_dir: bool, whether to delete the old directory. Defaults to True.
+    cache: DiskCache, cache of predictions. Defaults to None, which uses get_esmfold_cache().
+    query_url: str, ESMFold-compatible endpoint. Defaults to the ESMFold NIM endpoint.
+    return: dict, the result of the prediction. `cache_hit` tells whether the prediction was served from the cache.
+    """
+    # get NGC API key
+    NGC_API_KEY = os.getenv("NVIDIA_NIM_API_KEY")
+
+    # initialize the ESMFoldPlayground class
+    esmfold_playground = ESMFoldPlayground(
+        NGC_API_KEY=NGC_API_KEY,
+        query_url=query_url,
+        cache=cache if cache is not None else get_esmfold_cache(),
+        scheduler=get_esmfold_scheduler()
+    )
+
+    # run prediction
+    output_file_path = os.path.join(output_dir, output_file_name)
+    try: 
+        preprare_directory(output_dir, delete_old=delete_old_dir)
+        response = esmfold_playground.predict_to_file(sequence, output_file_path)
+        cache_hit = response['from_cache']
+        if esmfold_playground.cache is not None:
+            logger.info(f"ESMFold cache {'hit' if cache_hit else 'miss'}, stats: {esmfold_playground.cache.stats()}")
+        if response['status_code'] == 200:
+            return {
+                'success': True,
+                'output_file_path': output_file_path, 
+                'error': None,
+                'cache_hit': cache_hit
+            }
+        else:
+            logger.error(f"ESMFold request failed after retries, scheduler metrics: {esmfold_playground.scheduler.metrics()}")
+            return {
+                'success': False,
+                'error': response['error'], 
+                'output_file_path': None,
+                'cache_hit': cache_hit
+            }
+
+    except Exception as e:
+        print(f"Failed to predict with ESMFold with error: {e}")
+        return {
+            'success': False,
+            'error': str(e), 
+            'output_file_path': None,
+            'cache_hit': False
+        }
+
+
+
+class ESMFoldTool(BaseTool):
+
+    name: str = "Using ESMFold to predict protein structure"
+    description: str = "Use ESMFold to predict the structure of a protein"
+    args_schema: Type[BaseModel] = ESMFoldToolInput
+    workspace: Optional[Workspace] = None # directories of the job. Defaults to a new workspace per call.
+
+    @traced("tool.esmfold")
+    def _run(self, selected_models: List[str], structure_name: str, sequence: str) -> str:
+
+        # directory to save the output, unique to this job
+        workspace = self.workspace or Workspace()
+        output_base_dir = workspace.path("output/esmfold_result")
+        logger.debug(f"Prepared output directory: {output_base_dir}")
+
+        result = FoldToolOutput(
+            model_name="ESMFold",
+        )
+
+        # check if ESMFold is in the selected models
+        if "ESMFold" not in selected_models:
+            result.model_is_selected = False
+            result.output_file_path = None
+            result.success = False
+        else:
+            # the agent passes the handle of the sequence
+            from research_assistant.tools.sequence_store import resolve_sequences
+            try:
+                sequence = resolve_sequences([sequence])[0]
+            except ValueError as e:
+                logger.error(f"ESMFold input of {structure_name}: {e}")
+                result.model_is_selected = True
+                result.error = str(e)
+                return str(result)
+
+            # generate output file name
+            output_file_name= f"{structure_name}{esmfold_output_suffix()}"
+            
+            # predict the structure
+            logger.warning(f"Predicting the structure of {structure_name} with ESMFold")
+            started = time.perf_counter()
+            pred_r = predict_with_esmfold(sequence, output_dir=output_base_dir, output_file_name=output_file_name, delete_old_dir=False)
+            runtime = time.perf_counter() - started
+
+            # update the result
+            result.success = pred_r['success']
+            result.output_file_path = pred_r['output_file_path']
+            result.model_is_selected = True
+            if result.success:
+                if not pred_r.get('cache_hit'):
+                    from research_assistant.tools.resources import get_fold_scheduler
+                    get_fold_scheduler().estimator.observe("ESMFold", [sequence], seconds=runtime)
+                add_confidence(result, result.output_file_path)
+
+            # index the prediction
+            from research_assistant.tools.results_store import record_prediction
+            record_prediction([sequence], "ESMFold", result, runtime=runtime, structure_name=structure_name, job_id=workspace.job_id,
+                              parameters={'query_url': os.getenv("ESMFOLD_URL")})
+
+            cache = get_esmfold_cache()
+            if cache is not None:
+                stats = cache.stats()
+                logger.info(f"ESMFold cache {'hit' if pred_r.get('cache_hit') else 'miss'} for {structure_name} (hits: {stats['hits']}, misses: {stats['misses']})")
+        
+        return str(result)
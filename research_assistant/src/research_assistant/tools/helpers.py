@@ -1,3 +1,4 @@
+import re, json
 import yaml
 
 class IndentDumper(yaml.SafeDumper):
@@ -8,13 +9,85 @@ class IndentDumper(yaml.SafeDumper):
         # Ensure that list items are indented properly
         return super(IndentDumper, self).increase_indent(flow, False)
 
-def write_sequences_to_yaml(sequences, output_file):
+def chain_id(index):
+    """
+    Spreadsheet-style chain ID: A..Z, then AA..AZ, BA..ZZ, AAA.. (bijective base 26)
+    index: int, 0-based index of the chain
+    return: str
+    """
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def boltz_entities(sequences, msa_paths=None):
+    """
+    Group the chains of a structure into Boltz entities: identical chains (e.g. the copies of a homomer) become one
+    entity with the list of their chain IDs, so that Boltz processes and searches the MSA of each sequence once.
+    Entities are in order of first appearance, the order in which Boltz numbers them (see msa_store.harvest_msas).
+    Chain i keeps the ID chain_id(i).
+    sequences: list[str], chain sequences
+    msa_paths: list[str], MSA file of each chain, None for the chains left to the MSA server
+    return: list[dict], with keys ids (list of chain IDs), sequence and msa
+    """
+    if msa_paths is not None and len(msa_paths) != len(sequences):
+        raise ValueError("msa_paths must have one entry per sequence.")
+    entities = {}
+    for i, seq in enumerate(sequences):
+        msa = msa_paths[i] if msa_paths is not None else None
+        entity = entities.setdefault((seq, msa), {'ids': [], 'sequence': seq, 'msa': msa})
+        entity['ids'].append(chain_id(i))
+    return list(entities.values())
+
+
+# YAML 1.1 words that a YAML reader would not read back as strings
+_YAML_WORDS = {"Y", "N", "YES", "NO", "ON", "OFF", "TRUE", "FALSE", "NULL"}
+
+
+_YAML_PLAIN = re.compile(r"[A-Za-z_/][A-Za-z0-9_./-]*")
+
+
+def _yaml_scalar(value):
+    # sequences, chain IDs and simple paths are written as they are, anything else as a JSON string (valid YAML)
+    if _YAML_PLAIN.fullmatch(value) and value.upper() not in _YAML_WORDS:
+        return value
+    return json.dumps(value)
+
+
+def render_boltz_yaml(entities):
+    """
+    Boltz input YAML of protein entities, rendered from a template: the same document as yaml.dump with
+    IndentDumper, without the cost of the generic serializer (see benchmarks/bench_boltz_yaml.py)
+    entities: list[dict], from boltz_entities
+    return: str
+    """
+    lines = ["version: 1", "sequences:"]
+    for entity in entities:
+        ids = entity['ids']
+        lines.append("  - protein:")
+        if len(ids) == 1:
+            lines.append(f"      id: {_yaml_scalar(ids[0])}")
+        else:
+            lines.append(f"      id: [{', '.join(_yaml_scalar(i) for i in ids)}]")
+        lines.append(f"      sequence: {_yaml_scalar(entity['sequence'])}")
+        if entity.get('msa') is not None:
+            lines.append(f"      msa: {_yaml_scalar(entity['msa'])}")
+    return "\n".join(lines) + "\n"
+
+
+def write_sequences_to_yaml(sequences, output_file, msa_paths=None):
     """
     Write a list of sequences to a YAML file in the specified format with proper indentation.
+    Chains get spreadsheet-style IDs (A..Z, AA..), and identical chains are written as one entity, see boltz_entities.
 
     Parameters:
         sequences (list): List of protein sequences as strings.
         output_file (str): Path to the YAML file to write.
+        msa_paths (list): Optional list of MSA file paths aligned with sequences. Chains with a path get an explicit
+            `msa:` entry so that Boltz does not send them to the MSA server; None entries are left to the server.
 
     # Example usage:
     ```python
@@ -27,38 +100,16 @@ def write_sequences_to_yaml(sequences, output_file):
     """
     if not sequences:
         raise ValueError("The sequences list cannot be empty.")
-    
-    # YAML structure
-    yaml_data = {
-        "version": 1,  # Optional, defaults to 1
-        "sequences": []
-    }
-
-    # Generate sequence entries with unique IDs
-    for i, seq in enumerate(sequences):
-        entry = {
-            "protein": {
-                "id": chr(65 + i),  # 'A', 'B', 'C', ...
-                "sequence": seq
-            }
-        }
-        yaml_data["sequences"].append(entry)
-
-    # Write to the output file with proper formatting and indentation
-    with open(output_file, 'w') as file:
-        yaml.dump(
-            yaml_data, 
-            file, 
-            Dumper=IndentDumper,        # Use the custom dumper
-            default_flow_style=False, 
-            sort_keys=False,            # Ensures 'version' stays at the top
-            indent=2,                   # Increased indentation for better readability
-        )
+
+    # The file is replaced atomically, so a concurrent Boltz run never reads a partial input.
+    from research_assistant.tools.workspace import atomic_write_text
+    atomic_write_text(output_file, render_boltz_yaml(boltz_entities(sequences, msa_paths)))
 
 
 def get_run_id():
     """
-    Get a run ID in the format of YYMMDD-HHMM, e.g. 241201-1430
+    Get a run ID in the format of YYMMDD-HHMM, e.g. 241201-1430.
+    Not unique between jobs started in the same minute: use Workspace for job directories.
     """
     from datetime import datetime
     return datetime.now().strftime("run-date-%y%m%d-time-%H%M")
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Exact-match cache of the responses of the LLM of the agents. Replaying an input (e.g. `replay`, or a batch
+submitted again) renders the same prompts, so the LLM turns are read from the cache and only the tools run.
+Responses are keyed on the model, the rendered prompt (all the messages of the turn), the stop words and
+the hash of the schemas of the tools the agent can call, and stored in a DiskCache (age and size eviction).
+Agents whose prompts depend on a human (human_input) are built without the cache, see ResearchAssistant._agent.
+"""
+import os, json, time, threading
+from crewai.llms.base_llm import BaseLLM
+from loguru import logger
+
+from research_assistant.tools.cache import DiskCache, make_cache_key
+from research_assistant.tools.tracing import get_tracer
+
+
+def tool_schema_hash(tools=None, agent=None):
+    """
+    Hash of the tools an LLM turn can call
+    tools: list[dict], tool schemas passed to the LLM for native function calling
+    agent: crewai Agent, whose tools are described in the prompt (ReAct)
+    return: str, hex digest
+    """
+    schemas = list(tools or [])
+    for tool in getattr(agent, "tools", None) or []:
+        args_schema = getattr(tool, "args_schema", None)
+        schemas.append({
+            'name': tool.name,
+            'description': tool.description,
+            'args': args_schema.model_json_schema() if args_schema is not None else None,
+        })
+    return make_cache_key(json.dumps(schemas, sort_keys=True, default=str))
+
+
+class CachedLLM(BaseLLM):
+    """
+    LLM that answers from a DiskCache when it has seen the exact same turn before, and otherwise calls the wrapped LLM
+    and stores its response. Only text responses are cached: calls with native function calling (available_functions),
+    which run the functions inside the call, are always sent to the wrapped LLM.
+    Hits and misses are counted by the cache (DiskCache.stats) and traced as llm_cache.hit / llm_cache.miss spans.
+    """
+    def __init__(self, llm, cache):
+        """
+        llm: BaseLLM, the LLM to call on a miss
+        cache: DiskCache, the responses
+        """
+        super().__init__(model=llm.model, temperature=getattr(llm, "temperature", None), stop=list(getattr(llm, "stop", None) or []))
+        self.llm = llm
+        self.cache = cache
+
+    def cache_key(self, messages, tools=None, agent=None):
+        return make_cache_key(
+            "llm", self.model, self.temperature, json.dumps(messages, sort_keys=True, default=str),
+            json.dumps(sorted(self.stop)), tool_schema_hash(tools, agent),
+        )
+
+    def _trace(self, name, started, from_agent):
+        trace_id, agent = get_tracer().agent(from_agent.id) if from_agent is not None else (None, None)
+        get_tracer().record(name, time.perf_counter() - started, trace_id=trace_id, agent=agent, model=self.model)
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        # the stop words are set on this LLM by the agent executor
+        self.llm.stop = self.stop
+        if available_functions:
+            return self.llm.call(messages, tools=tools, callbacks=callbacks, available_functions=available_functions, from_task=from_task, from_agent=from_agent)
+
+        started = time.perf_counter()
+        key = self.cache_key(messages, tools, from_agent)
+        response = self.cache.get(key)
+        if response is not None:
+            self._trace("llm_cache.hit", started, from_agent)
+            return response
+
+        response = self.llm.call(messages, tools=tools, callbacks=callbacks, from_task=from_task, from_agent=from_agent)
+        if isinstance(response, str) and response.strip():
+            try:
+                self.cache.put(key, response)
+            except OSError as e:
+                logger.warning(f"Could not cache the response of {self.model}: {e}")
+        self._trace("llm_cache.miss", started, from_agent)
+        return response
+
+    def supports_function_calling(self):
+        return self.llm.supports_function_calling()
+
+    def supports_stop_words(self):
+        return self.llm.supports_stop_words()
+
+    def get_context_window_size(self):
+        return self.llm.get_context_window_size()
+
+
+def get_llm_cache():
+    """
+    Get the process-wide cache of LLM responses. Configured with the environment variables:
+    LLM_CACHE_DIR: directory of the cache, defaults to "cache/llm". Set to an empty string to disable the cache.
+    LLM_CACHE_MAX_BYTES: maximum size of the cache in bytes, defaults to 512 MB
+    LLM_CACHE_MAX_AGE_DAYS: maximum age of a cached response in days, defaults to 7
+    return: DiskCache or None if the cache is disabled
+    """
+    global _llm_cache
+    root = os.getenv("LLM_CACHE_DIR", os.path.join("cache", "llm"))
+    if not root:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None or _llm_cache.root != root:
+            _llm_cache = DiskCache(
+                root,
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 512 * 1024**2)),
+                max_age=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", 7)) * 24 * 3600,
+                suffix=".txt",
+            )
+        return _llm_cache
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def cached_llm(llm=None):
+    """
+    Wrap the LLM of an agent with the process-wide cache, if enabled
+    llm: BaseLLM, defaults to the crewai default LLM (configured by the MODEL environment variable)
+    return: CachedLLM, or llm if the cache is disabled
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return llm
+    if llm is None:
+        from crewai.utilities.llm_utils import create_llm
+        llm = create_llm(None)
+    return CachedLLM(llm, cache)
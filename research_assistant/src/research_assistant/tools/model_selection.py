@@ -0,0 +1,154 @@
+import re
+from loguru import logger
+
+from research_assistant.tools.custom_tool import ModelSelectionOutput
+from research_assistant.tools.backends import backends, backend_names
+
+
+NO_SUITABLE_MODEL = "No suitable model found"
+_APPROVAL = re.compile(
+    r"^\s*(?:y|yes|yep|ok|okay|sure|agree[d]?|i agree|approve[d]?|lgtm|looks good(?: to me)?|sounds good|fine|go ahead|proceed|correct|perfect)?[\s.!]*$",
+    re.IGNORECASE,
+)
+_ONLY = re.compile(r"\b(?:only|just|solely)\b", re.IGNORECASE)
+_NEGATION = re.compile(r"\b(?:no|not|don'?t|do not|without|remove|drop|skip|exclude)\b", re.IGNORECASE)
+# models added to the proposal, e.g. "add Boltz", "ESMFold too", "also run ESMFold as well"
+_ADDITION = re.compile(r"\b(?:add|also|too|as\s+well)\b", re.IGNORECASE)
+# a model in place of another, e.g. "use Boltz instead of ESMFold"
+_INSTEAD_OF = re.compile(r"\binstead\s+of\b", re.IGNORECASE)
+# words that may appear around model names in simple feedback, e.g. "please use only Boltz-1"
+_FILLER = re.compile(
+    r"\b(?:please|pls|use|run|select|choose|pick|keep|with|and|both|the|model|models|them|i|want|would|like|to|prefer)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_model_name(name):
+    """
+    Normalize a model name written by a person or an LLM
+    name: str, e.g. "Boltz-1", "boltz 1", "esmfold"
+    return: str, the name of a registered backend, or None if the name is not an available model
+    """
+    for backend in backends():
+        if backend.pattern.fullmatch(name.strip()):
+            return backend.name
+    return None
+
+
+def parse_num_chains(preprocess_output):
+    """
+    Number of chains in the output of the Preprocess tool (the str of a PreprocessOutput)
+    preprocess_output: str, raw output of the preprocess task
+    return: int, or None if the output was not written by the Preprocess tool
+    """
+    match = re.search(r"\bnum_chains=(\d+)", preprocess_output or "")
+    return int(match.group(1)) if match else None
+
+
+def _mentioned_models(text):
+    return [backend.name for backend in backends() if backend.pattern.search(text)]
+
+
+def _without_models(text):
+    for backend in backends():
+        text = backend.pattern.sub(" ", text)
+    return text
+
+
+def _selected(models):
+    return f"{' and '.join(models)} {'is' if len(models) == 1 else 'are'}"
+
+
+def _apply_rules(models, num_chains, reasons):
+    """
+    Keep the models that can predict a structure with num_chains chains, in the order of the registered backends
+    """
+    selected = []
+    for backend in backends():
+        if backend.name not in models:
+            continue
+        if not backend.supports(num_chains):
+            limit = "single chain proteins" if backend.max_chains == 1 else f"structures of up to {backend.max_chains} chains"
+            reasons.append(f"{backend.name} is not selected because it only predicts {limit}, and this structure has {num_chains} chains.")
+            continue
+        selected.append(backend.name)
+    return selected
+
+
+def _output(selected, reasons):
+    if not selected:
+        selected = [NO_SUITABLE_MODEL]
+    return ModelSelectionOutput(selected_models=selected, explanation=" ".join(reasons))
+
+
+def select_models(num_chains):
+    """
+    Initial proposal of the models for a structure, following the rules of the model_selection_agent:
+    ESMFold only predicts single chain proteins, Boltz predicts single chains and complexes (see backends.FoldBackend.max_chains).
+    num_chains: int, number of chains of the structure
+    return: ModelSelectionOutput
+    """
+    if num_chains < 1:
+        return ModelSelectionOutput(
+            selected_models=[NO_SUITABLE_MODEL],
+            explanation="No valid chain was found in the input. Please inspect the input sequences."
+        )
+    reasons = []
+    selected = _apply_rules(backend_names(), num_chains, reasons)
+    if not selected:
+        reasons.insert(0, f"No available model can predict a structure with {num_chains} chains.")
+    elif num_chains == 1:
+        reasons.insert(0, f"The structure has a single chain, so {'both ' if len(selected) == 2 else ''}{' and '.join(selected)} can predict it.")
+    else:
+        reasons.insert(0, f"The structure has {num_chains} chains, so {' and '.join(selected)} {'is' if len(selected) == 1 else 'are'} selected.")
+    return _output(selected, reasons)
+
+
+def apply_feedback(proposal, num_chains, feedback):
+    """
+    Revise the proposal with simple human feedback: an approval ("yes", "looks good"), a list of models
+    ("only Boltz-1", "use ESMFold and Boltz"), models to add ("add Boltz", "ESMFold too"), models to remove
+    ("no ESMFold", "skip boltz") or a model in place of another ("use Boltz instead of ESMFold").
+    The rules are enforced on the revised selection, e.g. ESMFold is declined for complexes.
+    proposal: ModelSelectionOutput, the initial proposal from select_models
+    num_chains: int, number of chains of the structure
+    feedback: str, the human feedback
+    return: ModelSelectionOutput, or None if the feedback is free text that the model_selection_agent has to interpret
+    """
+    if _APPROVAL.match(feedback or ""):
+        return proposal
+
+    parts = _INSTEAD_OF.split(feedback)
+    if len(parts) == 2:
+        wanted, replaced = _mentioned_models(parts[0]), _mentioned_models(parts[1])
+        if not wanted or not replaced or set(wanted) & set(replaced) or any(re.search(r"\w", _FILLER.sub(" ", _without_models(part))) for part in parts):
+            logger.info("Human feedback on the model selection needs to be interpreted by the model selection agent")
+            return None
+        models = [model for model in proposal.selected_models if model not in replaced] + wanted
+        reasons = [f"Following the human feedback, {_selected(wanted)} selected instead of {' and '.join(replaced)}."]
+        return _output(_apply_rules(models, num_chains, reasons), reasons)
+
+    mentioned = _mentioned_models(feedback)
+    rest = _without_models(feedback)
+    negated = bool(_NEGATION.search(rest))
+    added = bool(_ADDITION.search(rest))
+    rest = _FILLER.sub(" ", _ADDITION.sub(" ", _NEGATION.sub(" ", _ONLY.sub(" ", rest))))
+    if not mentioned or re.search(r"\w", rest):
+        logger.info("Human feedback on the model selection needs to be interpreted by the model selection agent")
+        return None
+    if (negated and (_ONLY.search(feedback) or len(mentioned) == len(backends()))) or (added and (negated or _ONLY.search(feedback))):
+        # e.g. "not only Boltz", "no ESMFold, use Boltz", "add only Boltz": leave it to the agent
+        logger.info("Human feedback on the model selection needs to be interpreted by the model selection agent")
+        return None
+
+    if negated:
+        models = [model for model in proposal.selected_models if model not in mentioned]
+        reasons = [f"Following the human feedback, {_selected(mentioned)} not selected."]
+    elif added:
+        models = proposal.selected_models + mentioned
+        reasons = [f"Following the human feedback, {_selected(mentioned)} also selected."]
+    else:
+        models = mentioned
+        reasons = [f"Following the human feedback, {_selected(mentioned)} selected."]
+    selected = _apply_rules(models, num_chains, reasons)
+    return _output(selected, reasons)
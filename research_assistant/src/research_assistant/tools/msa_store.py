@@ -0,0 +1,121 @@
+import os, threading
+from loguru import logger
+
+from research_assistant.tools.cache import DiskCache, make_cache_key, normalize_sequence
+
+
+class MSAStore:
+    """
+    Local store of the MSAs computed by the Boltz MSA server, keyed by the hash of the chain sequence.
+    Entries are Boltz MSA files (.csv, which keeps the pairing keys), and can be passed to Boltz with
+    an explicit `msa:` path in the input YAML so that only new chains are sent to the MSA server.
+    """
+    def __init__(self, root=os.path.join("cache", "msa"), max_bytes=20 * 1024**3, max_age=90 * 24 * 3600):
+        """
+        root: str, directory of the store
+        max_bytes: int, maximum size of the store in bytes, least recently used MSAs are evicted first
+        max_age: float, maximum age of an MSA in seconds, so that MSAs are refreshed when the databases are updated
+        """
+        self.cache = DiskCache(root, max_bytes=max_bytes, max_age=max_age, suffix=".csv")
+
+    @staticmethod
+    def key(sequence):
+        return make_cache_key("msa", normalize_sequence(sequence))
+
+    def lookup(self, sequence):
+        """
+        Path of the MSA of a chain
+        sequence: str, amino acid sequence of the chain
+        return: str, absolute path of the MSA file, or None if the MSA is not in the store
+        """
+        path = self.cache.get_path(self.key(sequence))
+        return os.path.abspath(path) if path is not None else None
+
+    def add(self, sequence, msa_path, unpair=False):
+        """
+        Copy an MSA file to the store
+        sequence: str, amino acid sequence of the chain
+        msa_path: str, path to the MSA file in Boltz csv format (key,sequence)
+        unpair: bool, whether to reset the pairing keys to -1. Pairing keys only match between the MSAs of the
+            complex they were computed for, so they must not be reused with the MSAs of other chains.
+        """
+        with open(msa_path, "r") as f:
+            msa = f.read()
+        if unpair:
+            header, *rows = msa.split("\n")
+            msa = "\n".join([header] + ["-1," + row.split(",", 1)[1] for row in rows if "," in row])
+        self.cache.put(self.key(sequence), msa)
+
+    def report(self):
+        """
+        return: dict, hit/miss counters and the number and total size of the stored MSAs
+        """
+        stats = self.cache.stats()
+        stats["entries"], stats["bytes"] = self.cache.usage()
+        return stats
+
+
+def get_msa_store():
+    """
+    Get the process-wide MSA store. Configured with the environment variables:
+    MSA_CACHE_DIR: directory of the store, defaults to "cache/msa". Set to an empty string to disable the store.
+    MSA_CACHE_MAX_BYTES: maximum size of the store in bytes, defaults to 20 GB
+    MSA_CACHE_MAX_AGE_DAYS: maximum age of an MSA in days, defaults to 90
+    return: MSAStore or None if the store is disabled
+    """
+    global _msa_store
+    root = os.getenv("MSA_CACHE_DIR", os.path.join("cache", "msa"))
+    if not root:
+        return None
+    with _msa_store_lock:
+        if _msa_store is None or _msa_store.cache.root != root:
+            _msa_store = MSAStore(
+                root,
+                max_bytes=int(os.getenv("MSA_CACHE_MAX_BYTES", 20 * 1024**3)),
+                max_age=float(os.getenv("MSA_CACHE_MAX_AGE_DAYS", 90)) * 24 * 3600,
+            )
+        return _msa_store
+
+_msa_store = None
+_msa_store_lock = threading.Lock()
+
+
+def prepare_msas(store, sequences):
+    """
+    Look up the MSAs of the chains of a structure. Identical chains (e.g. both copies of a homodimer) are looked up once.
+    store: MSAStore
+    sequences: list[str], normalized chain sequences
+    return: tuple, (list of MSA paths aligned with sequences, None for chains without a stored MSA,
+        list of the unique sequences that have to be sent to the MSA server)
+    """
+    unique = list(dict.fromkeys(sequences))
+    found = {seq: store.lookup(seq) for seq in unique}
+    misses = [seq for seq in unique if found[seq] is None]
+    logger.info(f"MSA store: {len(unique) - len(misses)}/{len(unique)} unique chains found ({len(sequences)} chains)")
+    return [found[seq] for seq in sequences], misses
+
+
+def harvest_msas(store, boltz_output_dir, name, sequences, misses):
+    """
+    Copy the MSAs that Boltz fetched from the MSA server to the store.
+    Boltz groups identical chains into entities numbered in order of first appearance, and saves the MSA of
+    entity i of structure <name> to <boltz_output_dir>/msa/<name>_<i>.csv
+    store: MSAStore
+    boltz_output_dir: str, the boltz_results_<input> directory of the run
+    name: str, name of the structure (the input YAML file name without extension)
+    sequences: list[str], normalized chain sequences of the structure, as written to the YAML file
+    misses: list[str], the sequences that were not in the store
+    return: int, number of MSAs added to the store
+    """
+    added = 0
+    unique = list(dict.fromkeys(sequences))
+    for entity_id, seq in enumerate(unique):
+        if seq not in misses:
+            continue
+        msa_path = os.path.join(boltz_output_dir, "msa", f"{name}_{entity_id}.csv")
+        if os.path.exists(msa_path):
+            store.add(seq, msa_path, unpair=len(unique) > 1)
+            added += 1
+        else:
+            logger.warning(f"Boltz did not save the MSA of entity {entity_id} of {name} to {msa_path}")
+    return added
@@ -0,0 +1,273 @@
+import time, random, asyncio, threading
+from email.utils import parsedate_to_datetime
+from loguru import logger
+
+
+# status codes worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header value
+    value: str, either a number of seconds or an HTTP date
+    return: float, seconds to wait, or None if the value can't be parsed
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, rng=random):
+    """
+    Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2**attempt)]
+    attempt: int, number of the retry, starting from 0
+    base: float, base delay in seconds
+    cap: float, maximum delay in seconds
+    """
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens refill at `rate` per second up to `burst`.
+    Callers reserve a token and are told how long to wait for it, so waiting callers are served in order.
+    pause() stops handing out tokens for a while, e.g. when the server answers with Retry-After.
+    """
+    def __init__(self, rate, burst=1):
+        """
+        rate: float, tokens per second
+        burst: int, maximum number of tokens that can accumulate
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token. return: float, seconds the caller has to wait before using it
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds):
+        """
+        Don't hand out tokens for the next `seconds` seconds
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryBudget:
+    """
+    Limit retries to a fraction of the traffic, so that retries can't multiply the load on an endpoint that is already failing.
+    Each first attempt deposits `ratio` tokens, each retry withdraws one.
+    """
+    def __init__(self, ratio=0.2, min_tokens=10):
+        """
+        ratio: float, retries allowed per request on average
+        min_tokens: int, retries always allowed, also the initial balance
+        """
+        self.ratio = ratio
+        self.max_tokens = float(min_tokens)
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens + self.ratio, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        return: bool, whether a retry is allowed
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RequestScheduler:
+    """
+    Send requests through a token bucket and retry throttled (429) and transient (5xx) responses
+    with jittered exponential backoff, honoring Retry-After, within a retry budget.
+
+    Example usage:
+    ```python
+    scheduler = RequestScheduler(rate=0.6, burst=5)  # ~40 requests per minute
+    response = scheduler.call(lambda: requests.post(url, json=data))
+    print(scheduler.metrics())
+    ```
+    """
+    def __init__(self, rate=None, burst=1, max_retries=5, backoff_base=1.0, backoff_cap=60.0, retry_budget=None, retry_exceptions=(), rng=None):
+        """
+        rate: float, maximum requests per second. Defaults to None (no rate limit).
+        burst: int, number of requests that can be sent at once when the bucket is full
+        max_retries: int, maximum number of retries of a single request
+        backoff_base: float, base delay of the exponential backoff in seconds
+        backoff_cap: float, maximum backoff delay in seconds
+        retry_budget: RetryBudget, shared retry budget. Defaults to RetryBudget().
+        retry_exceptions: tuple, exception types that are retried like a 5xx response (e.g. connection errors)
+        rng: random.Random, random generator of the jitter
+        """
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        self.retry_exceptions = tuple(retry_exceptions)
+        self.rng = rng if rng is not None else random.Random()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "responses": 0,
+            "retries": 0,
+            "throttled": 0,
+            "server_errors": 0,
+            "exceptions": 0,
+            "retry_budget_exhausted": 0,
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "in_flight": 0,
+            "rate_limit_wait_seconds": 0.0,
+            "backoff_wait_seconds": 0.0,
+        }
+
+    def _add(self, name, value=1):
+        with self._lock:
+            self._metrics[name] += value
+            if name == "queue_depth":
+                self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._metrics["queue_depth"])
+
+    def metrics(self):
+        """
+        return: dict, counters of the scheduler. queue_depth is the number of requests waiting for a token right now.
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+    def _token_wait(self):
+        return self.bucket.reserve() if self.bucket is not None else 0.0
+
+    def _retry_delay(self, attempt, response, error):
+        """
+        Decide whether to retry. return: float, delay before the retry, or None to give up
+        """
+        if error is not None:
+            if not isinstance(error, self.retry_exceptions):
+                return None
+            self._add("exceptions")
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                return None
+            self._add("throttled" if response.status_code == 429 else "server_errors")
+
+        if attempt >= self.max_retries:
+            return None
+        if not self.retry_budget.withdraw():
+            self._add("retry_budget_exhausted")
+            logger.warning("Retry budget exhausted, not retrying")
+            return None
+
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, self.rng)
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            # the server asked everybody to slow down, not only this request
+            if self.bucket is not None:
+                self.bucket.pause(retry_after)
+        self._add("retries")
+        return delay
+
+    def call(self, send):
+        """
+        Send a request with rate limiting and retries
+        send: callable, sends the request and returns a response with `status_code` and `headers`
+        return: the last response. Exceptions not listed in retry_exceptions, or raised by the last attempt, are propagated.
+        """
+        self._add("requests")
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            wait = self._token_wait()
+            if wait > 0:
+                self._add("queue_depth")
+                self._add("rate_limit_wait_seconds", wait)
+                time.sleep(wait)
+                self._add("queue_depth", -1)
+
+            response, error = None, None
+            self._add("in_flight")
+            try:
+                response = send()
+                self._add("responses")
+            except Exception as e:
+                error = e
+            finally:
+                self._add("in_flight", -1)
+
+            delay = self._retry_delay(attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            logger.warning(f"Retrying request in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}): {error if error is not None else response.status_code}")
+            if response is not None and hasattr(response, "close"):
+                # release the connection of a streamed response
+                response.close()
+            self._add("backoff_wait_seconds", delay)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, send):
+        """
+        Async version of call()
+        send: callable returning an awaitable of the response
+        """
+        self._add("requests")
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            wait = self._token_wait()
+            if wait > 0:
+                self._add("queue_depth")
+                self._add("rate_limit_wait_seconds", wait)
+                await asyncio.sleep(wait)
+                self._add("queue_depth", -1)
+
+            response, error = None, None
+            self._add("in_flight")
+            try:
+                response = await send()
+                self._add("responses")
+            except Exception as e:
+                error = e
+            finally:
+                self._add("in_flight", -1)
+
+            delay = self._retry_delay(attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            logger.warning(f"Retrying request in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}): {error if error is not None else response.status_code}")
+            self._add("backoff_wait_seconds", delay)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,66 @@
+import re, ast
+
+from research_assistant.tools.custom_tool import FoldToolOutput
+
+
+# field=value pairs of the string representation of a pydantic model, e.g. "success=True output_file_path='a.pdb' mean_plddt=85.2"
+_FIELD = re.compile(r"(\w+)=('(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|True|False|None|-?\d+(?:\.\d+)?(?:e-?\d+)?)")
+
+
+def parse_fold_output(raw):
+    """
+    Parse the output of a folding tool (the str of a FoldToolOutput, returned as the task output by result_as_answer)
+    raw: str, raw output of the folding task
+    return: FoldToolOutput, or None if the output was not written by a folding tool
+    """
+    fields = {name: ast.literal_eval(value) for name, value in _FIELD.findall(raw or "")}
+    if "model_name" not in fields or "model_is_selected" not in fields:
+        return None
+    fields = {name: value for name, value in fields.items() if name in FoldToolOutput.model_fields and value is not None}
+    return FoldToolOutput(**fields)
+
+
+def _yes_no(value):
+    return "Yes" if value else "No"
+
+
+def render_report(outputs):
+    """
+    Render the final report from the outputs of the folding tasks, in the format of the reporter_task
+    outputs: list[str], raw outputs of the folding tasks
+    return: str, the report
+    """
+    lines = ["Final Report: "]
+    ranked = []
+    for raw in outputs:
+        result = parse_fold_output(raw)
+        if result is None:
+            # the agent answered without calling its tool
+            lines.append(f"- {raw.strip()}")
+            continue
+        lines.append(f"- {result.model_name}")
+        lines.append(f"    - Selected: {_yes_no(result.model_is_selected)}")
+        if result.model_is_selected:
+            lines.append(f"    - Prediction successful: {_yes_no(result.success)}")
+            if result.success:
+                lines.append(f"    - Results: {result.output_file_path}")
+                lines += _confidence_lines(result)
+                if result.mean_plddt is not None:
+                    ranked.append(result)
+            elif result.error:
+                lines.append(f"    - Reason: {result.error}")
+    if len(ranked) > 1:
+        ranked.sort(key=lambda r: r.mean_plddt, reverse=True)
+        lines.append("- Ranking by mean pLDDT: " + " > ".join(f"{r.model_name} ({r.mean_plddt:.1f})" for r in ranked))
+    return "\n".join(lines)
+
+
+def _confidence_lines(result):
+    lines = []
+    if result.mean_plddt is not None:
+        chains = f", per chain: {result.chain_plddt}" if result.chain_plddt and " " in result.chain_plddt else ""
+        confident = f", {100 * result.confident_fraction:.0f}% of residues >= 70" if result.confident_fraction is not None else ""
+        lines.append(f"    - Mean pLDDT: {result.mean_plddt:.1f}{confident}{chains}")
+    if result.ptm is not None:
+        lines.append(f"    - pTM: {result.ptm:.2f}" + (f", ipTM: {result.iptm:.2f}" if result.iptm is not None else ""))
+    return lines
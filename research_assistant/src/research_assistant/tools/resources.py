@@ -0,0 +1,246 @@
+"""
+Resources of the fold jobs, estimated before they run, and a scheduler that uses the estimates:
+- ResourceEstimator predicts the peak GPU memory and the wall time of a prediction from its number of residues and
+  chains. Boltz memory and time grow with the square of the residues (pair representation, triangle updates).
+  The priors are refined from the runs: each observed run gives the ratio of its measurement to the prior, and
+  estimates are scaled by the median ratio of the recent runs of the model.
+- FoldScheduler rejects (or reroutes to another model) the jobs that would not fit in GPU memory before they are
+  launched, holds the concurrent runs of a GPU under its memory budget, and orders batches of jobs longest first.
+"""
+import os, threading
+from collections import deque, namedtuple
+from contextlib import contextmanager
+import numpy as np
+from loguru import logger
+
+from research_assistant.tools.cache import normalize_sequence
+
+
+# coefficients of 1, L and L^2, with L the number of residues in thousands, and the seconds of each unique chain (MSA)
+# Boltz: calibrated on the examples of the notebooks: complexes of 228 residues (adalimumab) to 353 residues (1JHL)
+# need more than a 24 GB GPU and fit in 48 GB, and 1JHL takes ~2 minutes on an L40S.
+PRIORS = {
+    'Boltz': {'memory_gb': (10.0, 40.0, 100.0), 'seconds': (20.0, 0.0, 800.0), 'seconds_per_chain': 0.0},
+    # remote NIM: the memory is the one of the endpoint's GPU, and only the latency matters to the client
+    'ESMFold': {'memory_gb': (2.0, 4.0, 16.0), 'seconds': (1.0, 2.0, 10.0), 'seconds_per_chain': 0.0},
+}
+
+Estimate = namedtuple("Estimate", ["model", "residues", "chains", "memory_gb", "seconds"])
+
+
+class ResourceError(Exception):
+    """
+    A job needs more resources than available
+    """
+
+
+def _size(sequences):
+    sequences = [sequences] if isinstance(sequences, str) else sequences
+    return sum(len(normalize_sequence(seq)) for seq in sequences), len(sequences)
+
+
+class ResourceEstimator:
+    """
+    Peak memory and wall time of the predictions of each model, from priors refined with the observed runs
+    """
+    def __init__(self, priors=None, window=200, min_samples=3):
+        """
+        priors: dict, model -> coefficients, see PRIORS
+        window: int, number of recent runs of each model used to refine its estimates
+        min_samples: int, number of runs needed before the priors are refined
+        """
+        self.priors = priors or PRIORS
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._ratios = {(model, quantity): deque(maxlen=window) for model in self.priors for quantity in ("memory_gb", "seconds")}
+
+    def prior(self, model, residues, chains):
+        """
+        return: tuple, (memory in GB, seconds) of the prior of the model
+        """
+        prior = self.priors[model]
+        size = residues / 1000
+        memory = float(np.polyval(prior['memory_gb'][::-1], size))
+        seconds = float(np.polyval(prior['seconds'][::-1], size)) + prior['seconds_per_chain'] * chains
+        return memory, seconds
+
+    def _factor(self, model, quantity):
+        with self._lock:
+            ratios = list(self._ratios[(model, quantity)])
+        return float(np.median(ratios)) if len(ratios) >= self.min_samples else 1.0
+
+    def estimate(self, model, sequences):
+        """
+        sequences: list[str], chain sequences of the structure, or a single sequence
+        return: Estimate
+        """
+        residues, chains = _size(sequences)
+        memory, seconds = self.prior(model, residues, chains)
+        return Estimate(model, residues, chains, memory * self._factor(model, "memory_gb"), seconds * self._factor(model, "seconds"))
+
+    def observe(self, model, sequences=None, seconds=None, memory_gb=None, residues=None, chains=None):
+        """
+        Refine the estimates of a model with a finished run
+        sequences: list[str], chain sequences of the structure. Or give residues and chains.
+        seconds: float, wall time of the run
+        memory_gb: float, peak GPU memory of the run
+        """
+        if sequences is not None:
+            residues, chains = _size(sequences)
+        if model not in self.priors or not residues:
+            return
+        prior_memory, prior_seconds = self.prior(model, residues, chains or 1)
+        with self._lock:
+            if seconds is not None and seconds > 0:
+                self._ratios[(model, "seconds")].append(seconds / prior_seconds)
+            if memory_gb is not None and memory_gb > 0:
+                self._ratios[(model, "memory_gb")].append(memory_gb / prior_memory)
+
+    def load_history(self, store, models=("Boltz",), limit=1000):
+        """
+        Refine the estimates with the recent successful runs of a results store
+        store: ResultsStore
+        models: list[str], the models whose runs are read. ESMFold runs include cache hits, whose time is not the model's.
+        return: int, number of runs read
+        """
+        n = 0
+        for model in models:
+            for row in store.history(model, limit=min(limit, self._ratios[(model, "seconds")].maxlen)):
+                self.observe(model, seconds=row['runtime_seconds'], memory_gb=row['peak_memory_gb'], residues=row['residues'], chains=row['chains'])
+                n += 1
+        return n
+
+    def calibration(self):
+        """
+        return: dict, model -> factors applied to the priors and number of observed runs
+        """
+        with self._lock:
+            samples = {model: len(self._ratios[(model, "seconds")]) for model in self.priors}
+        return {model: {'memory_gb': self._factor(model, "memory_gb"), 'seconds': self._factor(model, "seconds"), 'samples': samples[model]}
+                for model in self.priors}
+
+
+class MemoryBudget:
+    """
+    GPU memory shared by the concurrent runs: a run waits until its estimated peak fits next to the running ones
+    """
+    def __init__(self, total_gb):
+        self.total_gb = total_gb
+        self.in_use_gb = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, gb):
+        """
+        Hold gb of memory for the duration of the block
+        """
+        if gb > self.total_gb:
+            raise ResourceError(f"{gb:.1f} GB is more than the {self.total_gb:.1f} GB of the GPU")
+        with self._cond:
+            while self.in_use_gb + gb > self.total_gb:
+                self._cond.wait()
+            self.in_use_gb += gb
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use_gb -= gb
+                self._cond.notify_all()
+
+
+class FoldScheduler:
+    """
+    Admission and ordering of the fold jobs, from the estimates of a ResourceEstimator
+    """
+    def __init__(self, estimator=None, memory_gb=None):
+        """
+        estimator: ResourceEstimator. Defaults to a new estimator with the PRIORS.
+        memory_gb: float, memory of the GPU that runs Boltz. Defaults to None: unknown, jobs are not checked against it.
+        """
+        self.estimator = estimator or ResourceEstimator()
+        self.budget = MemoryBudget(memory_gb) if memory_gb else None
+        self._lock = threading.Lock()
+        self.stats = {'admitted': 0, 'rerouted': 0, 'rejected': 0}
+
+    def admit(self, model, sequences, alternatives=()):
+        """
+        Check that a job fits in GPU memory before it is launched
+        model: str, the model of the job
+        sequences: list[str], chain sequences of the structure
+        alternatives: list[str], models the job can be rerouted to, e.g. ["ESMFold"] for a single chain
+        return: tuple, (decision, Estimate, reason): decision is "run", "reroute" (the model of the Estimate) or "reject"
+        """
+        estimate = self.estimator.estimate(model, sequences)
+        if model != "Boltz" or self.budget is None or estimate.memory_gb <= self.budget.total_gb:
+            decision, reason = "run", None
+        else:
+            reason = (f"{model} needs an estimated {estimate.memory_gb:.1f} GB of GPU memory for {estimate.residues} residues, "
+                      f"more than the {self.budget.total_gb:.1f} GB of the GPU")
+            rerouted = [alternative for alternative in alternatives if alternative != model and not (alternative == "ESMFold" and estimate.chains > 1)]
+            if rerouted:
+                decision, estimate = "reroute", self.estimator.estimate(rerouted[0], sequences)
+                reason += f", rerouted to {rerouted[0]}"
+            else:
+                decision = "reject"
+            logger.warning(reason)
+        with self._lock:
+            self.stats[{'run': 'admitted', 'reroute': 'rerouted', 'reject': 'rejected'}[decision]] += 1
+        return decision, estimate, reason
+
+    @contextmanager
+    def reserve(self, memory_gb):
+        """
+        Hold GPU memory for a run, waiting for the running jobs if needed. Does nothing when the GPU memory is unknown.
+        """
+        if self.budget is None:
+            yield
+            return
+        with self.budget.reserve(min(memory_gb, self.budget.total_gb)):
+            yield
+
+    def plan(self, jobs, batch_size, model="Boltz"):
+        """
+        Order jobs longest first and group jobs of similar sizes in batches. Longest first keeps the concurrent runs
+        busy until the end (the short jobs fill the gaps), and the peak memory of a batch, its largest job,
+        is not paid by many small jobs.
+        jobs: dict, name -> chain sequences
+        batch_size: int, maximum number of jobs per batch
+        return: list of tuple, (dict name -> chain sequences, Estimate of the batch: peak memory and total seconds), longest first
+        """
+        estimates = {name: self.estimator.estimate(model, sequences) for name, sequences in jobs.items()}
+        order = sorted(jobs, key=lambda name: estimates[name].seconds, reverse=True)
+        batches = []
+        for start in range(0, len(order), batch_size):
+            names = order[start:start + batch_size]
+            batches.append(({name: jobs[name] for name in names}, Estimate(
+                model,
+                sum(estimates[name].residues for name in names),
+                sum(estimates[name].chains for name in names),
+                max(estimates[name].memory_gb for name in names),
+                sum(estimates[name].seconds for name in names),
+            )))
+        return batches
+
+
+def get_fold_scheduler():
+    """
+    Get the process-wide fold scheduler. Its estimator is refined with the Boltz runs of the results store.
+    Configured with the environment variable:
+    BOLTZ_GPU_MEMORY_GB: memory of the GPU that runs Boltz. Defaults to unset: jobs are not checked against the memory.
+    return: FoldScheduler
+    """
+    global _fold_scheduler
+    memory_gb = float(os.getenv("BOLTZ_GPU_MEMORY_GB") or 0) or None
+    with _fold_scheduler_lock:
+        if _fold_scheduler is None or (_fold_scheduler.budget.total_gb if _fold_scheduler.budget else None) != memory_gb:
+            estimator = _fold_scheduler.estimator if _fold_scheduler is not None else ResourceEstimator()
+            if _fold_scheduler is None:
+                from research_assistant.tools.results_store import get_results_store
+                store = get_results_store()
+                if store is not None:
+                    estimator.load_history(store)
+            _fold_scheduler = FoldScheduler(estimator, memory_gb=memory_gb)
+        return _fold_scheduler
+
+_fold_scheduler = None
+_fold_scheduler_lock = threading.Lock()
@@ -0,0 +1,269 @@
+"""
+Index of all the predictions, in an embedded SQLite database: one row per prediction with the hash of its
+sequences, the number of chains, the model and its parameters, the path of the output, the runtime and the
+confidence summary (see confidence.py). Written by the fold tools and run_batch, queried with:
+- lookup / is_folded: whether a structure was already folded by a model
+- top: the most confident predictions
+- export: all rows, or the rows of a model, to a JSON lines or CSV file
+- history: the sizes, runtimes and peak memory of the recent runs of a model, to refine the resource estimates (see resources.py)
+
+Rows are looked up by an index on (sequence_hash, model), ranked by indexes on (model, mean_plddt) and
+(mean_plddt), and the history of a model is read from an index on (model), so queries don't scan the table,
+even at millions of rows.
+"""
+import os, csv, json, time, sqlite3, threading
+from loguru import logger
+
+from research_assistant.tools.cache import make_cache_key, normalize_sequence
+
+
+COLUMNS = [
+    "sequence_hash", "chains", "residues", "model", "parameters", "structure_name", "job_id", "path", "success",
+    "runtime_seconds", "mean_plddt", "confident_fraction", "chain_plddt", "ptm", "iptm", "created_at", "peak_memory_gb",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    sequence_hash TEXT NOT NULL,
+    chains INTEGER NOT NULL,
+    residues INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    structure_name TEXT,
+    job_id TEXT,
+    path TEXT,
+    success INTEGER NOT NULL,
+    runtime_seconds REAL,
+    mean_plddt REAL,
+    confident_fraction REAL,
+    chain_plddt TEXT,
+    ptm REAL,
+    iptm REAL,
+    created_at REAL NOT NULL,
+    peak_memory_gb REAL
+);
+CREATE INDEX IF NOT EXISTS predictions_by_sequence ON predictions (sequence_hash, model);
+CREATE INDEX IF NOT EXISTS predictions_by_plddt ON predictions (model, mean_plddt) WHERE success = 1;
+CREATE INDEX IF NOT EXISTS predictions_by_plddt_all ON predictions (mean_plddt) WHERE success = 1;
+CREATE INDEX IF NOT EXISTS predictions_by_model ON predictions (model) WHERE success = 1;
+"""
+
+
+def sequence_hash(sequences):
+    """
+    Hash of the normalized chain sequences of a structure. Chains are hashed in order.
+    sequences: list[str], or a single sequence
+    return: str, 32 hex characters
+    """
+    sequences = [sequences] if isinstance(sequences, str) else sequences
+    return make_cache_key(*[normalize_sequence(seq) for seq in sequences])[:32]
+
+
+def _parameters(parameters):
+    # canonical JSON, so that equal parameters are equal strings
+    return json.dumps(parameters or {}, sort_keys=True, default=str)
+
+
+class ResultsStore:
+    """
+    SQLite index of the predictions. Thread-safe, and several processes can share the database:
+    it is opened in WAL mode, so readers don't block the writer.
+    """
+    def __init__(self, path):
+        """
+        path: str, path of the database file, created if needed
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            # databases created before the column was added
+            if "peak_memory_gb" not in [row['name'] for row in self._db.execute("PRAGMA table_info(predictions)")]:
+                self._db.execute("ALTER TABLE predictions ADD COLUMN peak_memory_gb REAL")
+
+    def _row(self, sequences, model, path=None, success=True, runtime=None, parameters=None, confidence=None, structure_name=None, job_id=None, peak_memory_gb=None):
+        sequences = [sequences] if isinstance(sequences, str) else sequences
+        confidence = confidence or {}
+        return (
+            sequence_hash(sequences), len(sequences), sum(len(normalize_sequence(seq)) for seq in sequences), model,
+            _parameters(parameters), structure_name, job_id, path, int(bool(success)), runtime,
+            confidence.get('mean_plddt'), confidence.get('confident_fraction'), confidence.get('chain_plddt'),
+            confidence.get('ptm'), confidence.get('iptm'), time.time(), peak_memory_gb,
+        )
+
+    def record(self, sequences, model, path=None, success=True, runtime=None, parameters=None, confidence=None, structure_name=None, job_id=None, peak_memory_gb=None):
+        """
+        Add a prediction
+        sequences: list[str], chain sequences of the structure, or a single sequence
+        model: str, e.g. "ESMFold" or "Boltz"
+        path: str, output of the prediction
+        success: bool, whether the prediction succeeded
+        runtime: float, seconds of the prediction
+        parameters: dict, parameters of the model that change the prediction, e.g. {"use_msa_server": True}
+        confidence: dict, with keys mean_plddt, confident_fraction, chain_plddt, ptm and iptm, e.g. from confidence.confidence_fields
+        structure_name: str, name of the structure
+        job_id: str, job of the prediction
+        peak_memory_gb: float, peak GPU memory of the prediction, when measured
+        return: int, ID of the row
+        """
+        row = self._row(sequences, model, path, success, runtime, parameters, confidence, structure_name, job_id, peak_memory_gb)
+        with self._lock, self._db:
+            cursor = self._db.execute(f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", row)
+        return cursor.lastrowid
+
+    def record_many(self, predictions):
+        """
+        Add many predictions in one transaction
+        predictions: iterable of dicts with the arguments of record
+        return: int, number of rows added
+        """
+        rows = [self._row(**prediction) for prediction in predictions]
+        with self._lock, self._db:
+            self._db.executemany(f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        return len(rows)
+
+    def lookup(self, sequences, model=None, parameters=None):
+        """
+        Latest successful prediction of a structure
+        sequences: list[str], chain sequences of the structure, or a single sequence
+        model: str, only the predictions of this model. Defaults to any model.
+        parameters: dict, only the predictions with these parameters. Defaults to any parameters.
+        return: dict, the row, or None if the structure was never folded
+        """
+        query, args = "SELECT * FROM predictions WHERE sequence_hash = ? AND success = 1", [sequence_hash(sequences)]
+        if model is not None:
+            query += " AND model = ?"
+            args.append(model)
+        if parameters is not None:
+            query += " AND parameters = ?"
+            args.append(_parameters(parameters))
+        with self._lock:
+            row = self._db.execute(query + " ORDER BY id DESC LIMIT 1", args).fetchone()
+        return dict(row) if row is not None else None
+
+    def is_folded(self, sequences, model=None, parameters=None):
+        """
+        Whether a structure was already folded, see lookup
+        """
+        return self.lookup(sequences, model=model, parameters=parameters) is not None
+
+    def top(self, n=10, model=None):
+        """
+        Most confident successful predictions
+        n: int, number of rows
+        model: str, only the predictions of this model. Defaults to any model.
+        return: list[dict], rows by decreasing mean pLDDT
+        """
+        query, args = "SELECT * FROM predictions WHERE success = 1 AND mean_plddt IS NOT NULL", []
+        if model is not None:
+            query += " AND model = ?"
+            args.append(model)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY mean_plddt DESC LIMIT ?", args + [n]).fetchall()
+        return [dict(row) for row in rows]
+
+    def history(self, model, limit=200):
+        """
+        Sizes and resources of the recent successful predictions of a model
+        model: str, e.g. "Boltz"
+        limit: int, number of rows
+        return: list[dict], with keys residues, chains, runtime_seconds and peak_memory_gb, latest first
+        """
+        query = ("SELECT residues, chains, runtime_seconds, peak_memory_gb FROM predictions "
+                 "WHERE model = ? AND success = 1 AND runtime_seconds IS NOT NULL ORDER BY id DESC LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(query, (model, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, model=None):
+        """
+        return: int, number of predictions, of a model or of all models
+        """
+        with self._lock:
+            if model is None:
+                return self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM predictions WHERE model = ?", (model,)).fetchone()[0]
+
+    def export(self, path, model=None, batch_size=10000):
+        """
+        Export predictions to a file, streamed in batches of rows
+        path: str, a .jsonl or .csv file
+        model: str, only the predictions of this model. Defaults to all.
+        return: int, number of rows exported
+        """
+        query, args = "SELECT * FROM predictions", []
+        if model is not None:
+            query += " WHERE model = ?"
+            args.append(model)
+        # a connection of its own, so that a long export doesn't block the writers of this store
+        db = sqlite3.connect(self.path, timeout=30)
+        n = 0
+        try:
+            cursor = db.execute(query + " ORDER BY id", args)
+            fields = [d[0] for d in cursor.description]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f) if path.endswith(".csv") else None
+                if writer is not None:
+                    writer.writerow(fields)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        if writer is not None:
+                            writer.writerow(row)
+                        else:
+                            f.write(json.dumps(dict(zip(fields, row))) + "\n")
+                    n += len(rows)
+        finally:
+            db.close()
+        logger.info(f"Exported {n} predictions to {path}")
+        return n
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def get_results_store():
+    """
+    Get the process-wide results store. Configured with the environment variable:
+    RESULTS_DB: path of the database, defaults to "output/results.db". Set to an empty string to disable the store.
+    return: ResultsStore or None if the store is disabled
+    """
+    global _results_store
+    path = os.getenv("RESULTS_DB", os.path.join("output", "results.db"))
+    if not path:
+        return None
+    with _results_store_lock:
+        if _results_store is None or _results_store.path != path:
+            _results_store = ResultsStore(path)
+        return _results_store
+
+_results_store = None
+_results_store_lock = threading.Lock()
+
+
+def record_prediction(sequences, model, result, runtime=None, parameters=None, structure_name=None, job_id=None, peak_memory_gb=None):
+    """
+    Add the prediction of a fold tool to the process-wide store, if enabled. Errors are logged, not raised:
+    the index must not fail a prediction.
+    result: FoldToolOutput, or a dict with success, output_file_path and the confidence fields
+    """
+    fields = result if isinstance(result, dict) else result.model_dump()
+    try:
+        # opening the store can fail too, e.g. on a read-only or corrupt database
+        store = get_results_store()
+        if store is None:
+            return None
+        return store.record(sequences, model, path=fields.get('output_file_path'), success=fields.get('success', False), runtime=runtime,
+                            parameters=parameters, confidence=fields, structure_name=structure_name, job_id=job_id, peak_memory_gb=peak_memory_gb)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Could not record the {model} prediction of {structure_name} in the results store: {e}")
+        return None
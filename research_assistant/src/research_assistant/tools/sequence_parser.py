@@ -0,0 +1,207 @@
+import re, threading
+from loguru import logger
+
+
+# residues accepted by is_amino_acid_sequence, without the stop codon
+AMINO_ACIDS = "ARNDCEQGHILKMFPSTWYVBZX"
+
+# tokens at least this long made only of amino acid letters are taken as sequences. Shorter ones are
+# ambiguous (e.g. "DEAD", "CHAIN"), and no English word this long is made only of these letters.
+MIN_SEQUENCE_LENGTH = 20
+
+_SEQUENCE_TOKEN = re.compile(rf"\b[{AMINO_ACIDS}{AMINO_ACIDS.lower()}]{{{MIN_SEQUENCE_LENGTH},}}\b")
+# short all-uppercase runs of residue letters in the prose, e.g. a truncated or split sequence
+_PARTIAL_SEQUENCE_TOKEN = re.compile(rf"\b[{AMINO_ACIDS}]{{8,}}\b")
+_SEQUENCE_LINE = re.compile(rf"^[{AMINO_ACIDS}{AMINO_ACIDS.lower()}*\s]+$")
+
+_NUMBER_WORDS = {"one": 1, "single": 1, "a": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+_OLIGOMER_WORDS = {"monomer": 1, "homodimer": 2, "dimer": 2, "homotrimer": 3, "trimer": 3, "homotetramer": 4, "tetramer": 4}
+# "2 copies of X", "two copies of X", "2x X", "3 x X", "a homodimer of X", "a single sequence of X"
+_COUNT_BEFORE = re.compile(
+    r"(?:(?P<n>\d+|one|two|three|four|five|six|single|a)\s*(?:x|×|copies\s+of|copy\s+of|sequences?\s+of|chains?\s+of)"
+    r"|\b(?P<oligomer>monomer|homodimer|dimer|homotrimer|trimer|homotetramer|tetramer)\s+of)\s*:?\s*$",
+    re.IGNORECASE,
+)
+# counts of chains that were not attached to a sequence, e.g. "a heterodimer of X and Y"
+_UNATTACHED_COUNT = re.compile(r"\d|\b(?:copies|times|\w*(?:monomer|dimer|trimer|tetramer|oligomer|multimer))\b", re.IGNORECASE)
+# words that change the meaning of the request in ways the parser does not handle, e.g. a negation in "X and not Y"
+_AMBIGUOUS_WORDS = re.compile(
+    r"\b(?:mutat\w*|mutant|substitut\w*|delet\w*|insert\w*|truncat\w*|residues?\s+\d+|except|without|instead|not|\w+n't|exclud\w*|omit\w*|ignor\w*"
+    r"|ligand|dna|rna|smiles|ccd)\b",
+    re.IGNORECASE,
+)
+
+_stats_lock = threading.Lock()
+_stats = {"fast_path": 0, "agent": 0}
+
+
+def fast_path_stats():
+    """
+    Share of the inputs that were parsed locally instead of by the preprocess agent
+    return: dict, with keys fast_path, agent and fast_path_share
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["fast_path"] + stats["agent"]
+    stats["fast_path_share"] = stats["fast_path"] / total if total else 0.0
+    return stats
+
+
+def _count(fast_path):
+    with _stats_lock:
+        _stats["fast_path" if fast_path else "agent"] += 1
+
+
+def _clean(seq):
+    return "".join(seq.split()).upper().rstrip("*")
+
+
+def _fasta_name(headers):
+    """
+    Name of the structure from the FASTA headers: the first word of the headers, if they all share it.
+    e.g. ">mAB1001 heavy chain" and ">mAB1001 light chain" give "mAB1001"
+    """
+    first_words = [re.sub(r"[^A-Za-z0-9_\-.]", "", h.split()[0]) if h.split() else "" for h in headers]
+    if first_words and first_words[0] and all(w == first_words[0] for w in first_words):
+        return first_words[0]
+    return "structure1"
+
+
+def _parse_fasta(lines):
+    """
+    Parse FASTA records. Lines of prose (instructions) are allowed before the first record and after the last one.
+    return: tuple, (list of headers, list of sequences), or None if the text is not well-formed FASTA
+    """
+    headers, sequences = [], []
+    current = None
+    for line in lines:
+        if line.startswith(">"):
+            headers.append(line[1:].strip())
+            current = []
+            sequences.append(current)
+        elif current is not None and _SEQUENCE_LINE.match(line):
+            current.append(line)
+        elif _SEQUENCE_TOKEN.search(line):
+            # a sequence outside of a record, or mixed with prose
+            return None
+        elif current is not None:
+            # prose after a record closes it
+            current = None
+    sequences = [_clean("".join(s)) for s in sequences]
+    if not sequences or any(not s for s in sequences):
+        return None
+    return headers, sequences
+
+
+def _join_wrapped_lines(message):
+    """
+    Join sequences wrapped over several lines. Consecutive sequence-only lines are one wrapped sequence only if there
+    are at least 3 lines, all lines but the last have the same width and the last one is shorter, as written by sequence
+    tools. Two lines, e.g. the heavy and light chains of an antibody, or two copies of a chain, may be separate chains.
+    return: str, the message with wrapped sequences on a single line, or None if the lines are ambiguous
+    """
+    lines, block = [], []
+
+    def _flush():
+        if len(block) > 1:
+            widths = {len(line) for line in block[:-1]}
+            if len(block) < 3 or len(widths) > 1 or len(block[-1]) >= widths.pop():
+                return False
+        if block:
+            lines.append("".join(block))
+            block.clear()
+        return True
+
+    for line in message.splitlines():
+        line = line.strip()
+        if _SEQUENCE_LINE.match(line) and " " not in line and (line.isupper() or len(line) >= MIN_SEQUENCE_LENGTH):
+            block.append(line)
+            continue
+        if not _flush():
+            return None
+        lines.append(line)
+    if not _flush():
+        return None
+    return "\n".join(lines)
+
+
+def _parse_free_text(message):
+    """
+    Parse a message with bare sequences, optionally with copy numbers ("2 copies of X", "a homodimer of X").
+    return: list of sequences, or None if the message is ambiguous
+    """
+    text = _join_wrapped_lines(message)
+    if text is None:
+        return None
+    sequences = []
+    last_end = 0
+    oligomer = False
+    for match in _SEQUENCE_TOKEN.finditer(text):
+        before = text[last_end:match.start()]
+        count = 1
+        quantifier = _COUNT_BEFORE.search(before)
+        if quantifier is not None:
+            if quantifier.group("oligomer"):
+                oligomer = True
+                count = _OLIGOMER_WORDS[quantifier.group("oligomer").lower()]
+            else:
+                n = quantifier.group("n").lower()
+                count = int(n) if n.isdigit() else _NUMBER_WORDS[n]
+            before = before[:quantifier.start()]
+        if _UNATTACHED_COUNT.search(before):
+            # a count we did not attach to a sequence
+            return None
+        sequences.extend([_clean(match.group(0))] * count)
+        last_end = match.end()
+    rest = text[last_end:]
+    if not sequences or _UNATTACHED_COUNT.search(rest):
+        return None
+    if oligomer and len(_SEQUENCE_TOKEN.findall(text)) > 1:
+        # "a dimer of X and Y" is a heterodimer, not two copies of X and one of Y
+        return None
+    return sequences
+
+
+def parse_sequence_input(message):
+    """
+    Parse the user's message locally, without the LLM, when it is well-formed: FASTA or multi-FASTA,
+    bare sequences, or "N copies of X" style descriptions.
+    message: str, the user's message
+    return: dict with keys structure_name, num_chains and sequences (the arguments of the Preprocess tool),
+        or None if the message is ambiguous and should be handled by the preprocess agent
+    """
+    parsed = _parse(message)
+    _count(parsed is not None)
+    if parsed is None:
+        logger.info("Input is ambiguous, falling back to the preprocess agent")
+    else:
+        logger.info(f"Parsed input locally: {parsed['structure_name']} with {parsed['num_chains']} chains")
+    return parsed
+
+
+def _parse(message):
+    if not message or _AMBIGUOUS_WORDS.search(message):
+        return None
+    lines = [line.strip() for line in message.strip().splitlines() if line.strip()]
+
+    if any(line.startswith(">") for line in lines):
+        fasta = _parse_fasta(lines)
+        if fasta is None:
+            return None
+        headers, sequences = fasta
+        name = _fasta_name(headers)
+    else:
+        sequences = _parse_free_text(message)
+        if sequences is None:
+            return None
+        name = "structure1"
+
+    prose = _SEQUENCE_TOKEN.sub("", message)
+    if _PARTIAL_SEQUENCE_TOKEN.search(prose.replace(">", " ")) and not any(line.startswith(">") for line in lines):
+        return None
+
+    return {
+        'structure_name': name,
+        'num_chains': len(sequences),
+        'sequences': sequences,
+    }
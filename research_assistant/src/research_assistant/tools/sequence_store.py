@@ -0,0 +1,109 @@
+import os, re, threading
+
+from research_assistant.tools.cache import DiskCache, make_cache_key, normalize_sequence
+
+
+_HANDLE = re.compile(r"\bseq:[0-9a-f]{16}\b")
+
+
+def is_handle(value):
+    """
+    return: bool, whether value is a sequence handle, e.g. "seq:3f2a9c1b4d5e6f70"
+    """
+    return isinstance(value, str) and _HANDLE.fullmatch(value.strip()) is not None
+
+
+def find_handles(text):
+    """
+    return: list[str], the sequence handles in a text, e.g. the output of the Preprocess tool
+    """
+    return _HANDLE.findall(text or "")
+
+
+class SequenceStore:
+    """
+    Local content-addressed store of the chain sequences of the jobs. The Preprocess tool puts the clean sequences
+    and passes their handles to the next agents, and the fold tools resolve the handles: the agents copy a short
+    handle instead of the full sequence, which keeps the prompts small and the residues exactly as they were parsed.
+    A handle is the first 16 hex digits of the hash of the normalized sequence, so the same chain always has the same handle.
+    """
+    def __init__(self, root=os.path.join("cache", "sequences"), max_bytes=1024**3, max_age=None):
+        """
+        root: str, directory of the store
+        max_bytes: int, maximum size of the store in bytes, least recently used sequences are evicted first
+        max_age: float, maximum age of a sequence in seconds. Defaults to None: sequences never expire.
+        """
+        self.cache = DiskCache(root, max_bytes=max_bytes, max_age=max_age, suffix=".seq")
+
+    @staticmethod
+    def handle(sequence):
+        """
+        return: str, handle of a sequence, e.g. "seq:3f2a9c1b4d5e6f70"
+        """
+        return "seq:" + make_cache_key("sequence", normalize_sequence(sequence))[:16]
+
+    def put(self, sequence):
+        """
+        Add a sequence to the store
+        sequence: str, amino acid sequence
+        return: str, handle of the sequence
+        """
+        sequence = normalize_sequence(sequence)
+        handle = self.handle(sequence)
+        if not self.cache.contains(handle[4:]):
+            self.cache.put(handle[4:], sequence)
+        return handle
+
+    def get(self, handle):
+        """
+        handle: str, handle returned by put
+        return: str, the normalized sequence
+        """
+        sequence = self.cache.get(handle.strip()[4:])
+        if sequence is None:
+            raise ValueError(f"Unknown sequence handle {handle.strip()}: it was not created by the Preprocess tool of this store ({self.cache.root})")
+        return sequence
+
+    def resolve(self, values):
+        """
+        Sequences of a list of handles. Sequences passed in full are returned normalized, so the tools accept both.
+        values: list[str], handles or sequences
+        return: list[str], the sequences
+        """
+        return [self.get(value) if is_handle(value) else normalize_sequence(value) for value in values]
+
+
+def get_sequence_store():
+    """
+    Get the process-wide sequence store. Configured with the environment variables:
+    SEQUENCE_STORE_DIR: directory of the store, defaults to "cache/sequences". Set to an empty string to disable
+        the store: the Preprocess tool then passes the sequences in full.
+    SEQUENCE_STORE_MAX_BYTES: maximum size of the store in bytes, defaults to 1 GB
+    return: SequenceStore or None if the store is disabled
+    """
+    global _sequence_store
+    root = os.getenv("SEQUENCE_STORE_DIR", os.path.join("cache", "sequences"))
+    if not root:
+        return None
+    with _sequence_store_lock:
+        if _sequence_store is None or _sequence_store.cache.root != root:
+            _sequence_store = SequenceStore(root, max_bytes=int(os.getenv("SEQUENCE_STORE_MAX_BYTES", 1024**3)))
+        return _sequence_store
+
+_sequence_store = None
+_sequence_store_lock = threading.Lock()
+
+
+def resolve_sequences(values, store=None):
+    """
+    Sequences of the handles passed to a fold tool
+    values: list[str], handles or sequences
+    store: SequenceStore. Defaults to get_sequence_store().
+    return: list[str], the normalized sequences
+    """
+    store = store if store is not None else get_sequence_store()
+    if store is None:
+        if any(is_handle(value) for value in values):
+            raise ValueError("Sequence handles were passed, but the sequence store is disabled (SEQUENCE_STORE_DIR is empty)")
+        return [normalize_sequence(value) for value in values]
+    return store.resolve(values)
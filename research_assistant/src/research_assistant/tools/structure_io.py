@@ -0,0 +1,342 @@
+"""
+Storage of predicted structures without holding them in memory:
+- PDBStreamDecoder extracts the PDB of an ESMFold response ({"pdbs": ["..."]}) from the body as it is downloaded
+- structure_writer writes a structure atomically, in the format given by the suffix of the path:
+  .pdb (plain text), .pdb.gz (gzip), .pdb.zst (zstd, needs the zstandard package)
+  or .coords.npy (compact binary table of the atoms, see CoordinateFile)
+- open_structure and CoordinateFile read them back. CoordinateFile memory-maps the atom table.
+"""
+import os, re, io, gzip, json, codecs, tempfile
+from contextlib import contextmanager
+import numpy as np
+
+
+COORDS_SUFFIX = ".coords.npy"
+
+# one row per atom, 32 bytes instead of the 81 of a PDB line
+ATOM_DTYPE = np.dtype([
+    ('hetero', "?"),
+    ('name', "S4"),
+    ('resname', "S3"),
+    ('chain', "S1"),
+    ('resseq', "<i4"),
+    ('icode', "S1"),
+    ('xyz', "<f4", (3,)),
+    ('b_factor', "<f4"),
+    ('element', "S2"),
+])
+
+_ATOM = np.frombuffer(b"ATOM  ", dtype=np.uint8)
+_HETATM = np.frombuffer(b"HETATM", dtype=np.uint8)
+
+
+def fixed_width_records(lines, hetatm=True):
+    """
+    ATOM and HETATM records of PDB lines, as a matrix of 80 columns, shorter lines padded with null bytes
+    lines: list[bytes], lines of a PDB file
+    hetatm: bool, whether to keep the HETATM records
+    return: numpy array of uint8, one row per record
+    """
+    records = np.array(lines, dtype="S80")
+    records = records.view(np.uint8).reshape(len(records), 80)
+    keep = (records[:, :6] == _ATOM).all(axis=1)
+    if hetatm:
+        keep |= (records[:, :6] == _HETATM).all(axis=1)
+    return records[keep]
+
+
+def column(records, start, end):
+    """
+    Fixed-width column of records, as an array of bytes strings without the padding
+    """
+    return np.ascontiguousarray(records[:, start:end]).view(f"S{end - start}").ravel()
+
+
+def parse_atoms(lines):
+    """
+    Parse the ATOM and HETATM records of PDB lines
+    lines: list[bytes], lines of a PDB file
+    return: numpy structured array of ATOM_DTYPE
+    """
+    records = fixed_width_records(lines)
+    atoms = np.zeros(len(records), dtype=ATOM_DTYPE)
+    atoms['hetero'] = records[:, 0] == ord("H")
+    atoms['name'] = column(records, 12, 16)
+    atoms['resname'] = column(records, 17, 20)
+    atoms['chain'] = column(records, 21, 22)
+    atoms['resseq'] = column(records, 22, 26).astype(np.int32)
+    atoms['icode'] = column(records, 26, 27)
+    for axis, start in enumerate((30, 38, 46)):
+        atoms['xyz'][:, axis] = column(records, start, start + 8).astype(np.float32)
+    b_factors = column(records, 60, 66)
+    atoms['b_factor'] = np.where(b_factors == b"", b"0", b_factors).astype(np.float32)
+    atoms['element'] = np.char.strip(column(records, 76, 78))
+    return atoms
+
+
+class PDBStreamDecoder:
+    """
+    Incremental decoder of the first PDB string of an ESMFold response body, {"pdbs": ["..."]}.
+    Feed the bytes of the body as they arrive, get the decoded PDB text in pieces:
+    ```python
+    decoder = PDBStreamDecoder()
+    for chunk in response.iter_content(65536):
+        for text in decoder.feed(chunk):
+            f.write(text)
+    decoder.close()
+    ```
+    """
+    _START = re.compile(r'"pdbs"\s*:\s*\[\s*"')
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._state = "seek" # seek the start of the string, then decode it until its closing quote
+
+    @staticmethod
+    def _closing_quote(buffer):
+        # first quote not escaped by an odd number of backslashes
+        quote = buffer.find('"')
+        while quote >= 0:
+            backslashes = len(buffer[:quote]) - len(buffer[:quote].rstrip("\\"))
+            if backslashes % 2 == 0:
+                return quote
+            quote = buffer.find('"', quote + 1)
+        return None
+
+    @staticmethod
+    def _complete_prefix(buffer):
+        # length of the longest prefix without a truncated escape sequence (\ or \uXXXX split between two chunks)
+        last = buffer.rfind("\\", max(0, len(buffer) - 6))
+        if last < 0:
+            return len(buffer)
+        run_start = len(buffer[:last + 1].rstrip("\\"))
+        if (last - run_start) % 2 == 1:
+            # the last backslash is escaped
+            return len(buffer)
+        if last + 1 == len(buffer) or (buffer[last + 1] == "u" and last + 6 > len(buffer)):
+            return last
+        return len(buffer)
+
+    def feed(self, chunk):
+        """
+        chunk: bytes, the next bytes of the body
+        return: list[str], the next pieces of the PDB text
+        """
+        if self._state == "done":
+            return []
+        self._buffer += self._utf8.decode(chunk)
+        if self._state == "seek":
+            match = self._START.search(self._buffer)
+            if match is None:
+                self._buffer = self._buffer[-64:]
+                return []
+            self._buffer = self._buffer[match.end():]
+            self._state = "string"
+
+        end = self._closing_quote(self._buffer)
+        if end is not None:
+            self._state = "done"
+        else:
+            end = self._complete_prefix(self._buffer)
+        segment, self._buffer = self._buffer[:end], self._buffer[end:]
+        return [json.loads(f'"{segment}"', strict=False)] if segment else []
+
+    def close(self):
+        """
+        Check that the body contained a complete PDB string
+        """
+        if self._state != "done":
+            raise ValueError("The response does not contain a complete PDB" if self._state == "string" else "The response does not contain a PDB")
+
+
+def _compression(path):
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def _open(path, mode, compression):
+    if compression == "gzip":
+        return gzip.open(path, mode if "b" in mode else mode + "t", compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Writing or reading .zst structures needs the zstandard package: pip install zstandard")
+        return zstandard.open(path, mode if "b" in mode else mode + "t")
+    return open(path, mode)
+
+
+def open_structure(path, mode="r"):
+    """
+    Open a PDB file for reading, decompressing .pdb.gz and .pdb.zst files
+    mode: str, "r" to read text, "rb" to read bytes
+    """
+    return _open(path, mode, _compression(path))
+
+
+def iter_structure_text(path, chunk_size=1 << 16):
+    """
+    Read a PDB file, decompressed, in pieces of text
+    """
+    with open_structure(path) as f:
+        while True:
+            text = f.read(chunk_size)
+            if not text:
+                return
+            yield text
+
+
+class CoordinateWriter:
+    """
+    Writes the atoms of PDB text to a .coords.npy file. The PDB is parsed in blocks of lines as it is written,
+    the atoms are appended to a raw file next to the output, which becomes the .npy file on close.
+    Only the ATOM and HETATM records are kept.
+    """
+    def __init__(self, path, block_lines=1024):
+        self.path = path
+        self.block_lines = block_lines
+        self._raw_path = path + ".raw"
+        self._raw = open(self._raw_path, "wb")
+        self._partial = ""
+        self._lines = []
+        self.n_atoms = 0
+
+    def _flush(self):
+        if self._lines:
+            atoms = parse_atoms(self._lines)
+            self._raw.write(atoms.tobytes())
+            self.n_atoms += len(atoms)
+            self._lines = []
+
+    def write(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        self._lines += [line.encode() for line in lines]
+        if len(self._lines) >= self.block_lines:
+            self._flush()
+
+    def close(self):
+        if self._partial:
+            self._lines.append(self._partial.encode())
+            self._partial = ""
+        self._flush()
+        self._raw.close()
+        try:
+            out = np.lib.format.open_memmap(self.path, mode="w+", dtype=ATOM_DTYPE, shape=(self.n_atoms,))
+            if self.n_atoms:
+                raw = np.memmap(self._raw_path, dtype=ATOM_DTYPE, mode="r")
+                for start in range(0, self.n_atoms, 1 << 16):
+                    out[start:start + (1 << 16)] = raw[start:start + (1 << 16)]
+                del raw
+            out.flush()
+            del out
+        finally:
+            os.remove(self._raw_path)
+
+    def abort(self):
+        self._raw.close()
+        if os.path.exists(self._raw_path):
+            os.remove(self._raw_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+@contextmanager
+def structure_writer(path):
+    """
+    Write a structure atomically, in pieces of PDB text: readers never see a partially written file.
+    ```python
+    with structure_writer("output/protein1.pdb.gz") as f:
+        for text in pieces:
+            f.write(text)
+    ```
+    path: str, path of the file. Its suffix sets the format: .pdb, .pdb.gz, .pdb.zst or .coords.npy
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    try:
+        writer = CoordinateWriter(tmp) if path.endswith(COORDS_SUFFIX) else _open(tmp, "w", _compression(path))
+        with writer:
+            yield writer
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class CoordinateFile:
+    """
+    Lazy reader of a .coords.npy file: the atom table is memory-mapped, and only the pages of the
+    fields and atoms that are used are read from disk.
+    ```python
+    structure = CoordinateFile("output/esmfold_result/protein1.coords.npy")
+    ca = structure.atoms[structure.atoms['name'] == b" CA "]
+    chains, plddt = structure.residue_plddt()
+    ```
+    """
+    def __init__(self, path):
+        self.path = path
+        self.atoms = np.load(path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.atoms)
+
+    @property
+    def coords(self):
+        """
+        return: numpy array of float32, (n_atoms, 3) coordinates in Å
+        """
+        return self.atoms['xyz']
+
+    def residue_plddt(self):
+        """
+        Per-residue mean B-factor (the pLDDT of predicted structures)
+        return: tuple, (chain ID of each residue, mean B-factor of each residue), numpy arrays
+        """
+        atoms = self.atoms[~self.atoms['hetero']]
+        if len(atoms) == 0:
+            return np.zeros(0, dtype=str), np.zeros(0)
+        keys = atoms[['chain', 'resseq', 'icode']]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        b_factors = atoms['b_factor'].astype(np.float64)
+        return atoms['chain'][starts].astype(str), np.add.reduceat(b_factors, starts) / np.diff(np.r_[starts, len(atoms)])
+
+    def iter_pdb(self, block=1 << 14):
+        """
+        The structure as PDB text, generated in pieces of `block` atoms
+        """
+        serial = 1
+        for start in range(0, len(self.atoms), block):
+            lines = []
+            for atom in self.atoms[start:start + block]:
+                name = atom['name'].decode()
+                x, y, z = atom['xyz']
+                lines.append(f"{'HETATM' if atom['hetero'] else 'ATOM  '}{serial:5d} {name:4s} {atom['resname'].decode():>3s} "
+                             f"{atom['chain'].decode() or ' '}{atom['resseq']:4d}{atom['icode'].decode() or ' '}   "
+                             f"{x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{atom['b_factor']:6.2f}          {atom['element'].decode():>2s}\n")
+                serial += 1
+            yield "".join(lines)
+        yield "END\n"
+
+    def to_pdb(self):
+        """
+        return: str, the structure as PDB text
+        """
+        out = io.StringIO()
+        for text in self.iter_pdb():
+            out.write(text)
+        return out.getvalue()
@@ -0,0 +1,136 @@
+"""
+Synthetic predictions for the stand-ins of the fold backends (the stub ESMFold endpoint and the stub Boltz runner):
+structures with one CA atom per residue and the pLDDT in the B-factor column, and the Boltz output tree with
+its confidence files. Values are deterministic functions of the sequences.
+Only depends on numpy and yaml, so that the Boltz worker and the fake boltz executable start fast.
+"""
+import os, json, zlib
+import numpy as np
+
+from research_assistant.tools.workspace import atomic_write_text
+from research_assistant.tools.helpers import chain_id
+
+
+THREE_LETTER = {
+    'A': "ALA", 'R': "ARG", 'N': "ASN", 'D': "ASP", 'C': "CYS", 'E': "GLU", 'Q': "GLN", 'G': "GLY", 'H': "HIS", 'I': "ILE",
+    'L': "LEU", 'K': "LYS", 'M': "MET", 'F': "PHE", 'P': "PRO", 'S': "SER", 'T': "THR", 'W': "TRP", 'Y': "TYR", 'V': "VAL",
+}
+
+
+def stub_plddt(sequence):
+    """
+    pLDDT of each residue, in [0, 1]: a per-sequence level with noise, lower at the termini
+    """
+    rng = np.random.default_rng(zlib.crc32(sequence.encode()))
+    plddt = rng.uniform(0.65, 0.95) + rng.normal(0, 0.05, len(sequence))
+    ends = np.minimum(np.arange(len(sequence)), np.arange(len(sequence))[::-1])
+    plddt -= 0.3 * np.exp(-ends / 5.0)
+    return np.clip(plddt, 0.2, 0.99)
+
+
+def _ca_trace(sequences):
+    # alpha helices of 200 residues: 1.5 Å rise and 100° per residue, side by side so that coordinates of long chains
+    # fit in the columns of a PDB, one row of helices per chain
+    for chain_index, sequence in enumerate(sequences):
+        index = np.arange(len(sequence))
+        angles = np.radians(100.0) * index
+        yield chain_index, np.stack([2.3 * np.cos(angles) + 10.0 * (index // 200), 2.3 * np.sin(angles) + 30.0 * chain_index, 1.5 * (index % 200)], axis=1)
+
+
+def stub_pdb(sequences, plddts=None, chain_ids=None):
+    """
+    PDB of the CA trace of the chains, with the pLDDT (0-100) in the B-factor column
+    sequences: list[str], chain sequences
+    plddts: list of arrays, pLDDT in [0, 1] of each residue. Defaults to stub_plddt().
+    chain_ids: list[str], ID of each chain. Defaults to A, B, ... Two-letter IDs take columns 21-22.
+    return: str, PDB file content
+    """
+    plddts = plddts if plddts is not None else [stub_plddt(seq) for seq in sequences]
+    chain_ids = chain_ids or [chain_id(i) for i in range(len(sequences))]
+    lines, serial = [], 1
+    for chain_index, coords in _ca_trace(sequences):
+        chain = f"{chain_ids[chain_index]:>2s}"
+        for i, (residue, (x, y, z)) in enumerate(zip(sequences[chain_index], coords)):
+            lines.append(f"ATOM  {serial:5d}  CA  {THREE_LETTER.get(residue, 'UNK'):3s}{chain}{i + 1:4d}    "
+                         f"{x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{100 * plddts[chain_index][i]:6.2f}           C")
+            serial += 1
+        lines.append(f"TER   {serial:5d}      {THREE_LETTER.get(sequences[chain_index][-1:], 'UNK'):3s}{chain}{len(sequences[chain_index]):4d}")
+        serial += 1
+    lines.append("END")
+    return "\n".join(lines) + "\n"
+
+
+def stub_mmcif(name, sequences, plddts=None, chain_ids=None):
+    """
+    mmCIF of the CA trace of the chains, with the pLDDT (0-100) in B_iso_or_equiv
+    """
+    plddts = plddts if plddts is not None else [stub_plddt(seq) for seq in sequences]
+    chain_ids = chain_ids or [chain_id(i) for i in range(len(sequences))]
+    lines = [f"data_{name}", "loop_"] + [f"_atom_site.{field}" for field in (
+        "group_PDB", "id", "type_symbol", "label_atom_id", "label_comp_id", "label_asym_id", "label_seq_id",
+        "Cartn_x", "Cartn_y", "Cartn_z", "occupancy", "B_iso_or_equiv")]
+    serial = 1
+    for chain_index, coords in _ca_trace(sequences):
+        for i, (residue, (x, y, z)) in enumerate(zip(sequences[chain_index], coords)):
+            lines.append(f"ATOM {serial} C CA {THREE_LETTER.get(residue, 'UNK')} {chain_ids[chain_index]} {i + 1} "
+                         f"{x:.3f} {y:.3f} {z:.3f} 1.00 {100 * plddts[chain_index][i]:.2f}")
+            serial += 1
+    return "\n".join(lines) + "\n#\n"
+
+
+def write_stub_boltz_prediction(output_dir, name, sequences, output_format="pdb", use_msa_server=True, chain_ids=None):
+    """
+    Write the files Boltz writes for one structure, under the boltz_results_<input> directory of a run:
+    predictions/<name>/<name>_model_0.pdb (or .cif), confidence_<name>_model_0.json and plddt_<name>_model_0.npz,
+    and msa/<name>_<entity>.csv when the MSAs come from the MSA server
+    output_dir: str, the boltz_results_<input> directory
+    name: str, name of the structure
+    sequences: list[str], chain sequences
+    output_format: str, "pdb" or "mmcif"
+    use_msa_server: bool, whether the MSAs were fetched from the MSA server
+    chain_ids: list[str], ID of each chain, from the input YAML. Defaults to A, B, ...
+    return: str, the directory of the predictions of the structure
+    """
+    plddts = [stub_plddt(seq) for seq in sequences]
+    structure_dir = os.path.join(output_dir, "predictions", name)
+    os.makedirs(structure_dir, exist_ok=True)
+    if output_format == "pdb":
+        atomic_write_text(os.path.join(structure_dir, f"{name}_model_0.pdb"), stub_pdb(sequences, plddts, chain_ids))
+    else:
+        atomic_write_text(os.path.join(structure_dir, f"{name}_model_0.cif"), stub_mmcif(name, sequences, plddts, chain_ids))
+
+    all_plddt = np.concatenate(plddts) if plddts else np.zeros(0)
+    complex_plddt = float(all_plddt.mean()) if len(all_plddt) else 0.0
+    ptm = float(np.clip(complex_plddt - 0.05, 0, 1))
+    iptm = float(np.clip(complex_plddt - 0.1, 0, 1)) if len(sequences) > 1 else 0.0
+    confidence = {
+        'confidence_score': 0.8 * complex_plddt + 0.2 * (iptm if len(sequences) > 1 else ptm),
+        'ptm': ptm,
+        'iptm': iptm,
+        'ligand_iptm': 0.0,
+        'protein_iptm': iptm,
+        'complex_plddt': complex_plddt,
+        'complex_iplddt': complex_plddt,
+        'complex_pde': 1.0 - complex_plddt,
+        'complex_ipde': 1.0 - iptm,
+        'chains_ptm': {str(i): float(np.clip(p.mean() - 0.05, 0, 1)) for i, p in enumerate(plddts)},
+        'pair_chains_iptm': {str(i): {str(j): iptm if i != j else float(np.clip(plddts[i].mean() - 0.05, 0, 1))
+                                      for j in range(len(sequences))} for i in range(len(sequences))},
+    }
+    atomic_write_text(os.path.join(structure_dir, f"confidence_{name}_model_0.json"), json.dumps(confidence, indent=4))
+    np.savez_compressed(os.path.join(structure_dir, f"plddt_{name}_model_0.npz"), plddt=all_plddt.astype(np.float32))
+
+    if use_msa_server:
+        # one MSA per entity (unique chain), the query first, as saved by Boltz
+        os.makedirs(os.path.join(output_dir, "msa"), exist_ok=True)
+        for entity_id, seq in enumerate(dict.fromkeys(sequences)):
+            rng = np.random.default_rng(zlib.crc32(seq.encode()))
+            residues = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+            rows = [f"-1,{seq}"]
+            for k in range(8):
+                homolog = np.frombuffer(seq.encode(), dtype=np.uint8).copy()
+                mutated = rng.random(len(seq)) < 0.1 * (k + 1)
+                homolog[mutated] = rng.choice(residues, size=int(mutated.sum()))
+                rows.append(f"-1,{homolog.tobytes().decode()}")
+            atomic_write_text(os.path.join(output_dir, "msa", f"{name}_{entity_id}.csv"), "key,sequence\n" + "\n".join(rows) + "\n")
+    return structure_dir
@@ -0,0 +1,157 @@
+"""
+Local stand-ins for the LLM and the ESMFold NIM, to run the crews without network access or API keys,
+e.g. in the job server's stub mode and in the benchmarks. Boltz has its own stand-ins, the "stub" runner
+of the Boltz worker (see boltz_worker.StubBoltzRunner) and benchmarks/fake_boltz.py, which runs it as a `boltz` executable.
+"""
+import re, ast, json, time, random, threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from crewai.llms.base_llm import BaseLLM
+from crewai.events import crewai_event_bus
+from crewai.events.types.llm_events import LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallType
+
+from research_assistant.tools.sequence_parser import parse_sequence_input
+from research_assistant.tools.stub_structures import stub_pdb
+
+
+def _prompt_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(m.get("content", "")) for m in messages)
+
+
+def _action(tool_name, arguments):
+    return f"Thought: I will use the tool\nAction: {tool_name}\nAction Input: {json.dumps(arguments)}"
+
+
+class ScriptedLLM(BaseLLM):
+    """
+    Deterministic LLM that plays the agents of the crew: it reads the task prompt and answers with the
+    tool call each agent is expected to make, in the ReAct format parsed by crewai.
+    Like the crewai LLM, it emits the LLM call events and reports the token usage to the callbacks,
+    counting 4 characters per token.
+    """
+    def __init__(self, model="scripted", latency=0.0):
+        """
+        latency: float, seconds to sleep per call, to emulate the latency of a real model
+        """
+        super().__init__(model=model)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        with self._lock:
+            self.calls += 1
+        crewai_event_bus.emit(self, event=LLMCallStartedEvent(
+            messages=messages, tools=tools, callbacks=callbacks, available_functions=available_functions,
+            from_task=from_task, from_agent=from_agent, model=self.model,
+        ))
+        started = time.time()
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = _prompt_text(messages)
+        answer = self._answer(prompt)
+
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(answer) // 4, prompt_tokens_details=None)
+        for callback in callbacks or []:
+            if hasattr(callback, "log_success_event"):
+                callback.log_success_event({}, {'usage': usage}, started, time.time())
+        crewai_event_bus.emit(self, event=LLMCallCompletedEvent(
+            messages=messages, response=answer, call_type=LLMCallType.LLM_CALL,
+            from_task=from_task, from_agent=from_agent, model=self.model,
+        ))
+        return answer
+
+    def _answer(self, prompt):
+        if "Tool Name: Preprocess" in prompt:
+            message = prompt.rsplit("Here is the actual input from the user:", 1)[-1]
+            message = message.split("\n\nThis is the expected criteria", 1)[0]
+            parsed = parse_sequence_input(message) or {
+                'structure_name': "structure1",
+                'num_chains': len(re.findall(r"\b[ACDEFGHIKLMNPQRSTVWY]{20,}\b", message)),
+                'sequences': re.findall(r"\b[ACDEFGHIKLMNPQRSTVWY]{20,}\b", message),
+            }
+            return _action("Preprocess", parsed)
+
+        structure_name = re.search(r"structure_name='([^']*)'", prompt)
+        sequences = re.search(r"clean_sequences=(\[[^\]]*\])", prompt)
+        selected = re.search(r"selected_models=(\[[^\]]*\])", prompt)
+        if structure_name and sequences and selected:
+            arguments = {
+                'selected_models': ast.literal_eval(selected.group(1)),
+                'structure_name': structure_name.group(1),
+            }
+            sequences = ast.literal_eval(sequences.group(1))
+            if "Tool Name: Using ESMFold to predict protein structure" in prompt:
+                return _action("Using ESMFold to predict protein structure", {**arguments, 'sequence': sequences[0] if sequences else ""})
+            if "Tool Name: Use Boltz to predict protein structure" in prompt:
+                return _action("Use Boltz to predict protein structure", {**arguments, 'sequences': sequences})
+
+        if selected:
+            # the model selection agent: keep the initial proposal
+            return f"Thought: I keep the initial proposal\nFinal Answer: selected_models={selected.group(1)} explanation='Initial proposal kept.'"
+        return "Thought: I have nothing to do\nFinal Answer: Nothing to do."
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 128000
+
+
+class _StubESMFoldHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    rng = random.Random()
+    stats = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.stats['lock']:
+            delay = self.delay + self.rng.uniform(0, self.jitter)
+            error = self.rng.random() < self.error_rate
+            self.stats['requests'] += 1
+            self.stats['errors'] += error
+        time.sleep(delay)
+        if error:
+            # throttled, as the NIM answers under load
+            payload = json.dumps({"detail": "Too Many Requests"}).encode()
+            self.send_response(429)
+            self.send_header("Retry-After", "0.1")
+        else:
+            payload = json.dumps({"pdbs": [stub_pdb([body['sequence']])]}).encode()
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_esmfold_server(delay=0.0, port=0, jitter=0.0, error_rate=0.0, seed=None):
+    """
+    Start a local ESMFold-compatible endpoint in a background thread. It answers {"pdbs": [...]} with a synthetic
+    structure of the sequence (see stub_structures.stub_pdb), or 429 with a Retry-After header.
+    delay: float, seconds to sleep per request, to emulate the latency of the NIM
+    port: int, port to listen on. Defaults to a free port.
+    jitter: float, extra seconds to sleep per request, uniformly distributed in [0, jitter]
+    error_rate: float, fraction of the requests answered with 429
+    seed: int, seed of the jitter and of the errors
+    return: tuple, (server, url). Stop it with server.shutdown(). server.stats counts the requests and errors.
+    """
+    stats = {'requests': 0, 'errors': 0, 'lock': threading.Lock()}
+    handler = type("StubESMFoldHandler", (_StubESMFoldHandler,), {
+        'delay': delay, 'jitter': jitter, 'error_rate': error_rate, 'rng': random.Random(seed), 'stats': stats,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/esmfold"
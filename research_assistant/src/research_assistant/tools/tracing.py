@@ -0,0 +1,281 @@
+"""
+Tracing of where the time of a job goes: the crew tasks, the LLM turns of each agent, the tools, the ESMFold
+request and the Boltz run (MSA lookup, worker startup, inference).
+
+A trace is the spans of one job, its trace ID is the job ID of the job's Workspace. Spans are appended to a
+JSON lines file, one span per line, set with the environment variable TRACE_FILE (defaults to "output/traces.jsonl",
+set to an empty string to only keep the aggregates). Durations are aggregated per stage, i.e. per span name, and
+tokens per agent, for Tracer.stats() and the Prometheus text format of Tracer.prometheus().
+"""
+import os, json, time, uuid, threading, functools, contextvars
+from collections import deque
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("research_assistant_current_span", default=None)
+
+
+def current_trace_id():
+    """
+    return: str, trace ID of the current span, or None outside of a span
+    """
+    span = _current_span.get()
+    return span['trace_id'] if span else None
+
+
+def _quantile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+class Tracer:
+    """
+    Records spans and aggregates their durations per stage. Thread-safe.
+    The current span is kept in a context variable: spans opened inside another span in the same thread are its children.
+    """
+    def __init__(self, path=None, max_samples=1000):
+        """
+        path: str, JSON lines file of the spans. Defaults to env TRACE_FILE or "output/traces.jsonl", read at every span. "" disables the file.
+        max_samples: int, number of recent durations kept per stage for the percentiles
+        """
+        self.path = path
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._tokens = {}
+        self._agents = {}
+
+    def _emit(self, span):
+        with self._lock:
+            stage = self._stages.get(span['name'])
+            if stage is None:
+                stage = self._stages[span['name']] = {'count': 0, 'errors': 0, 'seconds': 0.0, 'samples': deque(maxlen=self.max_samples)}
+            stage['count'] += 1
+            stage['errors'] += 'error' in span
+            stage['seconds'] += span['duration']
+            stage['samples'].append(span['duration'])
+            path = self.path if self.path is not None else os.getenv("TRACE_FILE", os.path.join("output", "traces.jsonl"))
+            if path:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "a") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+
+    def _new_span(self, name, trace_id, attributes):
+        parent = _current_span.get()
+        if parent is not None and trace_id not in (None, parent['trace_id']):
+            parent = None
+        return {
+            'trace_id': trace_id or (parent['trace_id'] if parent else uuid.uuid4().hex),
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': parent['span_id'] if parent else None,
+            'name': name,
+            'start': time.time(),
+            'attributes': attributes,
+        }
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """
+        Time a block of code:
+        ```python
+        with get_tracer().span("esmfold.http", url=url) as attributes:
+            response = requests.post(url, json=data)
+            attributes['status_code'] = response.status_code
+        ```
+        name: str, name of the span, which is also its stage in the aggregates
+        trace_id: str, trace of the span. Defaults to the trace of the current span, or a new trace.
+        attributes: attributes of the span. The block can add more to the yielded dict.
+        """
+        span = self._new_span(name, trace_id, attributes)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            span['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span['duration'] = time.perf_counter() - started
+            self._emit(span)
+
+    def record(self, name, duration, trace_id=None, start=None, **attributes):
+        """
+        Record a span timed elsewhere, e.g. by the Boltz worker, or between two crewai events
+        duration: float, seconds
+        start: float, epoch time of the start of the span. Defaults to now minus duration.
+        """
+        span = self._new_span(name, trace_id, attributes)
+        span['start'] = start if start is not None else time.time() - duration
+        span['duration'] = duration
+        self._emit(span)
+
+    def bind_agents(self, agents, trace_id):
+        """
+        Attribute the LLM turns and tasks of agents to a trace. crewai runs async tasks in new threads,
+        which don't see the current span, so their events are matched to the trace by agent.
+        agents: dict, agent ID -> agent name
+        """
+        with self._lock:
+            for agent_id, name in agents.items():
+                self._agents[str(agent_id)] = (trace_id, name)
+
+    def unbind_agents(self, agents):
+        with self._lock:
+            for agent_id in agents:
+                self._agents.pop(str(agent_id), None)
+
+    def agent(self, agent_id):
+        """
+        return: tuple, (trace ID, agent name) of a bound agent, or (None, None)
+        """
+        with self._lock:
+            return self._agents.get(str(agent_id), (None, None))
+
+    def add_tokens(self, agent, prompt_tokens=0, completion_tokens=0, requests=0):
+        """
+        Count the tokens used by an agent
+        """
+        with self._lock:
+            tokens = self._tokens.setdefault(agent, {'prompt_tokens': 0, 'completion_tokens': 0, 'requests': 0})
+            tokens['prompt_tokens'] += prompt_tokens
+            tokens['completion_tokens'] += completion_tokens
+            tokens['requests'] += requests
+
+    def reset(self):
+        """
+        Clear the aggregates, e.g. between two benchmark runs. Spans already written to the file are kept.
+        """
+        with self._lock:
+            self._stages.clear()
+            self._tokens.clear()
+
+    def stats(self):
+        """
+        return: dict, with keys stages (stage -> count, errors, seconds, p50, p95 over the recent spans) and tokens (agent -> counters)
+        """
+        with self._lock:
+            stages = {name: (dict(stage), sorted(stage['samples'])) for name, stage in self._stages.items()}
+            tokens = {agent: dict(counters) for agent, counters in self._tokens.items()}
+        return {
+            'stages': {
+                name: {'count': stage['count'], 'errors': stage['errors'], 'seconds': stage['seconds'],
+                       'p50': _quantile(samples, 0.5), 'p95': _quantile(samples, 0.95)}
+                for name, (stage, samples) in sorted(stages.items())
+            },
+            'tokens': tokens,
+        }
+
+    def prometheus(self):
+        """
+        return: str, the aggregates in the Prometheus text exposition format
+        """
+        stats = self.stats()
+        lines = [
+            "# HELP research_assistant_stage_seconds Duration of the spans of each stage",
+            "# TYPE research_assistant_stage_seconds summary",
+        ]
+        for name, stage in stats['stages'].items():
+            lines += [
+                f'research_assistant_stage_seconds{{stage="{name}",quantile="0.5"}} {stage["p50"]}',
+                f'research_assistant_stage_seconds{{stage="{name}",quantile="0.95"}} {stage["p95"]}',
+                f'research_assistant_stage_seconds_sum{{stage="{name}"}} {stage["seconds"]}',
+                f'research_assistant_stage_seconds_count{{stage="{name}"}} {stage["count"]}',
+            ]
+        lines += [
+            "# HELP research_assistant_stage_errors_total Spans of each stage that raised",
+            "# TYPE research_assistant_stage_errors_total counter",
+        ]
+        lines += [f'research_assistant_stage_errors_total{{stage="{name}"}} {stage["errors"]}' for name, stage in stats['stages'].items()]
+        lines += [
+            "# HELP research_assistant_agent_tokens_total Tokens used by each agent",
+            "# TYPE research_assistant_agent_tokens_total counter",
+        ]
+        for agent, tokens in sorted(stats['tokens'].items()):
+            lines += [
+                f'research_assistant_agent_tokens_total{{agent="{agent}",kind="prompt"}} {tokens["prompt_tokens"]}',
+                f'research_assistant_agent_tokens_total{{agent="{agent}",kind="completion"}} {tokens["completion_tokens"]}',
+            ]
+        return "\n".join(lines) + "\n"
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer():
+    """
+    Get the process-wide tracer
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+def traced(name):
+    """
+    Decorator running a function in a span. Methods of objects with a `workspace` (the fold tools) open
+    a span of the job's trace when they are called outside of a span, e.g. in the thread of an async crew task.
+    name: str, name of the span
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            workspace = getattr(args[0], "workspace", None) if args else None
+            trace_id = workspace.job_id if workspace is not None and current_trace_id() is None else None
+            with get_tracer().span(name, trace_id=trace_id):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_listening = False
+
+def trace_crewai_events():
+    """
+    Record a span for each crew task (task.<task name>) and each LLM turn (llm.<agent name>) of the agents bound
+    with Tracer.bind_agents, from the events of crewai. Idempotent.
+    """
+    global _listening
+    from crewai.events import crewai_event_bus
+    from crewai.events.types.task_events import TaskStartedEvent, TaskCompletedEvent, TaskFailedEvent
+    from crewai.events.types.llm_events import LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallFailedEvent
+
+    with _tracer_lock:
+        if _listening:
+            return
+        _listening = True
+    started = {}
+
+    def _task_started(source, event):
+        if event.task is not None and event.task.agent is not None:
+            started[('task', id(event.task))] = (time.time(), time.perf_counter())
+
+    def _task_finished(source, event):
+        if event.task is None or event.task.agent is None:
+            return
+        start = started.pop(('task', id(event.task)), None)
+        trace_id, agent = get_tracer().agent(event.task.agent.id)
+        if start is not None and trace_id is not None:
+            attributes = {'agent': agent}
+            if getattr(event, "error", None):
+                attributes['error'] = event.error
+            get_tracer().record(f"task.{event.task.name}", time.perf_counter() - start[1], trace_id=trace_id, start=start[0], **attributes)
+
+    def _llm_started(source, event):
+        if event.agent_id is not None:
+            started[('llm', str(event.agent_id), threading.get_ident())] = (time.time(), time.perf_counter())
+
+    def _llm_finished(source, event):
+        if event.agent_id is None:
+            return
+        start = started.pop(('llm', str(event.agent_id), threading.get_ident()), None)
+        trace_id, agent = get_tracer().agent(event.agent_id)
+        if start is not None and trace_id is not None:
+            get_tracer().record(f"llm.{agent}", time.perf_counter() - start[1], trace_id=trace_id, start=start[0], model=getattr(event, "model", None))
+
+    crewai_event_bus.on(TaskStartedEvent)(_task_started)
+    crewai_event_bus.on(TaskCompletedEvent)(_task_finished)
+    crewai_event_bus.on(TaskFailedEvent)(_task_finished)
+    crewai_event_bus.on(LLMCallStartedEvent)(_llm_started)
+    crewai_event_bus.on(LLMCallCompletedEvent)(_llm_finished)
+    crewai_event_bus.on(LLMCallFailedEvent)(_llm_finished)
@@ -0,0 +1,87 @@
+import numpy as np
+
+
+# residues accepted by is_amino_acid_sequence, including the stop codon
+VALID_RESIDUES = b"ARNDCEQGHILKMFPSTWYVBZX*"
+
+# one record per sequence: whether it is valid, the position of its first invalid character in the
+# cleaned sequence (-1 if there is none), and the length of the cleaned sequence
+VALIDATION_DTYPE = np.dtype([("valid", np.bool_), ("first_bad", np.int64), ("length", np.int64)])
+
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+_WHITESPACE_CODES = np.frombuffer(_WHITESPACE, dtype=np.uint8)
+_UPPER = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+# maps residues (either case) and the NUL separator between sequences to 0, any other byte to 1
+_INVALID = bytearray(b"\x01" * 256)
+for _c in b"\x00" + VALID_RESIDUES + VALID_RESIDUES.lower():
+    _INVALID[_c] = 0
+_INVALID = bytes(_INVALID)
+
+
+def clean_sequence(sequence):
+    """
+    Clean a sequence like is_amino_acid_sequence does: remove whitespace and convert to uppercase
+    sequence: str, amino acid sequence
+    return: str, cleaned sequence
+    """
+    return sequence.encode("ascii", errors="replace").translate(_UPPER, _WHITESPACE).decode("ascii")
+
+
+def _invalid_positions(buf):
+    """
+    Positions of the invalid characters in buf, without a Python loop over the residues
+    """
+    # one byte per character, 1 for invalid characters
+    mask = buf.translate(_INVALID)
+    # invalid characters are rare: find the 8-byte words that contain one, then the bytes within these words
+    n_words = len(mask) // 8
+    words = np.flatnonzero(np.frombuffer(mask, dtype=np.uint64, count=n_words))
+    hits = np.frombuffer(mask, dtype=np.uint8, count=n_words * 8).reshape(-1, 8)[words].astype(np.bool_)
+    tail = np.flatnonzero(np.frombuffer(mask, dtype=np.uint8, offset=n_words * 8))
+    return np.concatenate(((words[:, None] * 8 + np.arange(8))[hits], tail + n_words * 8))
+
+
+def validate_sequences(sequences):
+    """
+    Clean and validate many amino acid sequences at once. Sequences are cleaned like in is_amino_acid_sequence
+    (whitespace removed, case ignored), then checked against VALID_RESIDUES with a byte translation table over
+    a single buffer, so the cost per sequence is a few bytes operations instead of a Python loop over its characters.
+    Unlike is_amino_acid_sequence, empty sequences are not valid.
+    sequences: list[str], amino acid sequences
+    return: numpy structured array of VALIDATION_DTYPE, one record per sequence
+
+    # Example usage:
+    ```python
+    result = validate_sequences(["MKWV TFIS", "MKW1"])
+    result["valid"]      # [True, False]
+    result["first_bad"]  # [-1, 3]
+    result["length"]     # [8, 4]
+    ```
+    """
+    if len(sequences) == 0:
+        return np.empty(0, dtype=VALIDATION_DTYPE)
+    # non-ASCII characters become "?", which is invalid and keeps the positions of the characters
+    joined = "\x00".join(sequences).encode("ascii", errors="replace")
+    if joined.count(b"\x00") != len(sequences) - 1:
+        # a sequence contains a NUL character, which is invalid like "?"
+        return validate_sequences([seq.replace("\x00", "?") for seq in sequences])
+    # whitespace is flagged as invalid here, and only removed if there is any
+    bad = _invalid_positions(joined)
+    if len(bad) and np.isin(np.frombuffer(joined, dtype=np.uint8)[bad], _WHITESPACE_CODES).any():
+        cleaned = joined.translate(None, _WHITESPACE)
+        separators = np.flatnonzero(np.frombuffer(cleaned, dtype=np.uint8) == 0)
+        lengths = np.diff(np.concatenate(([-1], separators, [len(cleaned)]))) - 1
+        bad = _invalid_positions(cleaned)
+    else:
+        lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    starts = np.concatenate(([0], np.cumsum(lengths[:-1] + 1)))
+
+    result = np.empty(len(sequences), dtype=VALIDATION_DTYPE)
+    result["length"] = lengths
+    result["first_bad"] = -1
+    if len(bad):
+        owner = np.searchsorted(starts, bad, side="right") - 1
+        owners, first = np.unique(owner, return_index=True)
+        result["first_bad"][owners] = bad[first] - starts[owners]
+    result["valid"] = (result["first_bad"] < 0) & (lengths > 0)
+    return result
@@ -0,0 +1,57 @@
+import os, uuid, tempfile
+from datetime import datetime
+
+
+def new_job_id():
+    """
+    Unique job ID, e.g. run-date-241201-time-143005-1f2e3d4c. The date and time keep IDs sortable,
+    the random suffix makes them unique between jobs started at the same time, in any process.
+    """
+    return f"{datetime.now().strftime('run-date-%y%m%d-time-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def atomic_write_text(path, text):
+    """
+    Write a text file atomically: write to a temporary file in the same directory, then rename it.
+    Readers never see a partially written file, and concurrent writers of the same path don't interleave.
+    path: str, path of the file
+    text: str, content of the file
+    return: str, path of the file
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+class Workspace:
+    """
+    Directories of one job: <root>/<kind>/<job_id>, e.g. output/esmfold_result/<job_id> or input/boltz_input/<job_id>.
+    Job IDs are unique, so concurrent jobs never share a directory, and nothing is deleted when a job starts.
+    """
+    def __init__(self, job_id=None):
+        """
+        job_id: str, ID of the job. Defaults to a new unique ID.
+        """
+        self.job_id = job_id or new_job_id()
+
+    def path(self, kind):
+        """
+        Directory of the job for one kind of files, created if it does not exist
+        kind: str, e.g. "output/esmfold_result" or "input/boltz_input"
+        return: str, path of the directory
+        """
+        path = os.path.join(kind, self.job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def __repr__(self):
+        return f"Workspace({self.job_id!r})"
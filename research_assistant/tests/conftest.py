@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def trace_file(tmp_path, monkeypatch):
+    # the spans of a test go to its own directory, never to output/traces.jsonl of the working tree
+    monkeypatch.setenv("TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    return tmp_path / "traces.jsonl"
+
+
+@pytest.fixture
+def offline_env(tmp_path, monkeypatch, trace_file):
+    """
+    Environment of a crew job run in tmp_path without network access: a placeholder OpenAI key, no disk caches
+    and no results store, and the fold backends unset so that use_stub_backends configures them
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "unused")
+    monkeypatch.setenv("CREWAI_TESTING", "true")
+    for name in ("ESMFOLD_CACHE_DIR", "RESULTS_DB", "LLM_CACHE_DIR"):
+        monkeypatch.setenv(name, "")
+    for name in ("ESMFOLD_URL", "BOLTZ_BACKEND", "BOLTZ_WORKER_RUNNER", "MSA_CACHE_DIR", "CHECKPOINT_DIR", "SEQUENCE_STORE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("BOLTZ_WORKER_ADDRESS", str(tmp_path / "boltz.sock"))
+    return tmp_path
+
+
+@pytest.fixture
+def stub_backends(offline_env):
+    """
+    The stub fold backends, torn down after the test
+    yield: the stub ESMFold server
+    """
+    from research_assistant.server import use_stub_backends
+    with use_stub_backends() as esmfold:
+        yield esmfold
@@ -0,0 +1,87 @@
+import time, threading
+import pytest
+import requests
+
+from research_assistant.server import CrewPool, JobServer, serve
+from research_assistant.tools.approvals import ApprovalQueue, APPROVE, REJECT, unambiguous, never
+from research_assistant.tools.model_selection import select_models
+from research_assistant.tools.stubs import ScriptedLLM
+from research_assistant.main import example_input1, example_input2
+
+
+def _wait(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_approval_queue():
+    decided = []
+    approvals = ApprovalQueue(policy=unambiguous, timeout=None, on_decision=decided.append)
+    try:
+        assert approvals.submit("job1", select_models(2), 2).decided_by == "policy"
+        pending = approvals.submit("job2", select_models(0), 0)
+        assert not pending.done.is_set() and decided == []
+        for job_id in ("job3", "job4"):
+            approvals.policy = never
+            approvals.submit(job_id, select_models(1), 1)
+        assert [p['job_id'] for p in approvals.pending()] == ["job2", "job3", "job4"]
+
+        assert approvals.reject("job2", reason="Invalid input")
+        assert approvals.approve_all(feedback="only Boltz") == ["job3", "job4"]
+        assert not approvals.approve("job3")
+        assert [(a.job_id, a.decision, a.feedback) for a in decided] == [
+            ("job2", REJECT, "Invalid input"), ("job3", APPROVE, "only Boltz"), ("job4", APPROVE, "only Boltz")]
+        assert approvals.stats == {'policy': 1, 'reviewer': 3, 'deadline': 0}
+    finally:
+        approvals.close()
+
+
+def test_deadline_default_action():
+    decided = []
+    approvals = ApprovalQueue(policy=never, timeout=0.3, default=REJECT, on_decision=decided.append)
+    try:
+        approval = approvals.submit("job1", select_models(1), 1)
+        assert approval.done.wait(5)
+        assert approval.decision == REJECT and approval.decided_by == "deadline"
+        assert decided == [approval] and approvals.pending() == []
+    finally:
+        approvals.close()
+    with pytest.raises(ValueError):
+        ApprovalQueue(default="maybe")
+
+
+def test_jobs_awaiting_approval_release_the_workers(stub_backends):
+    approvals = ApprovalQueue(policy=never)
+    # a single worker: jobs waiting for the reviewer must not hold it
+    server = JobServer(workers=1, pool=CrewPool(llm=ScriptedLLM()), warm=0, approvals=approvals)
+    http_server = serve(server, port=0)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{http_server.server_address[1]}"
+    try:
+        waiting = [requests.post(f"{url}/jobs", json={'tenant': "a", 'message': example_input2}).json()['id'] for _ in range(3)]
+        _wait(lambda: len(approvals.pending()) == 3)
+        assert {server.status(job_id)['state'] for job_id in waiting} == {"awaiting_approval"}
+        assert requests.get(f"{url}/jobs/{waiting[0]}/result").status_code == 202
+
+        # a job submitted with its feedback runs while the others wait
+        accepted = server.submit("b", example_input1, feedback="")
+        assert "- Boltz\n    - Selected: Yes\n    - Prediction successful: Yes" in server.result(accepted, timeout=120)
+        assert server.metrics()['awaiting_approval'] == 3
+
+        assert [p['job_id'] for p in requests.get(f"{url}/approvals").json()] == waiting
+        assert requests.post(f"{url}/approvals/{waiting[0]}", json={'decision': "reject", 'feedback': "Not now"}).status_code == 200
+        assert requests.post(f"{url}/approvals", json={'feedback': "only Boltz"}).json() == {'approved': waiting[1:]}
+        reports = [server.result(job_id, timeout=120) for job_id in waiting]
+    finally:
+        http_server.shutdown()
+        server.shutdown()
+        approvals.close()
+
+    assert "- ESMFold\n    - Selected: No" in reports[0] and "- Boltz\n    - Selected: No" in reports[0]
+    for report in reports[1:]:
+        assert "- ESMFold\n    - Selected: No" in report
+        assert "- Boltz\n    - Selected: Yes\n    - Prediction successful: Yes" in report
+    assert server.metrics()['approvals'] == {'policy': 0, 'reviewer': 3, 'deadline': 0}
+    assert server.metrics()['awaiting_approval'] == 0
@@ -0,0 +1,44 @@
+import sys, subprocess
+
+from research_assistant.crew import ResearchAssistant
+from research_assistant.tools.backends import FoldBackend, _backends, get_backend, folding_tasks
+from research_assistant.tools.model_selection import select_models, apply_feedback, normalize_model_name
+from research_assistant.tools.stubs import ScriptedLLM
+
+
+def test_tools_are_imported_on_first_use():
+    backend = FoldBackend("Colors", tool="colorsys:rgb_to_hsv", agent="colors_agent", task="colors_task")
+    sys.modules.pop("colorsys", None)
+    assert backend.tool_class().__name__ == "rgb_to_hsv" and "colorsys" in sys.modules
+    assert get_backend("Boltz").supports(5) and not get_backend("ESMFold").supports(2)
+
+
+def test_crew_does_not_import_the_fold_tools():
+    # in a new interpreter: other tests import the tool modules
+    code = ("import sys; from research_assistant.crew import ResearchAssistant; "
+            "print(any(m in sys.modules for m in ('research_assistant.tools.esmfold_tool', 'research_assistant.tools.boltz_tool')))")
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip() == "False"
+
+
+def test_crews_only_build_the_backends_they_run(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_DIR", "")
+    preprocess = ResearchAssistant(task_names=['preprocess_task'], llm=ScriptedLLM())
+    assert [t.name for t in preprocess.crew().tasks] == ['preprocess_task'] and preprocess._fold_agents == {}
+
+    # ESMFold is not selected for a complex: its task is precomputed
+    complex_crew = ResearchAssistant(precomputed={'preprocess_task': "", 'model_selection_task': "", 'esmfold_task': ""}, llm=ScriptedLLM())
+    crew = complex_crew.crew()
+    assert [t.name for t in crew.tasks] == ['boltz_task'] and list(complex_crew._fold_agents) == ["Boltz"]
+    assert [agent.tools[0].name for agent in crew.agents] == ["Use Boltz to predict protein structure"]
+
+
+def test_registered_backends_are_proposed(monkeypatch):
+    monkeypatch.setitem(_backends, "IgFold", FoldBackend(
+        "IgFold", tool="research_assistant.tools.igfold_tool:IgFoldTool", agent="igfold_agent", task="igfold_task",
+        max_chains=2, pattern=r"\big[\s\-_]?fold\b",
+    ))
+    assert select_models(2).selected_models == ["Boltz", "IgFold"]
+    assert select_models(3).selected_models == ["Boltz"]
+    assert normalize_model_name("Ig fold") == "IgFold"
+    assert apply_feedback(select_models(2), 2, "only IgFold").selected_models == ["IgFold"]
+    assert folding_tasks() == {'ESMFold': 'esmfold_task', 'Boltz': 'boltz_task', 'IgFold': 'igfold_task'}
@@ -0,0 +1,77 @@
+import os, json, sqlite3
+
+from research_assistant.tools.batch import read_records, run_batch
+from research_assistant.tools.results_store import ResultsStore
+from research_assistant.tools.stubs import start_stub_esmfold_server
+
+FAKE_BOLTZ = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fake_boltz.py")
+
+
+def test_readers(tmp_path):
+    fasta = tmp_path / "in.fasta"
+    fasta.write_text(">a first\nMKV\nAAA\n>b\nMKV:GGG\n")
+    csv = tmp_path / "in.csv"
+    csv.write_text("id,sequence\na,MKV\nb,MKV:GGG\n")
+    jsonl = tmp_path / "in.jsonl"
+    jsonl.write_text('{"id": "a", "sequence": "MKV"}\n\n{"id": "b", "sequences": ["MKV", "GGG"]}\n')
+    assert list(read_records(str(fasta))) == [{'id': "a", 'sequences': ["MKVAAA"]}, {'id': "b", 'sequences': ["MKV", "GGG"]}]
+    assert list(read_records(str(csv))) == list(read_records(str(jsonl))) == [{'id': "a", 'sequences': ["MKV"]}, {'id': "b", 'sequences': ["MKV", "GGG"]}]
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    monkeypatch.setenv("ESMFOLD_CACHE_DIR", "")
+    monkeypatch.setenv("RESULTS_DB", str(tmp_path / "results.db"))
+    monkeypatch.setenv("TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setenv("BOLTZ_EXECUTABLE", FAKE_BOLTZ)
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+    server, url = start_stub_esmfold_server(delay=0.05)
+
+    records = [{'id': f"p{i}", 'sequence': "MKV" + "A" * i} for i in range(10)]
+    records += [{'id': "dup", 'sequence': "mkv a"}, {'id': "complex", 'sequences': ["MKV", "GGG"]}, {'id': "bad", 'sequence': "MK1"}]
+    input_path = tmp_path / "in.jsonl"
+    input_path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    try:
+        report = run_batch(str(input_path), output_dir=str(tmp_path / "out"), esmfold_concurrency=3, boltz_batch_size=4,
+                           queue_size=4, use_msa_server=False, esmfold_url=url)
+    finally:
+        server.shutdown()
+
+    manifest = [json.loads(line) for line in (tmp_path / "out" / "manifest.jsonl").read_text().splitlines()]
+    results = [(e['id'], e['model']) for e in manifest if 'model' in e]
+    # single chains are folded by both models, the complex by Boltz only
+    assert sorted(results) == sorted([(f"p{i}", m) for i in range(10) for m in ("ESMFold", "Boltz")] + [("complex", "Boltz")])
+    assert all(e['success'] and os.path.exists(e['output_file_path']) for e in manifest if 'model' in e)
+    assert {'id': "dup", 'duplicate_of': "p1"} in manifest
+    assert [e for e in manifest if e['id'] == "bad"][0]['success'] is False
+    assert server.stats['requests'] == 10
+    assert report['records'] == 13 and report['unique'] == 12 and report['failed'] == 0 and report['records_per_second'] > 0
+    # every prediction is indexed
+    store = ResultsStore(str(tmp_path / "results.db"))
+    assert store.count() == 21 and store.count("Boltz") == 11
+    assert store.is_folded(["MKV", "GGG"], model="Boltz") and not store.is_folded(["MKV", "GGG"], model="ESMFold")
+
+
+def test_run_batch_survives_store_errors(tmp_path, monkeypatch):
+    monkeypatch.setenv("ESMFOLD_CACHE_DIR", "")
+    monkeypatch.setenv("RESULTS_DB", str(tmp_path / "results.db"))
+    monkeypatch.setenv("BOLTZ_EXECUTABLE", FAKE_BOLTZ)
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(ResultsStore, "record", locked)
+    monkeypatch.setattr(ResultsStore, "record_many", locked)
+    server, url = start_stub_esmfold_server(delay=0.05)
+    input_path = tmp_path / "in.jsonl"
+    input_path.write_text("".join(json.dumps({'id': f"p{i}", 'sequence': "MKV" + "A" * i}) + "\n" for i in range(6)))
+    try:
+        # one worker per backend and short queues: a dead worker would block the reader
+        report = run_batch(str(input_path), output_dir=str(tmp_path / "out"), esmfold_concurrency=1, boltz_batch_size=2,
+                           queue_size=2, use_msa_server=False, esmfold_url=url)
+    finally:
+        server.shutdown()
+    assert report['records'] == 6 and report['failed'] == 0
+    manifest = [json.loads(line) for line in (tmp_path / "out" / "manifest.jsonl").read_text().splitlines()]
+    assert len(manifest) == 12 and all(e['success'] for e in manifest)
@@ -0,0 +1,64 @@
+import os
+
+from research_assistant.tools.boltz_batch import predict_with_boltz_batch, parse_failed_examples
+from research_assistant.tools.boltz_worker import BoltzWorkerClient
+from research_assistant.tools.boltz_tool import BoltzTool
+from research_assistant.tools.report import parse_fold_output
+from research_assistant.tools.results_store import ResultsStore
+
+FAKE_BOLTZ = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fake_boltz.py")
+
+
+def test_parse_failed_examples():
+    assert parse_failed_examples("Predicting DataLoader 0: 100%|\nNumber of failed examples: 2\n") == 2
+    assert parse_failed_examples("Number of failed examples: 0") == 0
+    assert parse_failed_examples("Traceback (most recent call last):") is None
+    assert parse_failed_examples(None) is None
+
+
+def test_predict_with_boltz_batch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+    jobs = {'monomer': ["MKVLAAGG"], 'dimer': ["mkv laa gg", "GGSSWWYY"]}
+    results = predict_with_boltz_batch(jobs, yaml_dir=str(tmp_path / "input"), result_dir=str(tmp_path / "out"),
+                                       use_msa_server=False, backend="subprocess", executable=FAKE_BOLTZ)
+    assert results['monomer']['success'] and results['dimer']['success']
+    assert os.path.isfile(os.path.join(results['dimer']['output_file_path'], "dimer_model_0.pdb"))
+
+
+def test_each_structure_fails_when_boltz_cannot_run(tmp_path):
+    jobs = {'monomer': ["MKVLAAGG"], 'empty': []}
+    results = predict_with_boltz_batch(jobs, yaml_dir=str(tmp_path / "input"), result_dir=str(tmp_path / "out"),
+                                       use_msa_server=False, executable=str(tmp_path / "missing" / "boltz"))
+    assert not results['monomer']['success'] and results['monomer']['error']
+    # a structure that cannot be written fails alone, with its own error
+    assert not results['empty']['success'] and "cannot be empty" in results['empty']['error']
+    assert predict_with_boltz_batch({}) == {}
+
+
+def test_worker_failures_fail_each_structure(tmp_path, monkeypatch):
+    def died(self, *args, **kwargs):
+        raise EOFError("the worker closed the connection")
+    monkeypatch.setattr(BoltzWorkerClient, "predict", died)
+    monkeypatch.setenv("BOLTZ_WORKER_ADDRESS", str(tmp_path / "boltz.sock"))
+    jobs = {'a': ["MKVLAAGG"], 'b': ["GGSSWWYY"]}
+    results = predict_with_boltz_batch(jobs, yaml_dir=str(tmp_path / "input"), result_dir=str(tmp_path / "out"),
+                                       use_msa_server=False, backend="worker")
+    assert [r['success'] for r in results.values()] == [False, False]
+    assert all("closed the connection" in r['error'] for r in results.values())
+
+
+def test_boltz_tool_records_failed_runs(offline_env, monkeypatch):
+    monkeypatch.setenv("RESULTS_DB", str(offline_env / "results.db"))
+    monkeypatch.setenv("BOLTZ_BACKEND", "bogus")
+    result = parse_fold_output(BoltzTool()._run(selected_models=["Boltz"], structure_name="protein1", sequences=["MKVLAAGG"]))
+    assert result.model_is_selected and not result.success
+
+    # a runner that raises fails the prediction the same way
+    def failed(*args, **kwargs):
+        raise RuntimeError("Boltz worker exited with code 1 during startup")
+    monkeypatch.setattr("research_assistant.tools.boltz_batch.run_boltz", failed)
+    result = parse_fold_output(BoltzTool()._run(selected_models=["Boltz"], structure_name="protein2", sequences=["GGSSWWYY"]))
+    assert result.model_is_selected and not result.success
+    # both failed predictions are indexed
+    assert ResultsStore(str(offline_env / "results.db")).count("Boltz") == 2
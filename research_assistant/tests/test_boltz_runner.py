@@ -0,0 +1,83 @@
+import os, sys, time
+
+from research_assistant.tools.helpers import write_sequences_to_yaml
+from research_assistant.tools.boltz_batch import run_boltz, collect_boltz_predictions
+from research_assistant.tools.boltz_runner import parse_progress, run_streaming
+
+FAKE_BOLTZ = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fake_boltz.py")
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_parse_progress():
+    assert parse_progress("Generating MSA for protein1.yaml with 2 protein entities.") == ("msa", None, False)
+    assert parse_progress("Predicting DataLoader 0:  50%|█████     | 1/2 [00:10<00:10,  0.10it/s]") == ("predicting", 0.5, False)
+    assert parse_progress("torch.OutOfMemoryError: CUDA out of memory. Tried to allocate 2.00 GiB")[2]
+    assert parse_progress("Error: Missing option '--out_dir'.")[2]
+    assert not parse_progress("Traceback (most recent call last):")[2]
+    assert parse_progress("some log line") == (None, None, False)
+
+
+def test_run_boltz_streams_progress(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+    input_path = str(tmp_path / "protein1.yaml")
+    write_sequences_to_yaml(["MKVLAAGG"], input_path)
+    events = []
+    output = run_boltz(input_path, str(tmp_path / "out"), backend="subprocess", executable=FAKE_BOLTZ, on_event=events.append)
+    assert output['returncode'] == 0 and output['timed_out'] is None
+    assert [e['stage'] for e in events if e['event'] == "stage"] == ["checking", "processing", "msa", "predicting", "writing"]
+    assert any(e['event'] == "progress" and e['fraction'] == 1.0 for e in events)
+    assert events[0]['event'] == "started" and events[-1]['event'] == "exited"
+    assert collect_boltz_predictions(str(tmp_path / "out"), input_path, ["protein1"])["protein1"]['success']
+
+
+def test_idle_timeout_kills_process_group(tmp_path):
+    # the child sleeps in a grandchild that holds the pipes open: the whole group must be killed
+    marker = tmp_path / "survived"
+    grandchild = tmp_path / "grandchild.py"
+    grandchild.write_text(f"import time\ntime.sleep(3)\nopen({str(marker)!r}, 'w').close()\n")
+    code = f"import subprocess, sys; print('Checking input data.', flush=True); subprocess.run([sys.executable, {str(grandchild)!r}])"
+    started = time.perf_counter()
+    output = run_streaming(_python(code), idle_timeout=0.5, kill_grace=1.0)
+    assert time.perf_counter() - started < 3
+    assert output['timed_out'] == "idle" and output['returncode'] != 0
+    assert "checking" in output['error']
+    time.sleep(3.5)
+    assert not marker.exists()
+
+
+def test_wall_clock_timeout():
+    code = "import time\nwhile True:\n    print('Predicting DataLoader 0: 1/10 [', flush=True); time.sleep(0.1)"
+    output = run_streaming(_python(code), timeout=1.0, idle_timeout=5.0, kill_grace=1.0)
+    assert output['timed_out'] == "wall"
+    assert len(output['stdout'].splitlines()) <= 200
+
+
+def test_fatal_error_stops_the_run_early():
+    # Boltz hangs after the traceback, e.g. on the threads of the MSA client
+    code = "import sys, time; print('Traceback (most recent call last):', file=sys.stderr, flush=True); print('RuntimeError: CUDA out of memory', file=sys.stderr, flush=True); time.sleep(30)"
+    events = []
+    started = time.perf_counter()
+    output = run_streaming(_python(code), on_event=events.append, failure_grace=0.5, kill_grace=1.0)
+    assert time.perf_counter() - started < 10
+    assert output['timed_out'] is None and output['returncode'] != 0
+    assert output['error'] == "RuntimeError: CUDA out of memory" and "Traceback" in output['stderr']
+    assert [e['event'] for e in events].count("error") == 1
+
+
+def test_worker_backend_timeout(tmp_path, monkeypatch):
+    from research_assistant.tools.boltz_worker import get_boltz_worker
+    monkeypatch.setenv("BOLTZ_WORKER_ADDRESS", str(tmp_path / "boltz.sock"))
+    monkeypatch.setenv("BOLTZ_WORKER_RUNNER", "stub")
+    worker = get_boltz_worker()
+    worker.runner_kwargs = {'load_seconds': 0, 'predict_seconds': 5}
+    input_path = str(tmp_path / "protein1.yaml")
+    write_sequences_to_yaml(["MKVLAAGG"], input_path)
+    try:
+        output = run_boltz(input_path, str(tmp_path / "out"), backend="worker", timeout=0.5)
+    finally:
+        worker.close()
+    assert output['timed_out'] == "wall" and output['returncode'] != 0 and "0.5s" in output['error']
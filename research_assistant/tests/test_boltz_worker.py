@@ -0,0 +1,58 @@
+import os
+import pytest
+
+from research_assistant.tools.helpers import write_sequences_to_yaml
+from research_assistant.tools.boltz_batch import collect_boltz_predictions
+from research_assistant.tools.boltz_worker import BoltzWorkerClient
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = BoltzWorkerClient(address=str(tmp_path / "boltz.sock"), runner="stub", max_jobs=2,
+                               runner_kwargs={'load_seconds': 0, 'predict_seconds': 0})
+    yield client
+    client.close()
+
+
+def _input(tmp_path, name):
+    input_path = str(tmp_path / f"{name}.yaml")
+    write_sequences_to_yaml(["MKVLAAGG"], input_path)
+    return input_path
+
+
+def test_health_and_recycle(tmp_path, client):
+    assert client.health() is None
+    status = client.ensure_started()
+    assert status['state'] == "ready" and status['jobs_done'] == 0 and not status['busy']
+    for i in range(2):
+        output = client.predict(_input(tmp_path, f"protein{i}"), str(tmp_path / "out"))
+        assert output['ok'] and output['returncode'] == 0
+    assert output['state'] == "recycling"
+    # the next job starts a fresh worker
+    output = client.predict(_input(tmp_path, "protein2"), str(tmp_path / "out"))
+    assert output['returncode'] == 0 and output['jobs_done'] == 1
+    assert client.health()['pid'] != status['pid']
+    assert collect_boltz_predictions(str(tmp_path / "out"), _input(tmp_path, "protein2"), ["protein2"])["protein2"]['success']
+
+
+def test_drain(tmp_path, client):
+    client.ensure_started()
+    assert client.drain()['state'] == "draining"
+    assert client.health() is None and not os.path.exists(client.address)
+    assert client.drain() is None
+
+
+def test_failed_job_is_answered_and_worker_keeps_serving(tmp_path, client):
+    output = client.predict(str(tmp_path / "missing.yaml"), str(tmp_path / "out"))
+    assert not output['ok'] and output['returncode'] == 1
+    assert "Boltz worker failed" in output['error'] and "FileNotFoundError" in output['stderr']
+    status = client.health()
+    assert not status['busy'] and status['jobs_done'] == 1
+    assert client.predict(_input(tmp_path, "protein1"), str(tmp_path / "out"))['returncode'] == 0
+
+
+def test_predict_timeout_kills_the_worker(tmp_path, client):
+    client.runner_kwargs = {'load_seconds': 0, 'predict_seconds': 5}
+    with pytest.raises(TimeoutError):
+        client.predict(_input(tmp_path, "protein1"), str(tmp_path / "out"), timeout=0.5)
+    assert client.health() is None and not os.path.exists(client.address)
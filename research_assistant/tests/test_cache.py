@@ -0,0 +1,68 @@
+import os, time, threading
+
+from research_assistant.tools.cache import DiskCache, make_cache_key, normalize_sequence
+
+
+def test_key_uses_normalized_sequence():
+    a = make_cache_key("url", "esmfold", normalize_sequence("mkv tfi\nsl"))
+    b = make_cache_key("url", "esmfold", normalize_sequence("MKVTFISL"))
+    c = make_cache_key("other-url", "esmfold", normalize_sequence("MKVTFISL"))
+    assert a == b
+    assert a != c
+
+
+def test_hit_and_miss(tmp_path):
+    cache = DiskCache(str(tmp_path), suffix=".pdb")
+    key = make_cache_key("MKV")
+    assert cache.get(key) is None
+    cache.put(key, "ATOM")
+    assert cache.get(key) == "ATOM"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_age_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60)
+    key = make_cache_key("MKV")
+    path = cache.put(key, "ATOM")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+
+
+def test_size_eviction_keeps_recent_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    keys = [make_cache_key(i) for i in range(5)]
+    for i, key in enumerate(keys):
+        path = cache.put(key, "x" * 100)
+        os.utime(path, (i, time.time()))
+    assert cache.get(keys[-1]) is not None
+    assert sum(cache.contains(k) for k in keys) <= 2
+
+
+def test_single_flight_coalesces_concurrent_misses(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return "ATOM"
+
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(cache.get_or_compute("k" * 64, compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(value == "ATOM" for value, _ in results)
+    assert cache.get_or_compute("k" * 64, compute) == ("ATOM", True)
@@ -0,0 +1,81 @@
+import os, sys, json
+
+import pytest
+
+from research_assistant.crew import kickoff, resume
+from research_assistant.server import CrewPool
+from research_assistant.tools.checkpoints import CheckpointStore, get_checkpoint_store, verified_outputs
+from research_assistant.tools.custom_tool import FoldToolOutput, Preprocess
+from research_assistant.tools.report import parse_fold_output
+from research_assistant.tools.stubs import ScriptedLLM
+from research_assistant.main import example_input2, resume as resume_command
+
+
+def _died(store, job_id, stages=()):
+    # the checkpoint of the job if it had died before the report, and before the given stages finished
+    checkpoint = store.load(job_id)
+    checkpoint['report'] = None
+    for name in stages:
+        del checkpoint['outputs'][name]
+    with open(store.path_for(job_id), "w") as f:
+        json.dump(checkpoint, f)
+
+
+def test_only_completed_stages_with_their_outputs_are_kept(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SEQUENCE_STORE_DIR", str(tmp_path / "sequences"))
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    pdb = tmp_path / "a.pdb"
+    pdb.write_text("ATOM")
+    store.save("job1", message="MKV", outputs={'preprocess_task': Preprocess()._run("a", 1, ["MKVLAAGG"])})
+    store.save("job1", outputs={
+        'esmfold_task': str(FoldToolOutput(model_name="ESMFold", model_is_selected=True, success=True, output_file_path=str(pdb))),
+        'boltz_task': str(FoldToolOutput(model_name="Boltz", model_is_selected=True, success=True, output_file_path=str(tmp_path / "gone"))),
+    })
+    store.save("job2", message="GGS", outputs={'preprocess_task': "structure_name='b' num_chains=1 clean_sequences=['seq:0123456789abcdef']"})
+    store.save("job3", message="YYW", report="Final Report: ")
+    assert store.incomplete() == ["job1", "job2"]
+    assert sorted(verified_outputs(store.load("job1"))) == ['esmfold_task', 'preprocess_task']
+    assert verified_outputs(store.load("job2")) == {}
+
+
+def test_resume_runs_the_remaining_stages(stub_backends):
+    llm = ScriptedLLM()
+    pool = CrewPool(llm=llm)
+    report = kickoff(example_input2, ask_human=lambda proposal: "", assistant=pool.assistant)
+    store = get_checkpoint_store()
+    [job_id] = os.listdir(store.root)
+    job_id = job_id[:-len(".json")]
+    assert store.load(job_id)['report'] == report and llm.calls == 2
+
+    # the job died while Boltz was running: ESMFold is not run again
+    _died(store, job_id, ['boltz_task'])
+    assert store.incomplete() == [job_id]
+    requests = stub_backends.stats['requests']
+    resumed = resume(job_id, ask_human=lambda proposal: "", assistant=pool.assistant)
+    assert llm.calls == 3 and stub_backends.stats['requests'] == requests
+    assert "- ESMFold\n    - Selected: Yes\n    - Prediction successful: Yes" in resumed
+    assert "- Boltz\n    - Selected: Yes\n    - Prediction successful: Yes" in resumed
+    assert store.incomplete() == [] and resume(job_id) == resumed
+
+    # the ESMFold structure was deleted: it is predicted again
+    os.remove(parse_fold_output(store.load(job_id)['outputs']['esmfold_task']).output_file_path)
+    _died(store, job_id)
+    resume(job_id, ask_human=lambda proposal: "", assistant=pool.assistant)
+    assert llm.calls == 4 and stub_backends.stats['requests'] == requests + 1
+
+
+def test_resume_command_continues_after_a_failed_job(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    resumed = []
+
+    def _resume(job_id):
+        resumed.append(job_id)
+        if job_id == "job1":
+            raise RuntimeError("ESMFold is down")
+
+    monkeypatch.setattr("research_assistant.crew.resume", _resume)
+    monkeypatch.setattr(sys, "argv", ["resume", "job1", "job2"])
+    with pytest.raises(SystemExit, match="1 of 2 jobs failed to resume: job1"):
+        resume_command()
+    assert resumed == ["job1", "job2"]
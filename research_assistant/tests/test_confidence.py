@@ -0,0 +1,43 @@
+import numpy as np
+
+from research_assistant.tools.confidence import read_pdb_plddt, summarize_prediction, summarize_predictions, confidence_fields
+from research_assistant.tools.stub_structures import stub_pdb, stub_plddt, write_stub_boltz_prediction
+from research_assistant.tools.custom_tool import FoldToolOutput
+from research_assistant.tools.report import parse_fold_output
+
+
+def _line_by_line_plddt(pdb):
+    # the B-factor loop of the ESMFold notebook, one value per CA atom
+    return [float(line.split()[10]) for line in pdb.splitlines() if line.startswith("ATOM") and line.split()[2] == "CA"]
+
+
+def test_read_pdb_plddt():
+    sequences = ["MKVLAAGGSS", "WWYYHH"]
+    pdb = stub_pdb(sequences)
+    chains, plddt = read_pdb_plddt(pdb)
+    assert list(chains) == ["A"] * 10 + ["B"] * 6
+    assert np.allclose(plddt, _line_by_line_plddt(pdb))
+    # pLDDT written on the 0-1 scale is reported on the 0-100 scale
+    low_scale = "\n".join(line[:60] + f"{float(line[60:66]) / 100:6.2f}" + line[66:] if line.startswith("ATOM") else line for line in pdb.splitlines())
+    assert np.allclose(read_pdb_plddt(low_scale.encode())[1], plddt, atol=0.5)
+
+
+def test_summarize_predictions(tmp_path):
+    pdb_path = tmp_path / "protein1.pdb"
+    pdb_path.write_text(stub_pdb(["MKVLAAGGSS"]))
+    result_dir = tmp_path / "boltz_result"
+    write_stub_boltz_prediction(str(result_dir / "boltz_results_batch"), "complex1", ["MKVLAAGG", "GGSSWWYYHH"], output_format="mmcif")
+    write_stub_boltz_prediction(str(result_dir / "boltz_results_batch"), "complex2", ["MKVLAAGG"])
+
+    esmfold, boltz, missing = summarize_predictions([str(pdb_path), str(result_dir / "boltz_results_batch" / "predictions" / "complex1"), str(tmp_path / "nothing")])
+    assert missing is None
+    assert esmfold['n_residues'] == 10 and esmfold['ptm'] is None
+    assert np.isclose(esmfold['mean_plddt'], 100 * stub_plddt("MKVLAAGGSS").mean(), atol=0.01)
+    assert {chain: stats['n_residues'] for chain, stats in boltz['chains'].items()} == {"A": 8, "B": 10}
+    assert boltz['iptm'] is not None and 0 < boltz['mean_plddt'] <= 100
+    # the result_dir of a Boltz run holds many structures
+    assert summarize_prediction(str(result_dir), name="complex2")['n_residues'] == 8
+
+    result = FoldToolOutput(model_name="Boltz", model_is_selected=True, success=True, output_file_path=str(result_dir), **confidence_fields(boltz))
+    parsed = parse_fold_output(str(result))
+    assert parsed.mean_plddt == round(boltz['mean_plddt'], 1) and parsed.chain_plddt.startswith("A=")
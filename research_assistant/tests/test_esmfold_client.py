@@ -0,0 +1,78 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from research_assistant.tools.cache import DiskCache
+from research_assistant.tools.esmfold_client import predict_many_with_esmfold
+
+
+class StubESMFoldHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+    connections = set()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).requests_seen.append(body["sequence"])
+        type(self).connections.add(self.client_address)
+        time.sleep(0.05)
+        if body["sequence"] == "BAD":
+            payload = b"not json"
+        else:
+            payload = json.dumps({"pdbs": [f"REMARK {body['sequence']}\nEND\n"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve():
+    StubESMFoldHandler.requests_seen = []
+    StubESMFoldHandler.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubESMFoldHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/esmfold"
+
+
+def test_predict_many_reuses_connections(tmp_path):
+    server, url = _serve()
+    try:
+        sequences = [("seq%d" % i, "MKV" + "A" * i) for i in range(40)]
+        results = predict_many_with_esmfold(sequences, output_dir=str(tmp_path), query_url=url, max_concurrency=4)
+    finally:
+        server.shutdown()
+
+    assert len(results) == 40
+    assert all(r["success"] for r in results)
+    assert (tmp_path / "seq7.pdb").read_text().startswith("REMARK MKVAAAAAAA")
+    assert len(StubESMFoldHandler.connections) <= 4
+
+
+def test_predict_many_coalesces_duplicates_with_cache(tmp_path):
+    server, url = _serve()
+    cache = DiskCache(str(tmp_path / "cache"), suffix=".pdb")
+    try:
+        results = predict_many_with_esmfold(["MKV", "mkv", "MKV", "GGG"], output_dir=None, query_url=url, cache=cache)
+        again = predict_many_with_esmfold(["MKV"], output_dir=None, query_url=url, cache=cache)
+    finally:
+        server.shutdown()
+
+    assert all(r["success"] for r in results)
+    # one request per normalized sequence, sent with whichever spelling was scheduled first
+    assert sorted(seq.upper() for seq in StubESMFoldHandler.requests_seen) == ["GGG", "MKV"]
+    assert again[0]["cache_hit"]
+
+
+def test_predict_many_survives_a_failed_sequence(tmp_path):
+    server, url = _serve()
+    try:
+        results = predict_many_with_esmfold(["MKV", "BAD", "GGG"], output_dir=str(tmp_path), query_url=url)
+    finally:
+        server.shutdown()
+
+    results = {r["index"]: r for r in results}
+    assert results[0]["success"] and results[2]["success"]
+    assert not results[1]["success"] and "JSONDecodeError" in results[1]["error"]
@@ -0,0 +1,34 @@
+import yaml
+
+from research_assistant.tools.helpers import IndentDumper, chain_id, boltz_entities, render_boltz_yaml, write_sequences_to_yaml
+
+
+def test_chain_ids():
+    assert [chain_id(i) for i in (0, 25, 26, 27, 51, 52, 701, 702)] == ["A", "Z", "AA", "AB", "AZ", "BA", "ZZ", "AAA"]
+    assert len({chain_id(i) for i in range(1000)}) == 1000
+
+
+def test_identical_chains_are_one_entity():
+    entities = boltz_entities(["MKV", "GGS", "MKV", "MKV"], msa_paths=["a.csv", None, "a.csv", "a.csv"])
+    assert entities == [{'ids': ["A", "C", "D"], 'sequence': "MKV", 'msa': "a.csv"}, {'ids': ["B"], 'sequence': "GGS", 'msa': None}]
+
+
+def test_template_matches_yaml_dump(tmp_path):
+    sequences = ["MKVLA", "GGS", "MKVLA"] + [f"MK{'A' * i}" for i in range(400)] + ["NO", "Y"]
+    msa_paths = ["out/msa dir/a: b.csv", None, "out/msa dir/a: b.csv"] + [None] * 400 + ['q"uote.csv', "ünï.csv"]
+    entities = boltz_entities(sequences, msa_paths)
+    expected = {'version': 1, 'sequences': [
+        {'protein': {'id': e['ids'][0] if len(e['ids']) == 1 else e['ids'], 'sequence': e['sequence'], **({'msa': e['msa']} if e['msa'] else {})}}
+        for e in entities
+    ]}
+    rendered = render_boltz_yaml(entities)
+    # the IDs ON, NO, ... and the sequences NO and Y are read back as strings
+    assert yaml.safe_load(rendered) == expected
+    # byte for byte the document of yaml.dump, when there is nothing to quote
+    simple = boltz_entities(["MKVLA", "GGS"], msa_paths=["msa/a.csv", None])
+    assert render_boltz_yaml(simple) == yaml.dump({'version': 1, 'sequences': [
+        {'protein': {'id': "A", 'sequence': "MKVLA", 'msa': "msa/a.csv"}}, {'protein': {'id': "B", 'sequence': "GGS"}},
+    ]}, Dumper=IndentDumper, default_flow_style=False, sort_keys=False, indent=2)
+
+    write_sequences_to_yaml(sequences, str(tmp_path / "x.yaml"), msa_paths=msa_paths)
+    assert (tmp_path / "x.yaml").read_text() == rendered
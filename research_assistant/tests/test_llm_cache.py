@@ -0,0 +1,54 @@
+import pytest
+
+from research_assistant.tools import tracing
+from research_assistant.tools.cache import DiskCache
+from research_assistant.tools.llm_cache import CachedLLM
+from research_assistant.tools.tracing import Tracer
+from research_assistant.tools.stubs import ScriptedLLM
+
+
+@pytest.fixture(autouse=True)
+def tracer(monkeypatch):
+    tracer = Tracer(path="")
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    return tracer
+
+
+def test_cached_llm(tmp_path, tracer):
+    scripted = ScriptedLLM()
+    llm = CachedLLM(scripted, DiskCache(str(tmp_path / "llm")))
+    llm.stop = ["\nObservation:"]
+    messages = [{'role': "user", 'content': "selected_models=['ESMFold']"}]
+    first = llm.call(messages)
+    assert llm.call([dict(m) for m in messages]) == first
+    assert scripted.calls == 1 and scripted.stop == ["\nObservation:"]
+    # any change of the turn is a miss
+    llm.call(messages + [{'role': "assistant", 'content': "Thought:"}])
+    llm.stop = []
+    llm.call(messages)
+    assert scripted.calls == 3
+    assert llm.cache.stats()['hits'] == 1 and llm.cache.stats()['misses'] == 3
+    stages = tracer.stats()['stages']
+    assert stages['llm_cache.hit']['count'] == 1 and stages['llm_cache.miss']['count'] == 3
+
+    # entries expire
+    expired = CachedLLM(scripted, DiskCache(str(tmp_path / "llm"), max_age=0))
+    expired.stop = ["\nObservation:"]
+    expired.call(messages)
+    assert scripted.calls == 4
+
+
+def test_replayed_job_does_not_call_the_llm(tmp_path, monkeypatch, stub_backends):
+    from research_assistant.crew import kickoff
+    from research_assistant.server import CrewPool
+    from research_assistant.main import example_input2
+
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path / "llm"))
+    llm = ScriptedLLM()
+    reports = [kickoff(example_input2, ask_human=lambda proposal: "", assistant=CrewPool(llm=llm).assistant) for _ in range(2)]
+
+    assert "- Boltz\n    - Selected: Yes\n    - Prediction successful: Yes" in reports[1]
+    # the ESMFold and Boltz agents answered from the cache, and the tools ran again
+    assert llm.calls == 2
+    stages = tracing.get_tracer().stats()['stages']
+    assert stages['llm_cache.hit']['count'] == 2 and stages['tool.boltz']['count'] == 2
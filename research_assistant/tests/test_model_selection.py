@@ -0,0 +1,68 @@
+from research_assistant.tools.model_selection import select_models, apply_feedback, normalize_model_name, parse_num_chains, NO_SUITABLE_MODEL
+from research_assistant.tools.report import parse_fold_output, render_report
+from research_assistant.tools.custom_tool import FoldToolOutput, PreprocessOutput
+
+
+def test_rules():
+    assert select_models(1).selected_models == ["ESMFold", "Boltz"]
+    assert select_models(2).selected_models == ["Boltz"]
+    assert select_models(0).selected_models == [NO_SUITABLE_MODEL]
+    assert normalize_model_name("Boltz-1") == normalize_model_name("boltz 1") == "Boltz"
+    assert normalize_model_name("ESM fold") == "ESMFold"
+    assert normalize_model_name("AlphaFold") is None
+    assert parse_num_chains(str(PreprocessOutput(num_chains=3, clean_sequences=["A", "B", "C"]))) == 3
+
+
+def test_feedback():
+    proposal = select_models(1)
+    assert apply_feedback(proposal, 1, "") is proposal
+    assert apply_feedback(proposal, 1, "Looks good!") is proposal
+    assert apply_feedback(proposal, 1, "please use only Boltz-1").selected_models == ["Boltz"]
+    assert apply_feedback(proposal, 1, "skip boltz").selected_models == ["ESMFold"]
+    # ESMFold is declined for complexes, whatever the feedback
+    assert apply_feedback(select_models(2), 2, "use ESMFold and Boltz").selected_models == ["Boltz"]
+    assert apply_feedback(select_models(2), 2, "only esmfold").selected_models == [NO_SUITABLE_MODEL]
+    # free text goes to the model selection agent
+    assert apply_feedback(proposal, 1, "use whichever is faster") is None
+    assert apply_feedback(proposal, 1, "no ESMFold, use Boltz") is None
+
+
+def test_feedback_substitution_and_addition():
+    proposal = select_models(1)
+    assert apply_feedback(proposal, 1, "use Boltz instead of ESMFold").selected_models == ["Boltz"]
+    assert apply_feedback(proposal, 1, "ESMFold instead of Boltz-1").selected_models == ["ESMFold"]
+    only_boltz = apply_feedback(proposal, 1, "only Boltz")
+    assert apply_feedback(only_boltz, 1, "ESMFold too").selected_models == ["ESMFold", "Boltz"]
+    assert apply_feedback(only_boltz, 1, "please also run ESMFold as well").selected_models == ["ESMFold", "Boltz"]
+    assert apply_feedback(only_boltz, 1, "add esmfold").selected_models == ["ESMFold", "Boltz"]
+    # the rules still apply to the added models
+    assert apply_feedback(select_models(2), 2, "ESMFold too").selected_models == ["Boltz"]
+    # feedback the rules cannot read goes to the model selection agent
+    assert apply_feedback(proposal, 1, "use Boltz instead") is None
+    assert apply_feedback(proposal, 1, "Boltz instead of whichever is slower") is None
+    assert apply_feedback(proposal, 1, "add only Boltz") is None
+
+
+def test_report():
+    esmfold = str(FoldToolOutput(model_name="ESMFold", model_is_selected=True, success=True, output_file_path="out/x.pdb"))
+    boltz = str(FoldToolOutput(model_name="Boltz", model_is_selected=False))
+    assert parse_fold_output(esmfold).output_file_path == "out/x.pdb"
+    assert parse_fold_output("I did not call the tool") is None
+    report = render_report([esmfold, boltz, "I did not call the tool"])
+    assert report.splitlines() == [
+        "Final Report: ",
+        "- ESMFold",
+        "    - Selected: Yes",
+        "    - Prediction successful: Yes",
+        "    - Results: out/x.pdb",
+        "- Boltz",
+        "    - Selected: No",
+        "- I did not call the tool",
+    ]
+    # models with a confidence summary are ranked by mean pLDDT
+    esmfold = str(FoldToolOutput(model_name="ESMFold", model_is_selected=True, success=True, output_file_path="out/x.pdb", mean_plddt=71.5, confident_fraction=0.6, chain_plddt="A=71.5"))
+    boltz = str(FoldToolOutput(model_name="Boltz", model_is_selected=True, success=True, output_file_path="out/boltz", mean_plddt=84.25, confident_fraction=0.9, chain_plddt="A=84.2", ptm=0.81))
+    report = render_report([esmfold, boltz]).splitlines()
+    assert "    - Mean pLDDT: 71.5, 60% of residues >= 70" in report
+    assert "    - pTM: 0.81" in report
+    assert report[-1] == "- Ranking by mean pLDDT: Boltz (84.2) > ESMFold (71.5)"
@@ -0,0 +1,95 @@
+import os
+
+from research_assistant.tools import boltz_batch
+from research_assistant.tools.boltz_batch import predict_with_boltz_batch, boltz_output_dir
+from research_assistant.tools.msa_store import MSAStore, prepare_msas, harvest_msas
+
+FAKE_BOLTZ = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fake_boltz.py")
+HEAVY, LIGHT, OTHER = "MKVLAAGGSSWW", "GGSSWWYYKKLL", "YYWWPPGGKKAA"
+
+
+def _write_msa(path, sequence):
+    # Boltz csv MSA: the pairing key and the aligned sequence of each row
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"key,sequence\n0,{sequence}\n1,{sequence[::-1]}\n")
+    return str(path)
+
+
+def test_identical_chains_are_looked_up_once(tmp_path):
+    store = MSAStore(str(tmp_path / "msa"))
+    paths, misses = prepare_msas(store, [HEAVY, HEAVY, LIGHT])
+    assert paths == [None, None, None] and misses == [HEAVY, LIGHT]
+
+
+def test_harvested_msas_are_reused(tmp_path):
+    store = MSAStore(str(tmp_path / "msa"))
+    output_dir = tmp_path / "out" / "boltz_results_dimer"
+    # Boltz numbers the entities of a structure in order of first appearance
+    _write_msa(output_dir / "msa" / "dimer_0.csv", HEAVY)
+    _write_msa(output_dir / "msa" / "dimer_1.csv", LIGHT)
+    assert harvest_msas(store, str(output_dir), "dimer", [HEAVY, HEAVY, LIGHT], [HEAVY, LIGHT]) == 2
+    # the pairing keys only hold within the complex they were computed for
+    with open(store.lookup(HEAVY)) as f:
+        assert all(row.startswith("-1,") for row in f.read().splitlines()[1:])
+    paths, misses = prepare_msas(store, [LIGHT, HEAVY, HEAVY])
+    assert misses == [] and paths[1] == paths[2] == store.lookup(HEAVY)
+    assert store.report()['entries'] == 2
+
+
+def test_msa_server_is_only_used_for_missing_chains(tmp_path, monkeypatch):
+    calls = []
+    def run_boltz(input_path, result_dir, use_msa_server=True, **kwargs):
+        calls.append(use_msa_server)
+        return {'returncode': 0, 'stdout': "", 'stderr': ""}
+    monkeypatch.setattr(boltz_batch, "run_boltz", run_boltz)
+    store = MSAStore(str(tmp_path / "msa"))
+    store.add(HEAVY, _write_msa(tmp_path / "heavy.csv", HEAVY))
+    for name, sequences in [("homodimer", [HEAVY, HEAVY]), ("dimer", [HEAVY, LIGHT])]:
+        predict_with_boltz_batch({name: sequences}, yaml_dir=str(tmp_path / "input" / name), result_dir=str(tmp_path / "out" / name), msa_store=store)
+    assert calls == [False, True]
+    # the stored MSA is passed to Boltz, only the new chain is sent to the MSA server
+    assert store.lookup(HEAVY) in (tmp_path / "input" / "dimer" / "dimer.yaml").read_text()
+
+
+def _predict(tmp_path, store, name, sequences, use_msa_server=True):
+    yaml_dir = str(tmp_path / "input" / name)
+    result_dir = str(tmp_path / "out" / name)
+    results = predict_with_boltz_batch({name: sequences}, yaml_dir=yaml_dir, result_dir=result_dir, use_msa_server=use_msa_server,
+                                       backend="subprocess", executable=FAKE_BOLTZ, msa_store=store)
+    assert results[name]['success']
+    # the stub runner only writes MSAs when it is asked to use the MSA server
+    return os.path.isdir(os.path.join(boltz_output_dir(result_dir, yaml_dir), "msa"))
+
+
+def test_identical_chains_share_one_msa(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+    store = MSAStore(str(tmp_path / "msa"))
+    # both copies of the homodimer are one entity: its MSA is fetched and stored once
+    assert _predict(tmp_path, store, "homodimer", [HEAVY, HEAVY])
+    assert store.report()['entries'] == 1
+    paths, misses = prepare_msas(store, [HEAVY, HEAVY])
+    assert paths[0] is not None and paths[0] == paths[1] and misses == []
+
+
+def test_stored_msas_are_reused(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+    store = MSAStore(str(tmp_path / "msa"))
+    assert _predict(tmp_path, store, "monomer", [HEAVY])
+    # only the new chain is sent to the MSA server, the stored MSA is passed to Boltz
+    assert _predict(tmp_path, store, "dimer", [HEAVY, LIGHT])
+    with open(tmp_path / "input" / "dimer" / "dimer.yaml") as f:
+        assert store.lookup(HEAVY) in f.read()
+    assert store.report()['entries'] == 2 and store.report()['hits'] >= 1
+    # every MSA is in the store: the MSA server is not used at all
+    assert not _predict(tmp_path, store, "again", [LIGHT, HEAVY])
+
+
+def test_msa_server_stays_off_when_disabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0")
+    store = MSAStore(str(tmp_path / "msa"))
+    # the chain is not in the store, but the caller turned the MSA server off
+    assert not _predict(tmp_path, store, "monomer", [OTHER], use_msa_server=False)
+    assert store.lookup(OTHER) is None
@@ -0,0 +1,43 @@
+import time
+from types import SimpleNamespace
+
+from research_assistant.tools.rate_limit import RequestScheduler, RetryBudget, TokenBucket, parse_retry_after
+
+
+def _response(status_code, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return SimpleNamespace(status_code=status_code, headers=headers)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[0] == 0 and waits[1] == 0
+    assert 0.05 < waits[2] < waits[3] <= 0.2
+
+
+def test_retries_throttled_requests_honoring_retry_after():
+    responses = iter([_response(429, "0.05"), _response(503), _response(200)])
+    scheduler = RequestScheduler(backoff_base=0.01)
+    start = time.monotonic()
+    response = scheduler.call(lambda: next(responses))
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.05
+    metrics = scheduler.metrics()
+    assert metrics["retries"] == 2
+    assert metrics["throttled"] == 1
+    assert metrics["server_errors"] == 1
+
+
+def test_retry_budget_limits_retries():
+    scheduler = RequestScheduler(backoff_base=0, retry_budget=RetryBudget(ratio=0, min_tokens=1))
+    response = scheduler.call(lambda: _response(500))
+    assert response.status_code == 500
+    assert scheduler.metrics()["retries"] == 1
+    assert scheduler.metrics()["retry_budget_exhausted"] == 1
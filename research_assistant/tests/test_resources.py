@@ -0,0 +1,83 @@
+import threading, time
+
+from research_assistant.tools.boltz_tool import BoltzTool
+from research_assistant.tools.report import parse_fold_output, render_report
+from research_assistant.tools.resources import ResourceEstimator, FoldScheduler, MemoryBudget
+from research_assistant.tools.results_store import ResultsStore
+
+
+def test_estimates_are_calibrated_on_the_notebook_examples():
+    estimator = ResourceEstimator()
+    adalimumab = estimator.estimate("Boltz", ["A" * 119, "A" * 109])
+    large = estimator.estimate("Boltz", ["A" * 220, "A" * 214, "A" * 220, "A" * 214])
+    assert 24 < adalimumab.memory_gb <= 48 and large.memory_gb > 48
+    assert 60 < estimator.estimate("Boltz", ["A" * 353]).seconds < 180
+    assert estimator.estimate("ESMFold", "A" * 400).seconds < adalimumab.seconds
+
+
+def test_estimates_are_refined_with_the_history(tmp_path):
+    estimator = ResourceEstimator(min_samples=3)
+    prior = estimator.estimate("Boltz", ["A" * 300])
+    store = ResultsStore(str(tmp_path / "results.db"))
+    # the GPU is twice as fast and the runs use 80% of the prior memory
+    for n in (100, 200, 300, 400):
+        memory, seconds = estimator.prior("Boltz", n, 1)
+        store.record(["A" * n], "Boltz", runtime=seconds / 2, peak_memory_gb=0.8 * memory)
+    store.record(["A" * 500], "Boltz", success=False, runtime=1.0)
+    assert estimator.load_history(store) == 4
+    refined = estimator.estimate("Boltz", ["A" * 300])
+    assert abs(refined.seconds - prior.seconds / 2) < 1e-6 and abs(refined.memory_gb - 0.8 * prior.memory_gb) < 1e-6
+    assert estimator.calibration()['Boltz']['samples'] == 4
+
+
+def test_admission():
+    scheduler = FoldScheduler(memory_gb=24)
+    assert scheduler.admit("Boltz", ["A" * 100])[0] == "run"
+    decision, estimate, reason = scheduler.admit("Boltz", ["A" * 353], alternatives=["ESMFold"])
+    assert decision == "reroute" and estimate.model == "ESMFold" and "24.0 GB" in reason
+    # ESMFold only folds single chains
+    assert scheduler.admit("Boltz", ["A" * 119, "A" * 109], alternatives=["ESMFold"])[0] == "reject"
+    # unknown GPU memory: nothing is rejected
+    assert FoldScheduler().admit("Boltz", ["A" * 5000])[0] == "run"
+    assert scheduler.stats == {'admitted': 1, 'rerouted': 1, 'rejected': 1}
+
+
+def test_plan_orders_longest_first():
+    jobs = {f"p{n}": ["A" * n] for n in (50, 400, 120, 300, 80)}
+    batches = FoldScheduler().plan(jobs, batch_size=2)
+    assert [list(batch) for batch, _ in batches] == [["p400", "p300"], ["p120", "p80"], ["p50"]]
+    assert batches[0][1].memory_gb == FoldScheduler().estimator.estimate("Boltz", ["A" * 400]).memory_gb
+    assert [estimate.seconds for _, estimate in batches] == sorted([estimate.seconds for _, estimate in batches], reverse=True)
+
+
+def test_memory_budget():
+    budget = MemoryBudget(48)
+    running, peak = [0.0], [0.0]
+    lock = threading.Lock()
+
+    def _job(gb):
+        with budget.reserve(gb):
+            with lock:
+                running[0] += gb
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= gb
+
+    threads = [threading.Thread(target=_job, args=(gb,)) for gb in (30, 30, 10, 20, 40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0 < peak[0] <= 48 and budget.in_use_gb == 0
+
+
+def test_boltz_tool_rejects_structures_too_large_for_the_gpu(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DB", "")
+    monkeypatch.setenv("BOLTZ_GPU_MEMORY_GB", "24")
+    monkeypatch.setenv("BOLTZ_EXECUTABLE", str(tmp_path / "missing-boltz"))
+    monkeypatch.chdir(tmp_path)
+    raw = BoltzTool()._run(selected_models=["Boltz"], structure_name="adalimumab", sequences=["A" * 119, "A" * 109])
+    result = parse_fold_output(raw)
+    assert result.model_is_selected and not result.success and "GB of GPU memory" in result.error
+    assert "- Reason: Boltz needs an estimated" in render_report([raw])
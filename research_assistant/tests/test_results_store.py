@@ -0,0 +1,48 @@
+import csv, json
+
+from research_assistant.tools.results_store import ResultsStore, sequence_hash, record_prediction
+
+
+def test_results_store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.record(["MKVLA"], "ESMFold", path="a.pdb", runtime=1.5, confidence={'mean_plddt': 71.0, 'chain_plddt': "A=71.0"}, parameters={'query_url': None})
+    store.record(["MKVLA", "GGSS"], "Boltz", path="b", confidence={'mean_plddt': 85.0, 'ptm': 0.8}, parameters={'backend': "worker"})
+    store.record(["mkv la"], "Boltz", path="c", success=False)
+    store.record_many({'sequences': [f"MKV{'A' * i}"], 'model': "ESMFold", 'confidence': {'mean_plddt': float(i)}} for i in range(100))
+
+    assert sequence_hash(["mkv la"]) == sequence_hash("MKVLA") != sequence_hash(["MKVLA", "GGSS"])
+    assert store.lookup("MKVLA", model="ESMFold")['path'] == "a.pdb"
+    # failed predictions don't count
+    assert not store.is_folded(["MKVLA"], model="Boltz")
+    assert store.is_folded(["MKVLA", "GGSS"], model="Boltz", parameters={'backend': "worker"})
+    assert not store.is_folded(["MKVLA", "GGSS"], model="Boltz", parameters={'backend': "subprocess"})
+    assert [row['path'] for row in store.top(2, model="Boltz")] == ["b"]
+    assert [row['mean_plddt'] for row in store.top(3)] == [99.0, 98.0, 97.0]
+    assert store.count() == 103 and store.count("Boltz") == 2
+
+    assert store.export(str(tmp_path / "all.jsonl")) == 103
+    rows = [json.loads(line) for line in (tmp_path / "all.jsonl").read_text().splitlines()]
+    assert rows[0]['chain_plddt'] == "A=71.0" and rows[1]['chains'] == 2 and rows[1]['residues'] == 9
+    assert store.export(str(tmp_path / "boltz.csv"), model="Boltz") == 2
+    with open(tmp_path / "boltz.csv") as f:
+        assert [row['path'] for row in csv.DictReader(f)] == ["b", "c"]
+
+
+def test_queries_use_the_indexes(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    plans = {
+        "lookup": "SELECT * FROM predictions WHERE sequence_hash = ? AND success = 1 AND model = ? ORDER BY id DESC LIMIT 1",
+        "top": "SELECT * FROM predictions WHERE success = 1 AND mean_plddt IS NOT NULL ORDER BY mean_plddt DESC LIMIT 10",
+        "top of a model": "SELECT * FROM predictions WHERE success = 1 AND mean_plddt IS NOT NULL AND model = ? ORDER BY mean_plddt DESC LIMIT 10",
+        "history": "SELECT residues, chains, runtime_seconds, peak_memory_gb FROM predictions WHERE model = ? AND success = 1 AND runtime_seconds IS NOT NULL ORDER BY id DESC LIMIT 10",
+    }
+    for name, query in plans.items():
+        plan = " ".join(row[-1] for row in store._db.execute(f"EXPLAIN QUERY PLAN {query}", ["x"] * query.count("?")).fetchall())
+        assert "USING INDEX" in plan and "TEMP B-TREE" not in plan, (name, plan)
+
+
+def test_record_prediction_logs_errors(tmp_path, monkeypatch):
+    # the database path is a directory: the store cannot be opened
+    (tmp_path / "results.db").mkdir()
+    monkeypatch.setenv("RESULTS_DB", str(tmp_path / "results.db"))
+    assert record_prediction(["MKVLA"], "ESMFold", {'success': True, 'output_file_path': "a.pdb"}) is None
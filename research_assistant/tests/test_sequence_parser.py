@@ -0,0 +1,53 @@
+from research_assistant.tools.sequence_parser import parse_sequence_input, fast_path_stats
+
+HEAVY = "VQLVQSGVEVKKPGASVKVSCKASGYTFTNYYMYWVRQAPGQGLEWMGGINPSNGGTNFNEKFKNRVTLTTDSSTTTAYMELKSLQFDDTAVYYCARRDYRFDMGFDYWGQGTTVTVSS"
+LIGHT = "EIVLTQSPATLSLSPGERATLSCRASKGVSTSGYSYLHWYQQKPGQAPRLLIYLASYLESGVPARFSGSGSGTDFTLTISSLEPEDFAVYYCQHSRDLPLTFGGGTKVEIK"
+
+
+def test_multi_fasta():
+    parsed = parse_sequence_input(f"Predict the structure of the following antibody:\n>mAB1001 light chain\n{LIGHT}\n>mAB1001 heavy chain\n{HEAVY}\n")
+    assert parsed == {'structure_name': "mAB1001", 'num_chains': 2, 'sequences': [LIGHT, HEAVY]}
+
+
+def test_wrapped_fasta_without_shared_name():
+    wrapped = "\n".join(HEAVY[i:i + 60] for i in range(0, len(HEAVY), 60))
+    parsed = parse_sequence_input(f">heavy\n{wrapped}\n>light\n{LIGHT.lower()}\n")
+    assert parsed['structure_name'] == "structure1"
+    assert parsed['sequences'] == [HEAVY, LIGHT]
+
+
+def test_copy_numbers():
+    parsed = parse_sequence_input(f"Fold a complex with a single sequence of {LIGHT} and 2 copies of {HEAVY}")
+    assert parsed['sequences'] == [LIGHT, HEAVY, HEAVY]
+    parsed = parse_sequence_input(f"a homodimer of {HEAVY}")
+    assert parsed['num_chains'] == 2
+
+
+def test_ambiguous_inputs_fall_back_to_the_agent():
+    before = fast_path_stats()["agent"]
+    assert parse_sequence_input("Fold the Keytruda antibody") is None
+    assert parse_sequence_input(f"Fold {HEAVY} with the E6K mutation") is None
+    assert parse_sequence_input(f"Fold {HEAVY} and its copies") is None
+    # two unwrapped lines of different lengths: one sequence or two chains?
+    assert parse_sequence_input(f"{HEAVY[:60]}\n{LIGHT[:70]}") is None
+    assert fast_path_stats()["agent"] == before + 4
+
+
+def test_wrapped_sequence():
+    wrapped = "\n".join(HEAVY[i:i + 40] for i in range(0, len(HEAVY), 40))
+    assert parse_sequence_input(f"Fold this protein:\n{wrapped}\n")['sequences'] == [HEAVY]
+
+
+def test_chains_on_separate_lines_fall_back_to_the_agent():
+    # one wrapped sequence or separate chains: only 3+ lines of one width and a shorter last line are wrapped
+    assert parse_sequence_input(f"Fold this complex:\n{HEAVY}\n{LIGHT}") is None
+    assert parse_sequence_input(f"{HEAVY[:100]}\n{LIGHT[:100]}") is None
+    assert parse_sequence_input(f"{HEAVY}\n{HEAVY}") is None
+    assert parse_sequence_input(f"{HEAVY[:50]}\n{LIGHT[:50]}\n{HEAVY[:50]}") is None
+
+
+def test_heterodimers_and_negations_fall_back_to_the_agent():
+    assert parse_sequence_input(f"Fold a dimer of {HEAVY} and {LIGHT}") is None
+    assert parse_sequence_input(f"Fold a heterodimer of {HEAVY} and {LIGHT}") is None
+    assert parse_sequence_input(f"Fold {HEAVY} and not {LIGHT}") is None
+    assert parse_sequence_input(f"Fold {HEAVY}, don't fold {LIGHT}") is None
@@ -0,0 +1,36 @@
+import pytest
+
+from research_assistant.tools.custom_tool import Preprocess
+from research_assistant.tools.boltz_tool import BoltzTool
+from research_assistant.tools.sequence_store import SequenceStore, is_handle, resolve_sequences
+from research_assistant.tools.report import parse_fold_output
+
+
+def test_handles_resolve_to_the_sequences(tmp_path, monkeypatch):
+    store = SequenceStore(str(tmp_path / "sequences"))
+    handle = store.put("mkv la\nGG")
+    assert is_handle(handle) and len(handle) == 20 and handle == store.put("MKVLAGG")
+    assert store.resolve([handle, "ggs w", handle]) == ["MKVLAGG", "GGSW", "MKVLAGG"]
+    # another process reads the same directory
+    assert SequenceStore(str(tmp_path / "sequences")).get(handle) == "MKVLAGG"
+    with pytest.raises(ValueError, match="Unknown sequence handle"):
+        store.get("seq:0000000000000000")
+    monkeypatch.setenv("SEQUENCE_STORE_DIR", "")
+    assert resolve_sequences(["mkv"]) == ["MKV"]
+    with pytest.raises(ValueError, match="disabled"):
+        resolve_sequences([handle])
+
+
+def test_preprocess_passes_handles(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEQUENCE_STORE_DIR", str(tmp_path / "sequences"))
+    monkeypatch.setenv("RESULTS_DB", "")
+    monkeypatch.chdir(tmp_path)
+    sequence = "MKWVTFISLLLLFSSAYS" * 30
+    output = Preprocess()._run(structure_name="bsa", num_chains=2, sequences=[sequence, sequence])
+    assert sequence not in output and output.count("seq:") == 2 and len(output) < 200
+    assert resolve_sequences([output.split("'")[-2]]) == [sequence]
+
+    # a mistyped handle fails the prediction instead of folding another sequence
+    raw = BoltzTool()._run(selected_models=["Boltz"], structure_name="bsa", sequences=["seq:0123456789abcdef"])
+    result = parse_fold_output(raw)
+    assert result.model_is_selected and not result.success and "Unknown sequence handle" in result.error
@@ -0,0 +1,44 @@
+import pytest
+
+from research_assistant.server import CrewPool, JobServer, JobRejected
+from research_assistant.tools.stubs import ScriptedLLM
+from research_assistant.main import example_input2
+
+
+def test_round_robin_and_admission_control(offline_env):
+    # no workers: jobs stay queued
+    server = JobServer(workers=0, max_queued=5, max_queued_per_tenant=3, warm=0)
+    for i in range(3):
+        server.submit("a", f"a{i}")
+    with pytest.raises(JobRejected):
+        server.submit("a", "a3")
+    server.submit("b", "b0")
+    server.submit("c", "c0")
+    with pytest.raises(JobRejected):
+        server.submit("d", "d0")
+    assert server.metrics()['queued_per_tenant'] == {'a': 3, 'b': 1, 'c': 1}
+    assert server.metrics()['rejected'] == 2
+
+    order = [server._next_job().message for _ in range(5)]
+    assert order == ["a0", "b0", "c0", "a1", "a2"]
+
+
+def test_job_server_stub_mode(stub_backends):
+    llm = ScriptedLLM()
+    server = JobServer(workers=2, pool=CrewPool(llm=llm), warm=0)
+    try:
+        job_ids = [server.submit(tenant, example_input2) for tenant in ("a", "b")]
+        reports = [server.result(job_id, timeout=120) for job_id in job_ids]
+    finally:
+        server.shutdown()
+
+    for report in reports:
+        assert "- ESMFold\n    - Selected: Yes\n    - Prediction successful: Yes" in report
+        assert "- Boltz\n    - Selected: Yes\n    - Prediction successful: Yes" in report
+    assert server.status(job_ids[0])['state'] == "done"
+    assert server.metrics()['completed'] == 2
+    # the input is parsed locally: the agents only call the ESMFold and Boltz tools
+    assert llm.calls == 4
+    # the MSAs the stub Boltz worker fetched are in the MSA store
+    from research_assistant.tools.msa_store import get_msa_store
+    assert get_msa_store().report()['entries'] == 1
@@ -0,0 +1,65 @@
+import os, gzip, json
+import numpy as np
+import pytest
+
+from research_assistant.tools.structure_io import PDBStreamDecoder, structure_writer, open_structure, CoordinateFile
+from research_assistant.tools.stub_structures import stub_pdb
+from research_assistant.tools.stubs import start_stub_esmfold_server
+from research_assistant.tools.esmfold_tool import ESMFoldPlayground
+from research_assistant.tools.confidence import read_pdb_plddt
+from research_assistant.tools.cache import DiskCache
+
+
+def test_decoder_at_every_split():
+    pdb = stub_pdb(["MKVLA"]).replace("END", 'END "quoted" \\ backé')
+    body = json.dumps({"pdbs": [pdb], "other": "x"}, ensure_ascii=True).encode()
+    for split in range(len(body)):
+        decoder = PDBStreamDecoder()
+        text = "".join(decoder.feed(body[:split]) + decoder.feed(body[split:]))
+        decoder.close()
+        assert text == pdb
+    # byte by byte
+    decoder = PDBStreamDecoder()
+    assert "".join(piece for i in range(len(body)) for piece in decoder.feed(body[i:i + 1])) == pdb
+    with pytest.raises(ValueError):
+        truncated = PDBStreamDecoder()
+        truncated.feed(body[:len(body) // 2])
+        truncated.close()
+
+
+@pytest.mark.parametrize("suffix", [".pdb", ".pdb.gz", ".coords.npy"])
+def test_structure_formats(tmp_path, suffix):
+    sequences = ["MKVLAAGGSS", "WWYYHH"]
+    pdb = stub_pdb(sequences)
+    path = str(tmp_path / f"protein1{suffix}")
+    with structure_writer(path) as f:
+        for start in range(0, len(pdb), 100):
+            f.write(pdb[start:start + 100])
+    assert os.listdir(tmp_path) == [f"protein1{suffix}"]
+    chains, plddt = read_pdb_plddt(path)
+    expected_chains, expected_plddt = read_pdb_plddt(pdb)
+    assert list(chains) == list(expected_chains) and np.allclose(plddt, expected_plddt, atol=0.01)
+    if suffix == ".coords.npy":
+        structure = CoordinateFile(path)
+        assert isinstance(structure.atoms, np.memmap) and structure.coords.shape == (16, 3)
+        assert np.allclose(read_pdb_plddt(structure.to_pdb())[1], plddt, atol=0.01)
+    else:
+        with open_structure(path) as f:
+            assert f.read() == pdb
+
+
+def test_predict_to_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRACE_FILE", "")
+    server, url = start_stub_esmfold_server()
+    cache = DiskCache(str(tmp_path / "cache"), suffix=".pdb")
+    try:
+        playground = ESMFoldPlayground(NGC_API_KEY="x", query_url=url, cache=cache)
+        first = playground.predict_to_file("MKVLAAGG", str(tmp_path / "out" / "protein1.pdb.gz"))
+        second = playground.predict_to_file("MKVLAAGG", str(tmp_path / "out" / "protein2.pdb"))
+        uncached = ESMFoldPlayground(NGC_API_KEY="x", query_url=url).predict_to_file("MKVLAAGG", str(tmp_path / "out" / "protein3.pdb"))
+    finally:
+        server.shutdown()
+    assert first['status_code'] == 200 and not first['from_cache'] and second['from_cache']
+    assert server.stats['requests'] == 2
+    with gzip.open(first['output_file_path'], "rt") as f:
+        assert f.read() == open(second['output_file_path']).read() == open(uncached['output_file_path']).read() == stub_pdb(["MKVLAAGG"])
@@ -0,0 +1,60 @@
+import os, json
+import numpy as np
+import requests
+
+from research_assistant.tools.helpers import write_sequences_to_yaml
+from research_assistant.tools.boltz_worker import StubBoltzRunner
+from research_assistant.tools.boltz_batch import boltz_output_dir, collect_boltz_predictions
+from research_assistant.tools.msa_store import MSAStore, harvest_msas
+from research_assistant.tools.stubs import start_stub_esmfold_server
+
+
+def test_stub_esmfold_server():
+    server, url = start_stub_esmfold_server()
+    throttling, throttling_url = start_stub_esmfold_server(error_rate=1.0)
+    try:
+        response = requests.post(url, json={'sequence': "MKVLA"})
+        throttled = requests.post(throttling_url, json={'sequence': "MKVLA"})
+    finally:
+        server.shutdown()
+        throttling.shutdown()
+    atoms = [line for line in response.json()['pdbs'][0].splitlines() if line.startswith("ATOM")]
+    assert [line[17:20] for line in atoms] == ["MET", "LYS", "VAL", "LEU", "ALA"]
+    assert all(0 <= float(line[60:66]) <= 100 for line in atoms)
+    assert throttled.status_code == 429 and throttled.headers["Retry-After"] == "0.1"
+    assert throttling.stats['errors'] == 1
+
+
+def test_stub_boltz_output_tree(tmp_path):
+    sequences = ["MKVLAAGG", "GGSSWWYY"]
+    input_path = str(tmp_path / "complex1.yaml")
+    write_sequences_to_yaml(sequences, input_path)
+    result_dir = str(tmp_path / "out")
+    output = StubBoltzRunner(load_seconds=0, predict_seconds=0).predict(input_path, result_dir)
+    assert output['returncode'] == 0
+    assert collect_boltz_predictions(result_dir, input_path, ["complex1"])["complex1"]['success']
+
+    structure_dir = os.path.join(boltz_output_dir(result_dir, input_path), "predictions", "complex1")
+    with open(os.path.join(structure_dir, "confidence_complex1_model_0.json")) as f:
+        confidence = json.load(f)
+    assert set(confidence['chains_ptm']) == {"0", "1"} and 0 < confidence['complex_plddt'] < 1
+    assert len(np.load(os.path.join(structure_dir, "plddt_complex1_model_0.npz"))['plddt']) == 16
+    # the MSAs can be harvested like the ones of the MSA server
+    store = MSAStore(str(tmp_path / "msa"))
+    assert harvest_msas(store, boltz_output_dir(result_dir, input_path), "complex1", sequences, sequences) == 2
+
+
+def test_stub_boltz_homomer(tmp_path):
+    # the copies of a homomer are one entity with a list of chain IDs
+    sequences = ["MKVLAAGG", "GGSSWWYY", "MKVLAAGG"]
+    input_path = str(tmp_path / "trimer.yaml")
+    write_sequences_to_yaml(sequences, input_path)
+    result_dir = str(tmp_path / "out")
+    StubBoltzRunner(load_seconds=0, predict_seconds=0).predict(input_path, result_dir)
+    structure_dir = os.path.join(boltz_output_dir(result_dir, input_path), "predictions", "trimer")
+    with open(os.path.join(structure_dir, "trimer_model_0.pdb")) as f:
+        chains = list(dict.fromkeys(line[21] for line in f if line.startswith("ATOM")))
+    assert chains == ["A", "C", "B"]
+    store = MSAStore(str(tmp_path / "msa"))
+    assert harvest_msas(store, boltz_output_dir(result_dir, input_path), "trimer", sequences, sequences) == 2
+    assert store.lookup("GGSSWWYY") is not None
@@ -0,0 +1,54 @@
+import json
+import pytest
+
+from research_assistant.tools import tracing
+from research_assistant.tools.tracing import Tracer
+
+
+def test_spans(tmp_path):
+    tracer = Tracer(path=str(tmp_path / "traces.jsonl"))
+    with tracer.span("job", trace_id="job1"):
+        with tracer.span("esmfold.http", url="http://x") as span:
+            span['status_code'] = 200
+        tracer.record("boltz.worker_inference", 1.5)
+    with pytest.raises(ValueError):
+        with tracer.span("boltz.run", trace_id="job2"):
+            raise ValueError("boom")
+
+    spans = {s['name']: s for s in map(json.loads, (tmp_path / "traces.jsonl").read_text().splitlines())}
+    assert spans['esmfold.http']['trace_id'] == spans['boltz.worker_inference']['trace_id'] == "job1"
+    assert spans['esmfold.http']['parent_id'] == spans['boltz.worker_inference']['parent_id'] == spans['job']['span_id']
+    assert spans['esmfold.http']['attributes'] == {'url': "http://x", 'status_code': 200}
+    assert spans['boltz.run']['parent_id'] is None and spans['boltz.run']['error'] == "ValueError: boom"
+
+    stats = tracer.stats()['stages']
+    assert stats['boltz.worker_inference']['p50'] == stats['boltz.worker_inference']['p95'] == 1.5
+    assert stats['boltz.run']['errors'] == 1
+
+    tracer.add_tokens("esmfold_agent", prompt_tokens=10, completion_tokens=2, requests=1)
+    text = tracer.prometheus()
+    assert 'research_assistant_stage_seconds{stage="boltz.worker_inference",quantile="0.95"} 1.5' in text
+    assert 'research_assistant_agent_tokens_total{agent="esmfold_agent",kind="prompt"} 10' in text
+
+
+def test_job_trace(tmp_path, monkeypatch, stub_backends):
+    from research_assistant.crew import kickoff
+    from research_assistant.server import CrewPool
+    from research_assistant.tools.stubs import ScriptedLLM
+    from research_assistant.main import example_input2
+
+    tracer = Tracer(path=str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    kickoff(example_input2, ask_human=lambda proposal: "", assistant=CrewPool(llm=ScriptedLLM()).assistant)
+
+    spans = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    # one trace for the whole job, including the async task of a separate thread
+    assert len({s['trace_id'] for s in spans}) == 1
+    stages = tracer.stats()['stages']
+    for stage in ("job", "tool.preprocess", "model_selection", "crew.kickoff", "task.esmfold_task", "task.boltz_task",
+                  "llm.esmfold_agent", "llm.boltz_agent", "tool.esmfold", "esmfold.predict", "esmfold.http",
+                  "tool.boltz", "boltz.predict", "boltz.run", "boltz.worker_inference"):
+        assert stages[stage]['count'] >= 1, stage
+    tokens = tracer.stats()['tokens']
+    assert tokens['esmfold_agent']['requests'] == tokens['boltz_agent']['requests'] == 1
+    assert tokens['esmfold_agent']['prompt_tokens'] > 0
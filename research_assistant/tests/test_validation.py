@@ -0,0 +1,24 @@
+from research_assistant.tools.validation import validate_sequences, clean_sequence
+
+
+def test_validate_sequences():
+    result = validate_sequences(["mkwv tfis\n", "MKW1V", "", "MKWV*", "MKé", "MK\x00W"])
+    assert result["valid"].tolist() == [True, False, False, True, False, False]
+    assert result["first_bad"].tolist() == [-1, 3, -1, -1, 2, 2]
+    assert result["length"].tolist() == [8, 5, 0, 5, 3, 4]
+    assert len(validate_sequences([])) == 0
+
+
+def test_clean_sequence():
+    assert clean_sequence(" mk\nwv ") == "MKWV"
+
+
+def test_matches_per_character_check():
+    import random
+    rng = random.Random(0)
+    sequences = ["".join(rng.choice("ACDEFGHIKLMNPQRSTVWYacdef \n1?") for _ in range(rng.randrange(0, 40))) for _ in range(500)]
+    result = validate_sequences(sequences)
+    for seq, (valid, first_bad, length) in zip(sequences, result.tolist()):
+        clean = clean_sequence(seq)
+        bad = [i for i, c in enumerate(clean) if c not in "ARNDCEQGHILKMFPSTWYVBZX*"]
+        assert (valid, first_bad, length) == (bool(clean) and not bad, bad[0] if bad else -1, len(clean))
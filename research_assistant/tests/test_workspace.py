@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from research_assistant.tools.esmfold_tool import ESMFoldTool
+from research_assistant.tools.boltz_tool import BoltzTool
+from research_assistant.tools.report import parse_fold_output
+from research_assistant.tools.workspace import Workspace, new_job_id, atomic_write_text
+from research_assistant.tools.results_store import ResultsStore
+from research_assistant.tools.stubs import start_stub_esmfold_server
+from research_assistant.tools.stub_structures import stub_pdb
+
+FAKE_BOLTZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fake_boltz.py")
+
+
+def test_job_ids_are_unique():
+    with ThreadPoolExecutor(32) as pool:
+        ids = list(pool.map(lambda _: new_job_id(), range(2000)))
+    assert len(set(ids)) == len(ids)
+
+
+def test_atomic_write_text(tmp_path):
+    path = str(tmp_path / "a" / "b.txt")
+    atomic_write_text(path, "one")
+    atomic_write_text(path, "two")
+    assert open(path).read() == "two"
+    assert os.listdir(tmp_path / "a") == ["b.txt"]
+
+
+def test_concurrent_jobs_keep_their_outputs(tmp_path, monkeypatch):
+    """Stress test: many jobs fold a structure with the same name at the same time"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ESMFOLD_CACHE_DIR", "")
+    monkeypatch.setenv("RESULTS_DB", str(tmp_path / "results.db"))
+    monkeypatch.setenv("MSA_CACHE_DIR", "")
+    monkeypatch.setenv("BOLTZ_EXECUTABLE", FAKE_BOLTZ)
+    monkeypatch.setenv("FAKE_BOLTZ_LOAD_SECONDS", "0")
+    monkeypatch.setenv("FAKE_BOLTZ_PREDICT_SECONDS", "0.05")
+    server, url = start_stub_esmfold_server(delay=0.05)
+    monkeypatch.setenv("ESMFOLD_URL", url)
+
+    def _job(i):
+        workspace = Workspace()
+        sequence = "MKV" + "A" * i
+        esmfold = ESMFoldTool(workspace=workspace)._run(["ESMFold", "Boltz"], "protein", sequence)
+        boltz = BoltzTool(workspace=workspace)._run(["ESMFold", "Boltz"], "protein", [sequence])
+        return sequence, parse_fold_output(esmfold), parse_fold_output(boltz)
+
+    try:
+        with ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(_job, range(32)))
+    finally:
+        server.shutdown()
+
+    pdb_paths, boltz_dirs = set(), set()
+    for sequence, esmfold, boltz in results:
+        assert esmfold.success and boltz.success
+        # every job still has its own outputs once all jobs are done
+        assert open(esmfold.output_file_path).read() == stub_pdb([sequence])
+        assert os.listdir(boltz.output_file_path)
+        assert boltz.mean_plddt is not None and boltz.chain_plddt.startswith("A=")
+        pdb_paths.add(esmfold.output_file_path)
+        boltz_dirs.add(boltz.output_file_path)
+    assert len(pdb_paths) == len(boltz_dirs) == 32
+    store = ResultsStore(str(tmp_path / "results.db"))
+    assert store.count("ESMFold") == store.count("Boltz") == 32
+    assert store.lookup("MKV" + "A" * 5, model="Boltz")['mean_plddt'] is not None